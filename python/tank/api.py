@@ -13,7 +13,8 @@ Classes for the main Sgtk API.
 
 """
 import os
-import glob
+import heapq
+import itertools
 
 from tank_vendor import yaml
 
@@ -22,7 +23,10 @@ from . import context
 from .util import shotgun
 from .errors import TankError
 from .path_cache import PathCache
-from .template import read_templates
+from .template import read_templates, LazyTemplates
+from .template_index import TemplateIndex
+from .template_search import TemplateSearch, find_sequences
+from .templatekey import SequenceKey
 from .platform import constants as platform_constants
 from . import pipelineconfig
 
@@ -41,6 +45,11 @@ class Tank(object):
         # this is a path and try to construct a pc from the path
 
         self.__sg = None
+        self.__template_index = None
+        # templates the index was built from, copied unless they are lazy
+        self.__indexed_templates = None
+        # version of the lazy templates the index was built from
+        self.__indexed_version = None
 
         if isinstance(project_path, pipelineconfig.PipelineConfiguration):
             # this is actually a pc object
@@ -80,10 +89,29 @@ class Tank(object):
         template definitions will be preserved.
         """
         try:
-            self.templates = read_templates(self.__pipeline_config)
+            templates = read_templates(self.__pipeline_config)
         except TankError, e:
             raise TankError("Templates could not be reloaded: %s" % e)
 
+        # the previous templates may still be held on to, their cached
+        # results are discarded so they don't outlive the reload
+        if hasattr(self.templates, "clear_fields_caches"):
+            self.templates.clear_fields_caches()
+        self.templates = templates
+
+    def get_memory_footprint(self):
+        """
+        Internal Use Only - Returns an estimate of the memory used by the keys and
+        templates of this instance, see LazyTemplates.get_footprint. Templates
+        which are not created yet are not included.
+
+        :returns: Dictionary of sizes and counts, or None if the templates
+                  have been replaced by another kind of dictionary.
+        """
+        if not hasattr(self.templates, "get_footprint"):
+            return None
+        return self.templates.get_footprint()
+
     ################################################################################################
     # properties
 
@@ -203,10 +231,57 @@ class Tank(object):
         :returns: Template matching this path
         :rtype: Template instance or None
         """
-        matched = []
-        for key, template in self.templates.items():
-            if template.validate(path):
-                matched.append(template)
+        candidates = self.__get_template_index().get_candidates(path)
+        return self.__match_template(path, candidates)
+
+    def templates_from_paths(self, paths):
+        """Finds the templates matching each of a list of paths.
+
+        This gives the same results as calling template_from_path for each path,
+        but paths in the same directory share the look up of their directory.
+
+        :param paths: paths against which to match templates.
+        :type  paths: list of string representations of paths
+
+        :returns: Templates matching the paths, keyed by path
+        :rtype: Dictionary of form {path: Template instance or None}
+        """
+        all_candidates = self.__get_template_index().get_candidates_for_paths(paths)
+        return dict((path, self.__match_template(path, candidates))
+                    for path, candidates in all_candidates.items())
+
+    def __get_template_index(self):
+        """
+        Returns the index of the current templates, rebuilding it if the
+        templates have changed since it was built.
+        """
+        templates = self.templates
+        if isinstance(templates, LazyTemplates):
+            # comparing the templates would create them all, setting or
+            # deleting templates changes the version instead
+            up_to_date = (self.__indexed_templates is templates and
+                          self.__indexed_version == templates.version)
+        else:
+            up_to_date = (isinstance(self.__indexed_templates, dict) and
+                          self.__indexed_templates == templates)
+
+        if self.__template_index is None or not up_to_date:
+            if isinstance(templates, LazyTemplates):
+                self.__indexed_templates = templates
+                self.__indexed_version = templates.version
+            else:
+                self.__indexed_templates = dict(templates)
+            self.__template_index = TemplateIndex(templates)
+        return self.__template_index
+
+    def __match_template(self, path, candidates):
+        """
+        Validates a path against candidate templates.
+
+        :returns: The only template matching the path or None.
+        :raises: TankError if more than one template matches the path.
+        """
+        matched = [template for template in candidates if template.validate(path)]
 
         if len(matched) == 0:
             return None
@@ -250,9 +325,138 @@ class Tank(object):
         :returns: Matching file paths
         :rtype: List of strings.
         """
+        return list(self.iter_paths_from_template(template, fields, skip_keys, skip_missing_optional_keys))
+
+    def iter_paths_from_template(self, template, fields, skip_keys=None,
+                                 skip_missing_optional_keys=False, sort_by=None):
+        """
+        Finds paths that match a template using field values passed, like
+        paths_from_template does, but yields each path as soon as it is found.
+        The search stops when the iteration stops, for example to get the first
+        50 paths found:
+
+            >>> paths = itertools.islice(tk.iter_paths_from_template(template, fields), 50)
+
+        Each path is only yielded once. If sort_by is specified, paths are yielded
+        sorted by the values of these keys, and then by path. The directories searched
+        are walked in order of the values found in their path, so when the first sort
+        keys are in directories above the others, for example when sorting by shot and
+        then by version, the first paths are yielded without having to find all of them.
+
+        :param template: Template against whom to match.
+        :type  template: Tank.Template instance.
+        :param fields: Fields and values to use.
+        :type  fields: Dictionary.
+        :param skip_keys: Keys whose values should be ignored from the fields parameter.
+        :type  skip_keys: List of key names.
+        :param skip_missing_optional_keys: Specify if optional keys should be skipped if they 
+                                        aren't found in the fields collection
+        :type skip_missing_optional_keys: Boolean
+        :param sort_by: Optional keys by whose values paths should be sorted.
+        :type sort_by: List of key names.
+
+        :returns: Iterator over the matching file paths
+        """
+        if isinstance(sort_by, basestring):
+            sort_by = [sort_by]
+
+        found_files = self.__iter_found_files(template, fields, skip_keys,
+                                              skip_missing_optional_keys, sort_by)
+        for found_file in found_files:
+            if template.validate(found_file):
+                yield found_file
+
+    def sequences_from_template(self, template, fields, sequence_key=None):
+        """
+        Finds the frame sequences on disk matching a template using field values
+        passed, grouping the frame files of each sequence together.
+
+        This gives the same abstract paths as abstract_paths_from_template does for
+        the sequence key, along with the frames found for each path, but without
+        reading the fields of every frame file: the frames of a sequence are told
+        apart from the rest of their paths using the compiled template. Other abstract
+        keys, such as eyes, are not collapsed and give different sequences.
+
+        The abstract path of a sequence uses the value of the sequence key in the
+        fields if there is one, for example "%04d" or "FORMAT: $F", and otherwise
+        the default value of the key, which uses its padding.
+
+        :param template: Template with which to search.
+        :param fields: Mapping of keys to values to search for.
+        :param sequence_key: Name of the sequence key. Optional if the template
+                             has a single SequenceKey.
+
+        :returns: List of FrameSequence objects, with the abstract path, the fields,
+                  the frame range and the missing frames of each sequence.
+        """
+        if sequence_key is None:
+            sequence_keys = [x.name for x in template.keys.values() if isinstance(x, SequenceKey)]
+            if len(sequence_keys) != 1:
+                raise TankError("Template %s must have a single sequence key to search for "
+                                "sequences, found %d." % (template, len(sequence_keys)))
+            sequence_key = sequence_keys[0]
+
+        search_fields = fields.copy()
+        frame_value = search_fields.pop(sequence_key, None)
+        found_files = self.__iter_found_files(template, search_fields, [sequence_key], False)
+        return find_sequences(template, found_files, sequence_key, frame_value)
+
+    def __iter_found_files(self, template, fields, skip_keys, skip_missing_optional_keys, sort_by=None):
+        """
+        Searches for the files which may match a template, see iter_paths_from_template.
+        The files found are not validated against the template.
+
+        :returns: Iterator over the files found.
+        """
+        # directories listed for one set of keys are not listed again for the others
+        search = TemplateSearch(template)
+        globs = self.__globs_from_template(template, fields, skip_keys, skip_missing_optional_keys)
+
+        if sort_by is None:
+            found_files = itertools.chain(*[self.__iglob(search, globs, index)
+                                            for index in range(len(globs))])
+        else:
+            found_files = _merge(*[self.__iglob(search, globs, index, sort_by)
+                                   for index in range(len(globs))])
+
+        for found_file in found_files:
+            if sort_by is not None:
+                found_file = found_file[1]
+            yield found_file
+
+    def __iglob(self, search, globs, index, sort_by=None):
+        """
+        Searches for the paths matching a glob string, skipping the paths which
+        the previous glob strings match so that paths are only found once.
+
+        :returns: Iterator over paths, or over (sort key, path) tuples if sort_by
+                  is specified.
+        """
+        if sort_by is None:
+            found_files = ((None, x) for x in search.iglob(globs[index]))
+        else:
+            found_files = search.iglob_sorted(globs[index], sort_by)
+
+        for sort_key, found_file in found_files:
+            if [x for x in globs[:index] if search.matches(x, found_file)]:
+                continue
+            if sort_by is None:
+                yield found_file
+            else:
+                yield sort_key, found_file
+
+    def __globs_from_template(self, template, fields, skip_keys, skip_missing_optional_keys):
+        """
+        Builds the glob strings used to search for the paths matching a template.
+
+        :returns: List of distinct glob strings, one per set of keys of the
+                  template which can be searched for.
+        """
         skip_keys = skip_keys or []
         if isinstance(skip_keys, basestring):
             skip_keys = [skip_keys]
+        else:
+            skip_keys = list(skip_keys)
         
         # construct local fields dictionary that doesn't include any skip keys:
         local_fields = dict((field, value) for field, value in fields.iteritems() if field not in skip_keys)
@@ -265,9 +469,9 @@ class Tank(object):
             local_fields[key] = "*"
             
         # iterate for each set of keys in the template:
-        found_files = set()
-        globs_searched = set()
-        for keys in template._keys:
+        globs = []
+        for variation in template._get_variations():
+            keys = variation.keys
             # create fields and skip keys with those that 
             # are relevant for this key set:
             current_local_fields = local_fields.copy()
@@ -292,16 +496,13 @@ class Tank(object):
             
             # Apply the fields to build the glob string to search with:
             glob_str = template._apply_fields(current_local_fields, ignore_types=current_skip_keys)
-            if glob_str in globs_searched:
+            if glob_str in globs:
                 # it's possible that multiple key sets return the same search
                 # string depending on the fields and skip-keys passed in
                 continue
-            globs_searched.add(glob_str)
-            
-            # Find all files which are valid for this key set
-            found_files.update([found_file for found_file in glob.iglob(glob_str) if template.validate(found_file)])
-                    
-        return list(found_files) 
+            globs.append(glob_str)
+
+        return globs
 
 
     def abstract_paths_from_template(self, template, fields):
@@ -324,6 +525,20 @@ class Tank(object):
         :returns: A list of paths whose abstract keys use their abstract(default) value unless
                   a value is specified for them in the fields parameter.
         """
+        return list(self.iter_abstract_paths_from_template(template, fields))
+
+    def iter_abstract_paths_from_template(self, template, fields):
+        """
+        Returns abstract paths based on a template, like abstract_paths_from_template
+        does, but yields each abstract path as soon as a file it represents is found.
+        The search stops when the iteration stops.
+
+        :param template: Template with which to search.
+        :param fields: Mapping of keys to values with which to assemble the abstract path.
+
+        :returns: Iterator over the paths whose abstract keys use their abstract(default)
+                  value unless a value is specified for them in the fields parameter.
+        """
         search_template = template
 
         # the logic is as follows:
@@ -353,7 +568,7 @@ class Tank(object):
             search_template = template.parent
 
         # now carry out a regular search based on the template
-        found_files = self.paths_from_template(search_template, fields)
+        found_files = self.iter_paths_from_template(search_template, fields)
 
         st_abstract_key_names = [k.name for k in search_template.keys.values() if k.is_abstract]
 
@@ -386,9 +601,9 @@ class Tank(object):
 
             # now we have all the fields we need to compose the full template
             abstract_path = template.apply_fields(cur_fields)
-            abstract_paths.add(abstract_path)
-
-        return list(abstract_paths)
+            if abstract_path not in abstract_paths:
+                abstract_paths.add(abstract_path)
+                yield abstract_path
 
 
     def paths_from_entity(self, entity_type, entity_id):
@@ -425,6 +640,35 @@ class Tank(object):
 
         return entity
 
+    def paths_from_entities(self, entities):
+        """
+        Finds paths associated with several entities.
+
+        :param entities: List of (entity type, entity id) tuples
+
+        :returns: Dictionary of matching file paths, keyed by (entity type, entity id)
+        """
+        path_cache = PathCache(self.pipeline_configuration)
+        try:
+            return path_cache.get_paths_bulk(entities)
+        finally:
+            path_cache.close()
+
+    def entities_from_paths(self, paths):
+        """
+        Returns the shotgun entities associated with several paths
+
+        :param paths: List of paths to folders or files
+
+        :returns: Dictionary keyed by path of Shotgun dictionaries containing 
+                  name, type and id or None if no entity was associated.
+        """
+        path_cache = PathCache(self.pipeline_configuration)
+        try:
+            return path_cache.get_entities(paths)
+        finally:
+            path_cache.close()
+
     def context_empty(self):
         """
         Creates an empty context.
@@ -460,6 +704,31 @@ class Tank(object):
         """
         return context.from_entity(self, entity_type, entity_id)
 
+    def contexts_from_paths(self, paths, previous_context=None):
+        """
+        Derives contexts from several paths, looking up the path cache once for all of them.
+
+        :param paths: List of file system paths
+        :param previous_context: a context object to use to try to automatically extend the
+                                 generated contexts, see context_from_path.
+        :returns: Dictionary of Context objects keyed by path.
+        """
+        return context.from_paths(self, paths, previous_context)
+
+    def contexts_from_entities(self, entity_type, entity_ids):
+        """
+        Derives contexts from several Shotgun entities of the same type, with a few
+        Shotgun queries and path cache lookups for all of them.
+
+        :param entity_type: The name of the entity type.
+        :type  entity_type: String.
+        :param entity_ids: Shotgun ids of the entities upon which to base the contexts.
+        :type  entity_ids: List of integers.
+
+        :returns: Dictionary of Context objects keyed by entity id.
+        """
+        return context.from_entities(self, entity_type, entity_ids)
+
     def create_filesystem_structure(self, entity_type, entity_id, engine=None):
         """
         Create folders and associated data on disk to reflect branches in the project tree
@@ -536,6 +805,29 @@ def tank_from_entity(entity_type, entity_id):
     pc = pipelineconfig.from_entity(entity_type, entity_id)
     return Tank(pc)
 
+def _merge(*iterables):
+    """
+    Merges sorted iterables into a single sorted iterator, like heapq.merge
+    which is not available in python 2.5.
+    """
+    # the index of the iterable breaks ties so that iterators are never compared
+    heap = []
+    for index, iterable in enumerate(iterables):
+        iterator = iter(iterable)
+        for item in iterator:
+            heap.append((item, index, iterator))
+            break
+    heapq.heapify(heap)
+
+    while heap:
+        item, index, iterator = heap[0]
+        yield item
+        for item in iterator:
+            heapq.heapreplace(heap, (item, index, iterator))
+            break
+        else:
+            heapq.heappop(heap)
+
 ##########################################################################################
 # sgtk API aliases
 
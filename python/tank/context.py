@@ -16,14 +16,19 @@ Management of the current context, e.g. the current shotgun entity/step/task.
 import os
 import pickle
 import copy
+import threading
+import time
+import weakref
 
 from tank_vendor import yaml
 
 from .util import login
 from .util import shotgun_entity
 from .util import shotgun
+from .util.lru_cache import LRUCache
 from .errors import TankError
-from .path_cache import PathCache
+from .path_cache import PathCache, get_cache_generation
+from .platform import constants
 from .template import TemplatePath
 
 
@@ -428,9 +433,11 @@ class Context(object):
     def _fields_from_shotgun(self, template, entities):
         """
         Query Shotgun server for keys used by this template whose values come directly
-        from Shotgun fields.
+        from Shotgun fields. The fields of each entity are fetched with a single query.
         """
         fields = {}
+        # keys whose values need fetching, grouped by entity type
+        keys_to_fetch = {}
         # for any sg query field
         for key in template.keys.values():
             
@@ -451,56 +458,87 @@ class Context(object):
                 if cache_key in self._entity_fields_cache:
                     # already have the value cached - no need to fetch from shotgun
                     fields[key.name] = self._entity_fields_cache[cache_key]
+                else:
+                    keys_to_fetch.setdefault(key.shotgun_entity_type, []).append(key)
+
+        for entity_type, keys in keys_to_fetch.items():
+            entity = entities[entity_type]
+
+            # get the values of all the fields of the entity at once
+            values = self._get_shotgun_values(entity_type, entity["id"], 
+                                              set(x.shotgun_field_name for x in keys))
+            if values is None:
+                # no record with that id in shotgun!
+                raise TankError("Could not retrieve Shotgun data for key '%s' in "
+                                "template '%s'. No records in Shotgun are matching "
+                                "entity '%s' (Which is part of the current "
+                                "context '%s')" % (", ".join(str(x) for x in keys), template, entity, self))
+
+            for key in keys:
+                value = values.get(key.shotgun_field_name)
+
+                # note! It is perfectly possible (and may be valid) to return None values from 
+                # shotgun at this point. In these cases, a None field will be returned in the 
+                # fields dictionary from as_template_fields, and this may be injected into
+                # a template with optional fields.
+
+                if value is None:
+                    processed_val = None
                 
                 else:
-                    # get the value from shotgun
-                    filters = [["id", "is", entity["id"]]]
-                    query_fields = [key.shotgun_field_name]
-                    result = self.__tk.shotgun.find_one(key.shotgun_entity_type, filters, query_fields)
-                    if not result:
-                        # no record with that id in shotgun!
-                        raise TankError("Could not retrieve Shotgun data for key '%s' in "
-                                        "template '%s'. No records in Shotgun are matching "
-                                        "entity '%s' (Which is part of the current "
-                                        "context '%s')" % (key, template, entity, self))                        
-
-                    value = result.get(key.shotgun_field_name)
-
-                    # note! It is perfectly possible (and may be valid) to return None values from 
-                    # shotgun at this point. In these cases, a None field will be returned in the 
-                    # fields dictionary from as_template_fields, and this may be injected into
-                    # a template with optional fields.
-    
-                    if value is None:
-                        processed_val = None
-                    
-                    else:
-
-                        # now convert the shotgun value to a string.
-                        # note! This means that there is no way currently to create an int key
-                        # in a tank template which matches an int field in shotgun, since we are
-                        # force converting everything into strings...
-                                 
-                        processed_val = shotgun_entity.sg_entity_to_string(self.__tk,
-                                                                           key.shotgun_entity_type,
-                                                                           entity.get("id"),
-                                                                           key.shotgun_field_name, 
-                                                                           value)
-                    
-                        if not key.validate(processed_val):                    
-                            raise TankError("Template validation failed for value '%s'. This "
-                                            "value was retrieved from entity %s in Shotgun to "
-                                            "represent key '%s' in "
-                                            "template '%s'." % (processed_val, entity, key, template))
-                            
-                    # all good!
-                    # populate dictionary and cache
-                    fields[key.name] = processed_val
-                    self._entity_fields_cache[cache_key] = processed_val
 
+                    # now convert the shotgun value to a string.
+                    # note! This means that there is no way currently to create an int key
+                    # in a tank template which matches an int field in shotgun, since we are
+                    # force converting everything into strings...
+                             
+                    processed_val = shotgun_entity.sg_entity_to_string(self.__tk,
+                                                                       key.shotgun_entity_type,
+                                                                       entity.get("id"),
+                                                                       key.shotgun_field_name, 
+                                                                       value)
+                
+                    if not key.validate(processed_val):                    
+                        raise TankError("Template validation failed for value '%s'. This "
+                                        "value was retrieved from entity %s in Shotgun to "
+                                        "represent key '%s' in "
+                                        "template '%s'." % (processed_val, entity, key, template))
+                        
+                # all good!
+                # populate dictionary and cache
+                fields[key.name] = processed_val
+                cache_key = (entity["type"], entity["id"], key.shotgun_field_name)
+                self._entity_fields_cache[cache_key] = processed_val
 
         return fields
 
+    def _get_shotgun_values(self, entity_type, entity_id, field_names):
+        """
+        Returns the values of fields of a Shotgun entity, from the Shotgun fields cache
+        of the tk instance when they were fetched recently.
+
+        :param field_names: set of field names
+        :returns: dictionary of values keyed by field name, None if there is no 
+                  such entity in Shotgun
+        """
+        sg_fields_cache = _get_shotgun_fields_cache(self.__tk)
+        values = {}
+        if sg_fields_cache:
+            values = sg_fields_cache.get_values(entity_type, entity_id, field_names)
+            if len(values) == len(field_names):
+                return values
+
+        query_fields = list(field_names.difference(values))
+        result = self.__tk.shotgun.find_one(entity_type, [["id", "is", entity_id]], query_fields)
+        if not result:
+            return None
+
+        fetched = dict((x, result.get(x)) for x in query_fields)
+        if sg_fields_cache:
+            sg_fields_cache.set_values(entity_type, entity_id, fetched)
+        values.update(fetched)
+        return values
+
 
     def _fields_from_entity_paths(self, template):
         """
@@ -670,6 +708,99 @@ def from_entity(tk, entity_type, entity_id):
 
     return Context(**context)
 
+def from_entities(tk, entity_type, entity_ids):
+    """
+    Constructs contexts from several shotgun entities of the same type, see from_entity.
+    Tasks and published files are fetched with a single Shotgun query and the path 
+    cache is looked up once for all the other entities.
+
+    :param tk:           Sgtk API handle
+    :param entity_type:  The shotgun entity type to produce contexts for.
+    :param entity_ids:   The shotgun entity ids to produce contexts for.
+
+    :returns: dictionary of context objects keyed by entity id
+    """
+    if entity_type is None:
+        raise TankError("Cannot create a context from an entity type 'None'!")
+
+    entity_ids = list(set(entity_ids))
+    if None in entity_ids:
+        raise TankError("Cannot create a context from an entity id set to 'None'!")
+
+    if not entity_ids:
+        return {}
+
+    if entity_type in ["PublishedFile", "TankPublishedFile"]:
+        filters = ["id", "in"]
+        filters.extend(entity_ids) # weird filter format here
+        sg_entities = tk.shotgun.find(entity_type, [filters], ["project", "entity", "task"])
+        sg_entities = dict((x["id"], x) for x in sg_entities)
+
+        # base the contexts on the task, entity or project the published files are 
+        # linked with, grouped by type
+        links = {}
+        for entity_id in entity_ids:
+            sg_entity = sg_entities.get(entity_id)
+            if sg_entity is None:
+                raise TankError("Entity %s with id %s not found in Shotgun!" % (entity_type, entity_id))
+            link = sg_entity.get("task") or sg_entity.get("entity") or sg_entity.get("project")
+            if link:
+                links[entity_id] = (link["type"], link["id"])
+
+        link_ids = {}
+        for link_type, link_id in links.values():
+            link_ids.setdefault(link_type, []).append(link_id)
+        link_contexts = {}
+        for link_type, ids in link_ids.items():
+            for link_id, ctx in from_entities(tk, link_type, ids).items():
+                link_contexts[(link_type, link_id)] = ctx
+
+        # published files linked with the same entity get contexts of their own,
+        # which callers can modify independently
+        contexts = {}
+        for entity_id in entity_ids:
+            if entity_id in links:
+                contexts[entity_id] = copy.deepcopy(link_contexts[links[entity_id]])
+            else:
+                contexts[entity_id] = Context(tk)
+        return contexts
+
+    if entity_type == "Task":
+        # For tasks get data from shotgun query
+        entities_context = _tasks_from_sg(tk, entity_ids)
+
+    else:
+        # Get data from path cache
+        entities_context = _contexts_data_from_cache(tk, entity_type, entity_ids)
+
+        # fall back on a shotgun lookup for the entities not found in the cache
+        missing_ids = [x for x in entity_ids if entities_context[x]["project"] is None]
+        if missing_ids:
+            entities_context.update(_entities_from_sg(tk, entity_type, missing_ids))
+
+    contexts = {}
+    for entity_id in entity_ids:
+        # prep our return data structure
+        context = {
+            "tk": tk,
+            "project": None,
+            "entity": None,
+            "step": None,
+            "user": None,
+            "task": None,
+            "additional_entities": []
+        }
+        context.update(entities_context[entity_id])
+
+        if entity_type == "Project":
+            # no need to set entity to point at project in this case
+            # that only produces double entries.
+            context["entity"] = None
+
+        contexts[entity_id] = Context(**context)
+
+    return contexts
+
 def from_path(tk, path, previous_context=None):
     """
     Constructs a context from a path to a folder or a file.
@@ -687,7 +818,59 @@ def from_path(tk, path, previous_context=None):
                              path passed in via the path argument.
     :returns: a context object
     """
+    # get the entities of the path and of its parents, from the cache of the tk instance
+    # when the folder of the path has been looked up before
+    path_context_cache = _get_path_context_cache(tk)
+    path_entities = _entities_from_path(tk, path, path_context_cache)
+    additional_types = _get_additional_types(tk, path_context_cache)
+    return _context_from_path_entities(tk, path_entities, additional_types, previous_context)
+
+def from_paths(tk, paths, previous_context=None):
+    """
+    Constructs contexts from several paths to folders or files, see from_path.
+    The path cache is looked up once for all the paths.
+
+    :param tk:    Sgtk API handle
+    :param paths: list of file system paths
+    :param previous_context: a context object to use to try to automatically extend the
+                             generated contexts, see from_path.
+    :returns: dictionary of context objects keyed by path
+    """
+    path_context_cache = _get_path_context_cache(tk)
+    paths_entities = _entities_from_paths(tk, paths, path_context_cache)
+    additional_types = _get_additional_types(tk, path_context_cache)
+    contexts = {}
+    for path in paths:
+        contexts[path] = _context_from_path_entities(tk, paths_entities[path], additional_types, previous_context)
+    return contexts
+
+def _get_additional_types(tk, path_context_cache):
+    """
+    Returns the entity types in paths which go in the additional entities of contexts.
+
+    :param path_context_cache: _PathContextCache the result of the hook is cached in, or None
+    """
+    # ask hook for extra entity types we should recognize and insert into the additional_entities list.
+    additional_types = None
+    if path_context_cache:
+        additional_types = path_context_cache.additional_types
+    if additional_types is None:
+        additional_types = tk.execute_hook("context_additional_entities").get("entity_types_in_path", [])
+        if path_context_cache:
+            path_context_cache.additional_types = additional_types
+    return additional_types
+
+def _context_from_path_entities(tk, path_entities, additional_types, previous_context):
+    """
+    Constructs a context from the entities of a path and of its parent folders.
 
+    :param path_entities: list of tuples (primary entity or None, list of secondary entities),
+                          path first, see _entities_from_path
+    :param additional_types: entity types which go in the additional entities
+    :param previous_context: a context object to use to try to automatically extend the 
+                             generated context, see from_path.
+    :returns: a context object
+    """
     # prep our return data structure
     context = {
         "tk": tk,
@@ -699,44 +882,17 @@ def from_path(tk, path, previous_context=None):
         "additional_entities": []
     }
 
-    # ask hook for extra entity types we should recognize and insert into the additional_entities list.
-    additional_types = tk.execute_hook("context_additional_entities").get("entity_types_in_path", [])
-
-    # get a cache handle
-    path_cache = PathCache(tk.pipeline_configuration)
-
-    # gather all roots as lower case
-    project_roots = [x.lower() for x in tk.pipeline_configuration.get_data_roots().values()]
-
     # first gather entities
     entities = []
     secondary_entities = []
-    curr_path = path
-    while True:
-        curr_entity = path_cache.get_entity(curr_path)
+    for curr_entity, curr_secondary_entities in path_entities:
         if curr_entity:
             # Don't worry about entity types we've already got in the context. In the future
             # we should look for entity ids that conflict in order to flag a degenerate schema.
             entities.append(curr_entity)
         
         # add secondary entities
-        secondary_entities.extend( path_cache.get_secondary_entities(curr_path) )
-
-        if curr_path.lower() in project_roots:
-            #TODO this could fail with windows path variations
-            # we have reached a root!
-            break
-
-        # and continue with parent path
-        parent_path = os.path.abspath(os.path.join(curr_path, ".."))
-
-        if curr_path == parent_path:
-            # We're at the disk root, probably a degenerate path
-            break
-        else:
-            curr_path = parent_path
-
-    path_cache.close()
+        secondary_entities.extend(curr_secondary_entities)
 
     # now populate the context
     # go from the root down, so that in the case there are a path with
@@ -910,6 +1066,276 @@ yaml.add_constructor(u'!TankContext', context_yaml_constructor)
 ################################################################################################
 # utility methods
 
+class _PathContextCache(object):
+    """
+    Entities looked up by from_path for a tk instance, so that the files of a folder
+    are resolved without a path cache lookup each. For each folder looked up, it keeps
+    the deepest folder at or above it with entities, its anchor, and the folders below
+    it with entities at some level. The entities of an anchor and of the folders above
+    it are kept once for all the folders sharing it. Everything is discarded after the
+    path cache lookup time to live or when this process writes to the path cache.
+    
+    Only the paths directly in a folder looked up are resolved from the cache, the
+    folders below it may have been created since and are always looked up.
+    """
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        # (anchor path or None, child entities) keyed by folder path
+        self.folders = LRUCache(size)
+        # list of (entity, secondary entities) for the anchor and the folders above it
+        self.anchors = LRUCache(size)
+        # result of the context_additional_entities hook
+        self.additional_types = None
+        self.lock = threading.Lock()
+        self._generation = None
+        self._expiry = 0
+
+    def validate(self):
+        """
+        Discards the cached data if it may be out of date. Must be called with
+        the lock held.
+        """
+        generation = get_cache_generation()
+        now = time.time()
+        if generation != self._generation or now >= self._expiry:
+            self.folders.clear()
+            self.anchors.clear()
+            self.additional_types = None
+            self._generation = generation
+            self._expiry = now + self.ttl
+
+    def get_entities(self, path):
+        """
+        Returns the entities of a path and of the folders above it, or None if the
+        cached data isn't enough to tell. Must be called with the lock held.
+        """
+        # names of the folders from the closest cached folder down to the path
+        names = []
+        folder = path
+        while True:
+            parent_folder = os.path.dirname(folder)
+            if parent_folder == folder:
+                return None
+            names.insert(0, os.path.basename(folder))
+            folder = parent_folder
+            entry = self.folders.get(folder)
+            if entry is not None:
+                break
+
+        (anchor, children) = entry
+        anchor_entities = []
+        if anchor is not None:
+            anchor_entities = self.anchors.get(anchor)
+            if anchor_entities is None:
+                return None
+
+        if len(names) > 1:
+            # the path is below a folder which may not have been created at the time
+            return None
+        child = children.get(names[0])
+        if child is not None and (child[0] or child[1]):
+            return [child] + anchor_entities
+        return anchor_entities
+
+    def add_folder(self, folder, ancestors, children, generation):
+        """
+        Caches the entities of a folder and of the folders above it, unless the path
+        cache was written to since they were looked up. Must be called with the lock held.
+
+        :param ancestors: result of PathCache.get_entities_for_ancestors for the folder
+        :param children: result of PathCache.get_child_entities for the folder
+        :param generation: cache generation when the entities were looked up
+        """
+        if generation != self._generation or generation != get_cache_generation():
+            return
+        if not children and not [x for x in ancestors if x[1] or x[2]]:
+            # nothing was found for the folder, it may be about to be created
+            return
+        anchor = None
+        for index, (curr_path, entity, secondary_entities) in enumerate(ancestors):
+            if entity or secondary_entities:
+                anchor = curr_path
+                self.anchors.set(anchor, [(x[1], x[2]) for x in ancestors[index:] if x[1] or x[2]])
+                break
+        self.folders.set(folder, (anchor, children))
+
+
+class _ShotgunFieldsCache(object):
+    """
+    Values of Shotgun fields fetched by as_template_fields for a tk instance, shared
+    by all its contexts. Each value is discarded after the time to live.
+    """
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        # dictionaries of (expiry time, value) keyed by field name, keyed by (entity type, id)
+        self._entities = LRUCache(size)
+        self._lock = threading.Lock()
+
+    def get_values(self, entity_type, entity_id, field_names):
+        """
+        Returns the cached values of fields of an entity.
+
+        :returns: dictionary of values keyed by field name, for the fields which
+                  have a value cached
+        """
+        values = {}
+        now = time.time()
+        self._lock.acquire()
+        try:
+            entity_values = self._entities.get((entity_type, entity_id))
+            if entity_values:
+                for field_name in field_names:
+                    if field_name in entity_values:
+                        (expiry, value) = entity_values[field_name]
+                        if now < expiry:
+                            values[field_name] = copy.deepcopy(value)
+        finally:
+            self._lock.release()
+        return values
+
+    def set_values(self, entity_type, entity_id, values):
+        """
+        Caches values of fields of an entity.
+
+        :param values: dictionary of values keyed by field name
+        """
+        expiry = time.time() + self.ttl
+        self._lock.acquire()
+        try:
+            entity_values = self._entities.get((entity_type, entity_id))
+            if entity_values is None:
+                entity_values = {}
+                self._entities.set((entity_type, entity_id), entity_values)
+            for field_name, value in values.items():
+                entity_values[field_name] = (expiry, copy.deepcopy(value))
+        finally:
+            self._lock.release()
+
+
+# the shotgun fields cache of each tk instance, see _get_shotgun_fields_cache
+_shotgun_fields_caches = weakref.WeakKeyDictionary()
+_shotgun_fields_caches_lock = threading.Lock()
+
+def _get_shotgun_fields_cache(tk):
+    """
+    Returns the cache of Shotgun field values of a tk instance, or None if they
+    should not be cached.
+    """
+    _shotgun_fields_caches_lock.acquire()
+    try:
+        if tk not in _shotgun_fields_caches:
+            ttl = tk.pipeline_configuration.get_shotgun_fields_cache_ttl()
+            _shotgun_fields_caches[tk] = _ShotgunFieldsCache(ttl, constants.SHOTGUN_FIELDS_CACHE_SIZE)
+        sg_fields_cache = _shotgun_fields_caches[tk]
+    finally:
+        _shotgun_fields_caches_lock.release()
+    if sg_fields_cache.ttl <= 0:
+        return None
+    return sg_fields_cache
+
+
+# the context cache of each tk instance, see _get_path_context_cache
+_path_context_caches = weakref.WeakKeyDictionary()
+_path_context_caches_lock = threading.Lock()
+
+def _get_path_context_cache(tk):
+    """
+    Returns the cache of entities looked up by from_path for a tk instance, or
+    None if path cache lookups should not be cached.
+    """
+    _path_context_caches_lock.acquire()
+    try:
+        if tk not in _path_context_caches:
+            ttl = tk.pipeline_configuration.get_path_cache_lookup_ttl()
+            _path_context_caches[tk] = _PathContextCache(ttl, constants.PATH_CACHE_LOOKUP_CACHE_SIZE)
+        path_context_cache = _path_context_caches[tk]
+    finally:
+        _path_context_caches_lock.release()
+    if path_context_cache.ttl <= 0:
+        return None
+    return path_context_cache
+
+def _entities_from_path(tk, path, path_context_cache):
+    """
+    Returns the entities of a path and of the folders above it up to the project root.
+
+    :param path_context_cache: _PathContextCache to use, or None to look up the path cache
+    :returns: list of tuples (primary entity or None, list of secondary entities) for 
+              the path and the folders above it which have entities, path first
+    """
+    path = os.path.abspath(path)
+    if path_context_cache:
+        path_context_cache.lock.acquire()
+        try:
+            path_context_cache.validate()
+            path_entities = path_context_cache.get_entities(path)
+            generation = get_cache_generation()
+        finally:
+            path_context_cache.lock.release()
+        if path_entities is not None:
+            return [(copy.copy(x), [copy.copy(y) for y in z]) for x, z in path_entities]
+
+    # look up the folder of the path, the files next to it share its entities
+    folder = os.path.dirname(path)
+    path_cache = PathCache(tk.pipeline_configuration)
+    try:
+        children = None
+        if path_context_cache:
+            children = path_cache.get_child_entities(folder)
+        if children is None:
+            # the path is a project root or is not in the project
+            ancestors = path_cache.get_entities_for_ancestors(path)
+            return [(x[1], x[2]) for x in ancestors if x[1] or x[2]]
+        ancestors = path_cache.get_entities_for_ancestors(folder)
+    finally:
+        path_cache.close()
+
+    path_context_cache.lock.acquire()
+    try:
+        path_context_cache.add_folder(folder, ancestors, children, generation)
+    finally:
+        path_context_cache.lock.release()
+
+    path_entities = [(x[1], x[2]) for x in ancestors if x[1] or x[2]]
+    child = children.get(os.path.basename(path))
+    if child and (child[0] or child[1]):
+        path_entities.insert(0, child)
+    return path_entities
+
+
+def _entities_from_paths(tk, paths, path_context_cache):
+    """
+    Returns the entities of several paths and of the folders above them, see 
+    _entities_from_path. The paths which are not in the cache are looked up at once.
+
+    :returns: dictionary of lists of tuples (primary entity or None, list of secondary
+              entities) keyed by path
+    """
+    abs_paths = dict((x, os.path.abspath(x)) for x in paths)
+    results = {}
+    if path_context_cache:
+        path_context_cache.lock.acquire()
+        try:
+            path_context_cache.validate()
+            for path, abs_path in abs_paths.items():
+                path_entities = path_context_cache.get_entities(abs_path)
+                if path_entities is not None:
+                    results[path] = [(copy.copy(x), [copy.copy(y) for y in z]) for x, z in path_entities]
+        finally:
+            path_context_cache.lock.release()
+
+    missing = [x for x in abs_paths if x not in results]
+    if missing:
+        path_cache = PathCache(tk.pipeline_configuration)
+        try:
+            ancestors = path_cache.get_entities_for_ancestors_bulk([abs_paths[x] for x in missing])
+        finally:
+            path_cache.close()
+        for path in missing:
+            results[path] = [(x[1], x[2]) for x in ancestors[abs_paths[path]] if x[1] or x[2]]
+    return results
+
+
 def _task_from_sg(tk, task_id):
     """
     Constructs a context from a shotgun task.
@@ -922,24 +1348,59 @@ def _task_from_sg(tk, task_id):
     :param tk:           a Sgtk API instance
     :param task_id:      The shotgun task id to produce a context for.
     """
-    context = {}
-
     # Look up task's step and entity. This information should be static in practice, so we could
     # likely cache it in the future.
 
-    standard_fields = ["content", "entity", "step", "project"]
-    # theses keys map directly to linked entities, users will be handled separately
-    context_keys = ["project", "entity", "step", "task"]
-
     # ask hook for extra Task entity fields we should query and insert into the additional_entities list.
     additional_fields = tk.execute_hook("context_additional_entities").get("entity_fields_on_task", [])
 
-    task = tk.shotgun.find_one("Task", [["id","is",task_id]], standard_fields + additional_fields)
+    task = tk.shotgun.find_one("Task", [["id","is",task_id]], _TASK_FIELDS + additional_fields)
     if not task:
         raise TankError("Unable to locate Task with id %s in Shotgun" % task_id)
 
+    return _context_data_from_sg_task(task, additional_fields)
+
+
+def _tasks_from_sg(tk, task_ids):
+    """
+    Constructs contexts from several shotgun tasks with a single query, see _task_from_sg.
+
+    :param tk:           a Sgtk API instance
+    :param task_ids:     The shotgun task ids to produce contexts for.
+    :returns: dictionary of context data keyed by task id
+    """
+    additional_fields = tk.execute_hook("context_additional_entities").get("entity_fields_on_task", [])
+
+    filters = ["id", "in"]
+    filters.extend(task_ids) # weird filter format here
+    tasks = dict((x["id"], x) for x in tk.shotgun.find("Task", [filters], _TASK_FIELDS + additional_fields))
+
+    contexts = {}
+    for task_id in task_ids:
+        if task_id not in tasks:
+            raise TankError("Unable to locate Task with id %s in Shotgun" % task_id)
+        contexts[task_id] = _context_data_from_sg_task(tasks[task_id], additional_fields)
+    return contexts
+
+
+# fields of tasks needed in contexts, on top of the ones from the context_additional_entities hook
+_TASK_FIELDS = ["content", "entity", "step", "project"]
+
+def _context_data_from_sg_task(task, additional_fields):
+    """
+    Returns the context data of a task returned by shotgun.
+
+    :param task: shotgun task dictionary with the _TASK_FIELDS and additional fields
+    :param additional_fields: Task fields holding additional entities
+    """
+    context = {}
+
+    # theses keys map directly to linked entities, users will be handled separately
+    context_keys = ["project", "entity", "step", "task"]
+
     # add task so it can be processed with other shotgun entities
-    task["task"] = {"type": "Task", "id": task_id, "name": task["content"]}
+    task = dict(task)
+    task["task"] = {"type": "Task", "id": task["id"], "name": task["content"]}
 
     for key in context_keys + additional_fields:
         data = task.get(key)
@@ -976,20 +1437,57 @@ def _entity_from_sg(tk, entity_type, entity_id):
     :param task_id:      The shotgun task id to produce a context for.
     """
 
+    name_field = _get_name_field(entity_type)
+    data = tk.shotgun.find_one(entity_type, [["id", "is", entity_id]], ["project", name_field])
+
+    if not data:
+        raise TankError("Unable to locate %s with id %s in Shotgun" % (entity_type, entity_id))
+
+    return _context_data_from_sg_entity(entity_type, entity_id, data)
+
+
+def _entities_from_sg(tk, entity_type, entity_ids):
+    """
+    Constructs contexts from several shotgun entities with a single query, see _entity_from_sg.
+
+    :param tk:           a Sgtk API instance
+    :param entity_type:  The shotgun entity type
+    :param entity_ids:   The shotgun entity ids to produce contexts for.
+    :returns: dictionary of context data keyed by entity id
+    """
+    filters = ["id", "in"]
+    filters.extend(entity_ids) # weird filter format here
+    fields = ["project", _get_name_field(entity_type)]
+    data = dict((x["id"], x) for x in tk.shotgun.find(entity_type, [filters], fields))
+
+    contexts = {}
+    for entity_id in entity_ids:
+        if entity_id not in data:
+            raise TankError("Unable to locate %s with id %s in Shotgun" % (entity_type, entity_id))
+        contexts[entity_id] = _context_data_from_sg_entity(entity_type, entity_id, data[entity_id])
+    return contexts
+
+
+def _get_name_field(entity_type):
+    """
+    Returns the field holding the name of the entities of a type.
+    """
     # deal with funny naming for certain entities 
     if entity_type == "HumanUser":
-        name_field = "login"
-        
+        return "login"
     elif entity_type == "Project":
-        name_field = "name"
-    
+        return "name"
     else:
-        name_field = "code"
+        return "code"
 
-    data = tk.shotgun.find_one(entity_type, [["id", "is", entity_id]], ["project", name_field])
 
-    if not data:
-        raise TankError("Unable to locate %s with id %s in Shotgun" % (entity_type, entity_id))
+def _context_data_from_sg_entity(entity_type, entity_id, data):
+    """
+    Returns the context data of an entity returned by shotgun.
+
+    :param data: shotgun entity dictionary with the project and name fields
+    """
+    name_field = _get_name_field(entity_type)
 
     # create context
     context = {}
@@ -1011,63 +1509,82 @@ def _context_data_from_cache(tk, entity_type, entity_id):
     :param entity_type: a Shotgun entity type
     :param entity_id: a Shotgun entity id
     """
-    context = {}
+    return _contexts_data_from_cache(tk, entity_type, [entity_id])[entity_id]
+
 
-    # Set entity info for input entity
-    context["entity"] = {"type": entity_type, "id": entity_id}
+def _contexts_data_from_cache(tk, entity_type, entity_ids):
+    """
+    Returns the context data of several entities of the same type based on the path
+    cache, see _context_data_from_cache. The path cache is looked up once for all the
+    entities.
 
+    :param tk: a Sgtk API instance
+    :param entity_type: a Shotgun entity type
+    :param entity_ids: Shotgun entity ids
+    :returns: dictionary of context data keyed by entity id
+    """
     # Map entity types to context fields
     types_fields = {"Project": "project",
                     "Step": "step",
                     "Task": "task"}
 
-    # Use the path cache to look up all paths linked to the entity and use that to extract
-    # extra entities we should include in the context
+    # Use the path cache to look up all paths linked to the entities and use that to extract
+    # extra entities we should include in the contexts
     path_cache = PathCache(tk.pipeline_configuration)
-
-    # Grab all project roots
-    project_roots = tk.pipeline_configuration.get_data_roots().values()
-
-    # Special case for project as we have the primary data path, which 
-    # always points at a project.
-    context["project"] = path_cache.get_entity(tk.pipeline_configuration.get_primary_data_root())
-
-    paths = path_cache.get_paths(entity_type, entity_id)
-
-    for path in paths:
-        # now recurse upwards and look for entity types we haven't found yet
-        curr_path = path
-        curr_entity = path_cache.get_entity(curr_path)
-        
-        if curr_entity is None:
-            # this is some sort of anomaly! the path returned by get_paths
-            # does not resolve in get_entity. This can happen if the storage
-            # mappings are not consistent or if there is not a 1 to 1 relationship
-            #
-            # This can also happen if there are extra slashes at the end of the path
-            # in the local storage defs and in the pipeline_configuration.yml file.
-            raise TankError("The path '%s' associated with %s id %s does not " 
-                            "resolve correctly. This may be an indication of an issue "
-                            "with the local storage setup. Please contact " 
-                            "sgtksupport@shotgunsoftware.com" % (curr_path, entity_type, entity_id))
-
-        # grab the name for the context entity
-        if curr_entity["type"] == entity_type and curr_entity["id"] == entity_id:
-            context["entity"]["name"] = curr_entity["name"]
-
-        # note - paths returned by get_paths are always prefixed with a
-        # project root so there is no risk we end up with an infinite loop here..
-        while curr_path not in project_roots:
-            curr_path = os.path.abspath(os.path.join(curr_path, ".."))
-            curr_entity = path_cache.get_entity(curr_path)
-            if curr_entity:
-                cur_type = curr_entity["type"]
-                if cur_type in types_fields:
-                    field_name = types_fields[cur_type]
-                    context[field_name] = curr_entity
-
-    path_cache.close()
-    return context
+    try:
+        # Special case for project as we have the primary data path, which 
+        # always points at a project.
+        project = path_cache.get_entity(tk.pipeline_configuration.get_primary_data_root())
+
+        entities_paths = path_cache.get_paths_bulk([(entity_type, x) for x in entity_ids])
+        all_paths = []
+        for paths in entities_paths.values():
+            all_paths.extend(paths)
+        paths_ancestors = path_cache.get_entities_for_ancestors_bulk(all_paths)
+    finally:
+        path_cache.close()
+
+    contexts = {}
+    for entity_id in entity_ids:
+        context = {}
+
+        # Set entity info for input entity
+        context["entity"] = {"type": entity_type, "id": entity_id}
+        context["project"] = project
+
+        for path in entities_paths[(entity_type, entity_id)]:
+            # now recurse upwards and look for entity types we haven't found yet
+            ancestors = paths_ancestors[path]
+            curr_entity = ancestors[0][1]
+
+            if curr_entity is None:
+                # this is some sort of anomaly! the path returned by get_paths
+                # does not resolve in get_entity. This can happen if the storage
+                # mappings are not consistent or if there is not a 1 to 1 relationship
+                #
+                # This can also happen if there are extra slashes at the end of the path
+                # in the local storage defs and in the pipeline_configuration.yml file.
+                raise TankError("The path '%s' associated with %s id %s does not " 
+                                "resolve correctly. This may be an indication of an issue "
+                                "with the local storage setup. Please contact " 
+                                "sgtksupport@shotgunsoftware.com" % (path, entity_type, entity_id))
+
+            # grab the name for the context entity
+            if curr_entity["type"] == entity_type and curr_entity["id"] == entity_id:
+                context["entity"]["name"] = curr_entity["name"]
+
+            # note - paths returned by get_paths are always prefixed with a
+            # project root so the parents end at a project root
+            for curr_path, curr_entity, _ in ancestors[1:]:
+                if curr_entity:
+                    cur_type = curr_entity["type"]
+                    if cur_type in types_fields:
+                        field_name = types_fields[cur_type]
+                        context[field_name] = curr_entity
+
+        contexts[entity_id] = context
+
+    return contexts
 
 
 def _values_from_path_cache(entity, cur_template, path_cache, fields):
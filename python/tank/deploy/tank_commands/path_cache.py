@@ -0,0 +1,166 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+from ... import folder
+from ...errors import TankError
+from ...path_cache import PathCache
+from .action_base import Action
+
+
+class PathCacheAction(Action):
+    """
+    Action that reports on and maintains the path cache
+    """
+
+    OPERATIONS = ["stats", "optimize", "purge_roots", "preview_rebuild", "rebuild", "upgrade"]
+
+    def __init__(self):
+        Action.__init__(self,
+                        "path_cache",
+                        Action.TK_INSTANCE,
+                        ("Path cache statistics and maintenance. 'tank path_cache stats' reports "
+                         "the number of records per storage root and entity type, the indexes and "
+                         "how fragmented the file is. 'tank path_cache optimize' removes unused "
+                         "folder entries, rebuilds and analyzes the indexes and compacts the file. "
+                         "'tank path_cache purge_roots' deletes the records of storage roots which "
+                         "are no longer part of this configuration. 'tank path_cache rebuild' "
+                         "replaces the contents of the path cache with the folders found on disk "
+                         "for the entities in Shotgun, 'tank path_cache preview_rebuild' shows "
+                         "what a rebuild would change. 'tank path_cache upgrade' moves the "
+                         "records of a path cache created by a previous version of the core, "
+                         "which that version can't open afterwards. The path cache is locked "
+                         "while it is optimized, purged, rebuilt or upgraded."),
+                        "Admin")
+
+        # this method can be executed via the API
+        self.supports_api = True
+
+        self.parameters["operation"] = { "description": "Operation to run, one of %s." % ", ".join(self.OPERATIONS),
+                                         "default": "stats",
+                                         "type": "str" }
+
+        self.parameters["return_value"] = { "description": "Statistics for the stats operation, the "
+                                                           "changes for the rebuild operations and "
+                                                           "what was deleted for the others.",
+                                            "type": "dict" }
+
+    def run_noninteractive(self, log, parameters):
+        """
+        API accessor
+        """
+        computed_params = self._validate_parameters(parameters)
+        return self._run(log, computed_params["operation"])
+
+    def run_interactive(self, log, args):
+        """
+        Tank command accessor
+        """
+        if len(args) > 1:
+            raise TankError("Syntax: path_cache [%s]" % "|".join(self.OPERATIONS))
+        operation = args[0] if args else "stats"
+        return self._run(log, operation)
+
+    def _run(self, log, operation):
+        """
+        Actual execution payload
+        """
+        if operation not in self.OPERATIONS:
+            raise TankError("Unknown operation '%s'! Please use one of %s." % (operation, ", ".join(self.OPERATIONS)))
+
+        if operation in ("preview_rebuild", "rebuild"):
+            return self._rebuild(log, operation == "preview_rebuild")
+
+        path_cache = PathCache(self.tk.pipeline_configuration)
+        try:
+            if operation == "optimize":
+                log.info("Optimizing the path cache, stand by...")
+                before = path_cache.get_statistics()["file_size"]
+                nodes = path_cache.optimize()
+                after = path_cache.get_statistics()["file_size"]
+                log.info("Removed %d unused folder entries. The file went from %d to %d KB."
+                         % (nodes, before / 1024, after / 1024))
+                return {"nodes": nodes, "bytes": before - after}
+
+            elif operation == "upgrade":
+                upgraded = path_cache.upgrade_schema()
+                if upgraded:
+                    log.info("The path cache was upgraded. Pipeline configurations using a "
+                             "previous version of the core can't open it anymore.")
+                else:
+                    log.info("The path cache is up to date.")
+                return {"upgraded": upgraded}
+
+            elif operation == "purge_roots":
+                deleted = path_cache.purge_missing_roots()
+                if not deleted:
+                    log.info("All the storage roots of the path cache are part of this configuration.")
+                for root_name, count in sorted(deleted.items()):
+                    log.info("Deleted %d records of storage root '%s'." % (count, root_name))
+                return deleted
+
+            stats = path_cache.get_statistics()
+        finally:
+            path_cache.close()
+
+        log.info("")
+        log.info("Path cache: %s" % self.tk.pipeline_configuration.get_path_cache_location())
+        log.info("%d records, %d folder entries, %d entity types."
+                 % (stats["records"], stats["nodes"], stats["entity_types"]))
+        log.info("")
+        log.info("Records per storage root:")
+        for root_name, count in sorted(stats["records_per_root"].items()):
+            log.info(" - %s: %d" % (root_name, count))
+        log.info("")
+        log.info("Records per entity type:")
+        for entity_type, count in sorted(stats["records_per_entity_type"].items()):
+            log.info(" - %s: %d" % (entity_type, count))
+        log.info("")
+        log.info("Indexes (statistics from the last optimize):")
+        for name, stat in sorted(stats["indexes"].items()):
+            log.info(" - %s: %s" % (name, stat or "not analyzed"))
+        log.info("")
+        log.info("Indexes used by lookups:")
+        for name, plan in sorted(stats["query_plans"].items()):
+            log.info(" - %s: %s" % (name, plan))
+        log.info("")
+        free_ratio = 0
+        if stats["file_size"]:
+            free_ratio = 100.0 * stats["free_size"] / stats["file_size"]
+        log.info("File size %d KB, %.1f%% free space, %d unused folder entries."
+                 % (stats["file_size"] / 1024, free_ratio, stats["unused_nodes"]))
+        if free_ratio > 20 or stats["unused_nodes"] > stats["nodes"] / 5:
+            log.info("Running 'tank path_cache optimize' is recommended.")
+        log.info("")
+        return stats
+
+    def _rebuild(self, log, preview):
+        """
+        Rebuilds the path cache from disk and reports the differences
+        """
+        log.info("Scanning the project folders, stand by...")
+        result = folder.rebuild_path_cache(self.tk, preview)
+
+        log.info("")
+        for title, key in (("Records added:", "added"), ("Records removed:", "removed")):
+            log.info(title)
+            for record in result[key]:
+                entity = record["entity"]
+                kind = "" if record["primary"] else " (secondary)"
+                log.info(" - %s %s %s: %s%s" % (entity["type"], entity["id"], entity["name"], record["path"], kind))
+            log.info("")
+        for path in result["unresolved"]:
+            log.warning("No Shotgun entity matches the folder %s, its records are kept." % path)
+        for path in result["unreadable"]:
+            log.warning("Could not list the folder %s, the records below it are kept." % path)
+        log.info("%d records added, %d removed." % (len(result["added"]), len(result["removed"])))
+        if preview:
+            log.info("Note - this was a preview and the path cache was not changed.")
+        log.info("")
+        return result
@@ -15,3 +15,4 @@ This module contains functionality relating to folder creation.
 
 from .operations import process_filesystem_structure
 from .configuration import read_ignore_files
+from .rebuild import rebuild_path_cache
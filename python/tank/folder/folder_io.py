@@ -74,20 +74,14 @@ class FolderIOReceiver(object):
         
         # now handle the path cache
         if not self._preview_mode:    
+            # primary entries first, then secondary ones, all in one go
+            records = []
             for i in self._items:
                 if i.get("action") == "entity_folder":
-                    path = i.get("path")
-                    entity_type = i.get("entity").get("type")
-                    entity_id = i.get("entity").get("id")
-                    entity_name = i.get("entity").get("name")
-                    self._path_cache.add_mapping(entity_type, entity_id, entity_name, path)
-                    
+                    records.append({"entity": i.get("entity"), "path": i.get("path"), "primary": True})
             for i in self._secondary_cache_entries:
-                path = i.get("path")
-                entity_type = i.get("entity").get("type")
-                entity_id = i.get("entity").get("id")
-                entity_name = i.get("entity").get("name")
-                self._path_cache.add_mapping(entity_type, entity_id, entity_name, path, False)
+                records.append({"entity": i.get("entity"), "path": i.get("path"), "primary": False})
+            self._path_cache.add_mappings(records)
 
 
         # note that for backwards compatibility, we are returning all folders, not 
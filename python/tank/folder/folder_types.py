@@ -65,6 +65,12 @@ class Folder(object):
         Returns the folder parent, none if no parent was defined
         """
         return self._parent
+
+    def get_children(self):
+        """
+        Returns the child folders of this configuration item
+        """
+        return self._children
         
     def extract_shotgun_data_upwards(self, sg, shotgun_data):
         """
@@ -1011,6 +1017,25 @@ class Entity(Folder):
         """
         return self._entity_type
     
+    def get_entity_expression(self):
+        """
+        returns the expression generating folder names for this node
+        """
+        return self._entity_expression
+    
+    def get_filters(self):
+        """
+        returns the filters selecting the entities of this node, with tokens
+        in place of values resolved at folder creation time
+        """
+        return self._filters
+    
+    def get_name_field(self):
+        """
+        returns the shotgun field holding the name of the entities of this node
+        """
+        return self.__get_name_field_for_et(self._entity_type)
+    
     def _should_item_be_processed(self, engine_str, is_primary):
         """
         Checks if this node should be processed, given its deferred status.        
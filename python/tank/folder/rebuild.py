@@ -0,0 +1,382 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Rebuilds the path cache from the folders on disk.
+
+The storage roots of the project are scanned by several threads, matching the folders
+found against the nodes of the folder configuration. The folders matching entity nodes
+are then resolved to Shotgun entities by name, with one query per entity node.
+
+"""
+
+import os
+import Queue
+import threading
+
+from .configuration import FolderConfiguration
+from .folder_types import Entity, ListField, UserWorkspace
+from .folder_types import FilterExpressionToken, CurrentStepExpressionToken, CurrentTaskExpressionToken
+
+from ..errors import TankError
+from ..path_cache import PathCache
+from ..platform import constants
+
+# maximum number of values in the "in" filter of a shotgun query
+SG_MAX_IN_VALUES = 500
+
+
+class FolderMatch(object):
+    """
+    A folder on disk matching an entity node of the folder configuration.
+    """
+
+    def __init__(self, path, node, parent):
+        """
+        Constructor
+
+        :param path: path of the folder on disk
+        :param node: Entity folder object the folder matches
+        :param parent: FolderMatch of the closest folder above this one matching an
+                       entity node, None for project folders
+        """
+        self.path = path
+        self.node = node
+        self.parent = parent
+        # the shotgun entity the folder represents, once resolved
+        self.entity = None
+
+    def __repr__(self):
+        return "<FolderMatch %s %s>" % (self.path, self.node)
+
+    def get_parent_entity(self, entity_type):
+        """
+        Returns the entity of the closest folder above this one matching an entity
+        node of a given entity type, None if there is none.
+        """
+        match = self.parent
+        while match is not None:
+            if match.node.get_entity_type() == entity_type:
+                return match.entity
+            match = match.parent
+        return None
+
+
+class FolderScanner(object):
+    """
+    Scans folders on disk with a pool of threads and matches them against the
+    folder configuration.
+    """
+
+    def __init__(self, tk, num_threads):
+        """
+        Constructor
+
+        :param tk: Sgtk api instance
+        :param num_threads: number of threads listing directories
+        """
+        self._tk = tk
+        self._num_threads = max(1, num_threads)
+        # folders matching entity nodes
+        self._matches = []
+        # folders which could not be listed
+        self._unreadable = []
+        # static and dynamic children of each folder object
+        self._children = {}
+
+    def _get_children(self, node):
+        """
+        Returns the children of a folder object, as a dictionary of static folder
+        objects keyed by folder name and a list of dynamic folder objects which
+        may match any folder name.
+        """
+        if node not in self._children:
+            static = {}
+            dynamic = []
+            for child in node.get_children():
+                if isinstance(child, (Entity, ListField)):
+                    dynamic.append(child)
+                else:
+                    static.setdefault(os.path.basename(child.get_path()), []).append(child)
+            self._children[node] = (static, dynamic)
+        return self._children[node]
+
+    def _process(self, path, node, parent_match):
+        """
+        Matches the folders in a folder on disk against the children of the
+        folder object the folder matches.
+
+        :returns: list of (path, folder object, FolderMatch) tuples to process next
+        """
+        (static, dynamic) = self._get_children(node)
+        if not static and not dynamic:
+            return []
+
+        items = []
+        for name in os.listdir(path):
+            # folders named like a static folder are not considered for dynamic ones
+            nodes = static.get(name) or dynamic
+            if not nodes:
+                continue
+            full_path = os.path.join(path, name)
+            if not os.path.isdir(full_path) or os.path.islink(full_path):
+                continue
+            for child in nodes:
+                if isinstance(child, Entity):
+                    match = FolderMatch(full_path, child, parent_match)
+                    self._matches.append(match)
+                    items.append((full_path, child, match))
+                else:
+                    items.append((full_path, child, parent_match))
+        return items
+
+    def scan(self, project_matches):
+        """
+        Scans the folders below project folders.
+
+        :param project_matches: list of FolderMatch objects for the project folders
+        """
+        queue = Queue.Queue()
+        errors = []
+
+        def worker():
+            while True:
+                item = queue.get()
+                try:
+                    if item is None:
+                        return
+                    try:
+                        for child_item in self._process(*item):
+                            queue.put(child_item)
+                    except OSError:
+                        self._unreadable.append(item[0])
+                    except Exception, e:
+                        errors.append(e)
+                finally:
+                    queue.task_done()
+
+        threads = []
+        for x in range(self._num_threads):
+            thread = threading.Thread(target=worker)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+
+        for match in project_matches:
+            queue.put((match.path, match.node, match))
+        queue.join()
+
+        for thread in threads:
+            queue.put(None)
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def _get_parent_links(self, node):
+        """
+        Returns the filters of an entity node which link its entities to the entities
+        of the folders above.
+
+        :returns: list of (field name, entity type) tuples
+        """
+        links = []
+        for condition in node.get_filters()["conditions"]:
+            value = condition["values"][0] if condition["values"] else None
+            if (isinstance(value, FilterExpressionToken) and
+                condition["relation"] == "is" and
+                not condition["path"].startswith("$FROM$") and
+                "." not in value.get_sg_data_key()):
+                links.append((condition["path"], value.get_sg_data_key()))
+        return links
+
+    def _find_entities(self, node, matches):
+        """
+        Finds the shotgun entities which may be represented by the folders matching
+        an entity node, with as few queries as possible.
+
+        :returns: dictionary of lists of entities keyed by folder name
+        """
+        fields = node.get_entity_expression().get_shotgun_fields()
+        fields.update(node.get_entity_expression().get_shotgun_link_fields())
+        fields.add(node.get_name_field())
+
+        links = self._get_parent_links(node)
+        fields.update(x[0] for x in links)
+
+        conditions = []
+        for condition in node.get_filters()["conditions"]:
+            value = condition["values"][0] if condition["values"] else None
+            if isinstance(value, (FilterExpressionToken, CurrentStepExpressionToken, CurrentTaskExpressionToken)):
+                # resolved against the folders above, see _check_parent_links
+                continue
+            if isinstance(node, UserWorkspace) and condition["path"] == "id":
+                # the workspaces of every user are rebuilt, not just the current user's
+                continue
+            conditions.append(condition)
+
+        queries = [conditions]
+        if links:
+            # only get the entities linked to the entities of the folders above
+            (field_name, entity_type) = links[0]
+            parents = {}
+            for match in matches:
+                entity = match.get_parent_entity(entity_type)
+                if entity:
+                    parents[entity["id"]] = {"type": entity["type"], "id": entity["id"]}
+            values = parents.values()
+            queries = []
+            for index in range(0, len(values), SG_MAX_IN_VALUES):
+                chunk = values[index:index + SG_MAX_IN_VALUES]
+                queries.append(conditions + [{"path": field_name, "relation": "in", "values": chunk}])
+
+        entities = {}
+        for query_conditions in queries:
+            sg_filters = {"logical_operator": "and", "conditions": query_conditions}
+            for entity in self._tk.shotgun.find(node.get_entity_type(), sg_filters, list(fields)):
+                try:
+                    name = node.get_entity_expression().generate_name(entity)
+                except TankError:
+                    # no folder can be created for this entity
+                    continue
+                entities.setdefault(name, []).append(entity)
+        return entities
+
+    def _check_parent_links(self, links, match, entity):
+        """
+        Returns True if an entity is linked to the entities of the folders above a
+        folder, as required by the filters of the folder's entity node.
+        """
+        for field_name, entity_type in links:
+            parent_entity = match.get_parent_entity(entity_type)
+            if parent_entity is None:
+                continue
+            value = entity.get(field_name)
+            if isinstance(value, dict):
+                value = [value]
+            if not isinstance(value, list):
+                return False
+            if not [x for x in value if x and x.get("type") == parent_entity["type"] and x.get("id") == parent_entity["id"]]:
+                return False
+        return True
+
+    def resolve(self, project_matches):
+        """
+        Resolves the folders found by the scan to shotgun entities.
+
+        :param project_matches: list of FolderMatch objects for the project folders,
+                                with their entity set
+        :returns: tuple of a list of path cache records, see PathCache.add_mappings,
+                  and a sorted list of the paths of the folders matching entity nodes
+                  which no entity could be found for
+        """
+        matches_by_node = {}
+        for match in self._matches:
+            matches_by_node.setdefault(match.node, []).append(match)
+
+        # folders are resolved after the folders above them
+        for node in sorted(matches_by_node, key=lambda x: len(x.get_parents())):
+            matches = [x for x in matches_by_node[node] if x.parent.entity is not None]
+            if not matches:
+                continue
+            entities = self._find_entities(node, matches)
+            links = self._get_parent_links(node)
+            for match in matches:
+                candidates = [x for x in entities.get(os.path.basename(match.path), [])
+                              if self._check_parent_links(links, match, x)]
+                if len(candidates) == 1:
+                    match.entity = candidates[0]
+
+        records = []
+        paths = set()
+        for match in project_matches + sorted(self._matches, key=lambda x: x.path):
+            if match.entity is None or match.path in paths:
+                continue
+            paths.add(match.path)
+            node = match.node
+            entity = {"type": node.get_entity_type(),
+                      "id": match.entity["id"],
+                      "name": match.entity.get(node.get_name_field())}
+            records.append({"entity": entity, "path": match.path, "primary": True})
+            for link_field in node.get_entity_expression().get_shotgun_link_fields():
+                link = match.entity.get(link_field)
+                if isinstance(link, dict) and "id" in link:
+                    records.append({"entity": link, "path": match.path, "primary": False})
+
+        # the folders below unresolved folders are not reported
+        unresolved = set()
+        for match in self._matches:
+            if match.entity is None and match.parent.entity is not None and match.path not in paths:
+                unresolved.add(match.path)
+
+        return records, sorted(unresolved)
+
+    def get_unreadable_paths(self):
+        """
+        Returns the sorted paths of the folders which could not be listed during the scan.
+        """
+        return sorted(self._unreadable)
+
+
+def rebuild_path_cache(tk, preview, num_threads=None):
+    """
+    Rebuilds the path cache from the folders on disk. Folders are matched against the
+    folder configuration and the Shotgun entities they represent are looked up by name.
+    The records of the path cache in the project folders found are replaced, unless 
+    running in preview mode. The records of storage roots whose project folder is not 
+    found, for instance because they are not mounted, the records below folders which 
+    could not be listed and the records of folders which no entity could be found for, 
+    and of the folders below them, are kept as they are since the scan can't tell what
+    they should be.
+
+    :param tk: A tank instance
+    :param preview: only compare the folders found with the path cache
+    :param num_threads: number of threads scanning folders, see PATH_CACHE_REBUILD_THREADS
+    :returns: dictionary with keys "added" and "removed", the path cache records added
+              and removed, see PathCache.replace_mappings, "unresolved", the paths of
+              folders matching entity nodes which no entity could be found for and
+              "unreadable", the paths of folders which could not be listed.
+    """
+    schema_cfg_folder = tk.pipeline_configuration.get_schema_config_location()
+    config = FolderConfiguration(tk, schema_cfg_folder)
+
+    project_id = tk.pipeline_configuration.get_project_id()
+    project = tk.shotgun.find_one("Project", [["id", "is", project_id]], ["name"])
+    if project is None:
+        raise TankError("Could not find the Project with id %s in Shotgun!" % project_id)
+    project_entity = {"type": "Project", "id": project_id, "name": project.get("name")}
+
+    # project names may contain slashes, see Entity._create_folders_impl
+    project_name = tk.pipeline_configuration.get_project_disk_name().replace("/", os.path.sep)
+    project_matches = []
+    for project_node in config.get_folder_objs_for_entity_type("Project"):
+        path = os.path.join(project_node.get_storage_root(), project_name)
+        if os.path.isdir(path):
+            match = FolderMatch(path, project_node, None)
+            match.entity = project_entity
+            project_matches.append(match)
+
+    scanner = FolderScanner(tk, num_threads or constants.PATH_CACHE_REBUILD_THREADS)
+    scanner.scan(project_matches)
+    (records, unresolved) = scanner.resolve(project_matches)
+
+    path_cache = PathCache(tk.pipeline_configuration)
+    try:
+        keep_paths = unresolved + scanner.get_unreadable_paths()
+        scanned_paths = [x.path for x in project_matches]
+        (added, removed) = path_cache.replace_mappings(records, preview, keep_paths, scanned_paths)
+    finally:
+        path_cache.close()
+
+    return {"added": added,
+            "removed": removed,
+            "unresolved": unresolved,
+            "unreadable": scanner.get_unreadable_paths()}
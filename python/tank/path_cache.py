@@ -14,10 +14,159 @@ all Tank items in the file system are kept.
 
 """
 
+import logging
 import sqlite3
 import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
 
 from .errors import TankError 
+from .platform import constants
+from .util.lru_cache import LRUCache
+
+
+class _NullHandler(logging.Handler):
+    """
+    Discards log records, like logging.NullHandler which is not available in
+    python 2.5. Avoids warnings about missing handlers when the application
+    doesn't configure logging.
+    """
+    def emit(self, record):
+        pass
+
+
+log = logging.getLogger("sgtk.path_cache")
+log.addHandler(_NullHandler())
+
+
+class _LookupCache(object):
+    """
+    Results of path cache lookups, shared by all the PathCache objects of a 
+    pipeline configuration. Results expire after a time to live so that changes
+    made by other processes are picked up, changes made by this process discard
+    them straight away. Lookups which found nothing are not kept, see _is_miss.
+    """
+    def __init__(self, db_path, ttl, size):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.results = LRUCache(size)
+        # incremented by each write, results looked up during a write are not kept
+        self.generation = 0
+        self.lock = threading.Lock()
+        
+    def invalidate(self):
+        self.lock.acquire()
+        try:
+            self.generation += 1
+            self.results.clear()
+        finally:
+            self.lock.release()
+
+# version of the db schema, stored in the db. Version 3 stores the path of each 
+# node of the tree, version 2 keeps paths as a tree of folder names, version 1 
+# and before had a row per path
+SCHEMA_VERSION = 3
+
+_lookup_caches = {}
+_lookup_caches_lock = threading.Lock()
+
+# incremented each time this process writes to a path cache or clears the lookup caches
+_cache_generation = 0
+
+# maximum number of values in the IN clause of a query, sqlite allows 999 parameters
+_MAX_IN_VALUES = 500
+
+# number of records written per statement when the db is rebuilt
+_INSERT_BATCH_SIZE = 1000
+
+def _chunks(values, size=_MAX_IN_VALUES):
+    """
+    Splits a list of values into lists of at most a given size.
+    """
+    for index in xrange(0, len(values), size):
+        yield values[index:index + size]
+
+def _get_lookup_cache(pipeline_configuration, db_path):
+    """
+    Returns the lookup cache of a pipeline configuration, or None if lookups
+    should not be cached.
+    """
+    key = (pipeline_configuration.get_path(), db_path)
+    _lookup_caches_lock.acquire()
+    try:
+        if key not in _lookup_caches:
+            ttl = pipeline_configuration.get_path_cache_lookup_ttl()
+            _lookup_caches[key] = _LookupCache(db_path, ttl, constants.PATH_CACHE_LOOKUP_CACHE_SIZE)
+        lookup_cache = _lookup_caches[key]
+    finally:
+        _lookup_caches_lock.release()
+    if lookup_cache.ttl <= 0:
+        return None
+    return lookup_cache
+
+def _invalidate_lookup_caches(db_path):
+    """
+    Discards the cached lookups of all the pipeline configurations using a db.
+    """
+    global _cache_generation
+    _lookup_caches_lock.acquire()
+    try:
+        _cache_generation += 1
+        lookup_caches = [x for x in _lookup_caches.values() if x.db_path == db_path]
+    finally:
+        _lookup_caches_lock.release()
+    for lookup_cache in lookup_caches:
+        lookup_cache.invalidate()
+
+def clear_lookup_caches():
+    """
+    Discards the cached path cache lookups of all pipeline configurations, for 
+    instance after the path cache has been modified outside of the API.
+    """
+    global _cache_generation
+    _lookup_caches_lock.acquire()
+    try:
+        _cache_generation += 1
+        lookup_caches = _lookup_caches.values()
+        # settings are read again when the caches are next needed
+        _lookup_caches.clear()
+    finally:
+        _lookup_caches_lock.release()
+    for lookup_cache in lookup_caches:
+        lookup_cache.invalidate()
+
+def get_cache_generation():
+    """
+    Returns a number which changes each time this process writes to a path cache
+    or clears the lookup caches, so that data derived from path cache lookups 
+    can be discarded when it may be out of date.
+    """
+    return _cache_generation
+
+def _is_miss(value):
+    """
+    Returns True if a lookup result has nothing for the path or entity looked up.
+    Such results are not cached, as the folders are often about to be created by
+    this or another process and looked up straight after.
+    """
+    if isinstance(value, list) and value and isinstance(value[0], tuple):
+        # entities for ancestors, the path looked up first
+        return not (value[0][1] or value[0][2])
+    return not value
+
+def _copy_result(value):
+    """
+    Copies a lookup result so that callers can't modify the cached one.
+    """
+    if isinstance(value, dict):
+        return value.copy()
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_copy_result(x) for x in value)
+    return value
+
 
 class PathCache(object):
     """
@@ -25,6 +174,14 @@ class PathCache(object):
     
     NOTE! This uses sqlite and the db is typically hosted on an NFS storage.
     Ensure that the code is developed with the constraints that this entails in mind.
+    
+    When a replica location is configured for the pipeline configuration, the db is 
+    copied to local disk whenever it has changed and reads are served from that 
+    copy. Writes always go to the db itself.
+    
+    When path_cache_lookup_ttl is set in pipeline_configuration.yml, lookups are 
+    cached for all the PathCache objects of a pipeline configuration for that many
+    seconds. The db is only opened when a lookup is not cached or for writes.
     """
     
     def __init__(self, pipeline_configuration):
@@ -32,15 +189,22 @@ class PathCache(object):
         Constructor
         :param pipeline_configuration: pipeline config object
         """
-        db_path = pipeline_configuration.get_path_cache_location()
+        self._db_path = pipeline_configuration.get_path_cache_location()
         self._connection = None
-        self._init_db(db_path)
+        self._replica_connection = None
+        self._replica_checked = False
+        self._pipeline_configuration = pipeline_configuration
+        self._lookup_cache = _get_lookup_cache(pipeline_configuration, self._db_path)
         self._roots = pipeline_configuration.get_data_roots()
         
     
-    def _init_db(self, db_path):
+    def _init_db(self, db_path, upgrade=False):
         """
         Sets up the database
+        
+        :param upgrade: move the records of a db using the schema of previous cores, 
+                        see upgrade_schema
+        :returns: True if records were moved from the previous schema
         """
         
         # first check that the cache folder exists
@@ -67,33 +231,39 @@ class PathCache(object):
         self._connection.text_factory = str
         
         c = self._connection.cursor()
-        c.executescript("""
-            CREATE TABLE IF NOT EXISTS path_cache (entity_type text, entity_id integer, entity_name text, root text, path text, primary_entity integer);
-        
-            CREATE INDEX IF NOT EXISTS path_cache_entity ON path_cache(entity_type, entity_id);
-        
-            CREATE INDEX IF NOT EXISTS path_cache_path ON path_cache(root, path, primary_entity);
-        
-            CREATE UNIQUE INDEX IF NOT EXISTS path_cache_all ON path_cache(entity_type, entity_id, root, path, primary_entity);
-        """)
-        
-        ret = c.execute("PRAGMA table_info(path_cache)")
-        
-        # check for primary field
-        if "primary_entity" not in [x[1] for x in ret.fetchall()]:
-            c.executescript("""
-                ALTER TABLE path_cache ADD COLUMN primary_entity integer;
-                UPDATE path_cache SET primary_entity=1;
-
-                DROP INDEX path_cache_path;
-                CREATE INDEX IF NOT EXISTS path_cache_path ON path_cache(root, path, primary_entity);
-                
-                DROP INDEX path_cache_all;
-                CREATE UNIQUE INDEX IF NOT EXISTS path_cache_all ON path_cache(entity_type, entity_id, root, path, primary_entity);
-                
-            """)
-
-        self._connection.commit()
+        records_moved = False
+        if self._needs_schema(c):
+            # take the write lock before checking again, so that only one
+            # process creates or upgrades the db. Transactions are handled
+            # here rather than by the sqlite module, which would commit before 
+            # each statement creating a table.
+            self._connection.isolation_level = None
+            failed = True
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                try:
+                    if self._needs_schema(c):
+                        records_moved = self._create_schema(c, upgrade)
+                    c.execute("COMMIT")
+                except:
+                    c.execute("ROLLBACK")
+                    raise
+                failed = False
+                if records_moved:
+                    # give the space of the previous schema back. The records are
+                    # already committed, so this is left to tank path_cache optimize
+                    # when other processes are using the db
+                    try:
+                        c.execute("VACUUM")
+                    except sqlite3.OperationalError:
+                        pass
+            finally:
+                self._connection.isolation_level = ""
+                if failed:
+                    # the db is set up again the next time it is needed
+                    c.close()
+                    self._connection.close()
+                    self._connection = None
         c.close()
         
         # and open up permissions if the file was just created
@@ -103,6 +273,310 @@ class PathCache(object):
                 os.chmod(db_path, 0666)
             finally:
                 os.umask(old_umask)            
+        return records_moved
+    
+    def _needs_schema(self, c):
+        """
+        Returns True if the tables of the db have to be created or upgraded: the db
+        is from before the current schema or a core using the previous schema has
+        created its table again.
+        """
+        if c.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            return True
+        res = c.execute("SELECT type FROM sqlite_master WHERE name = 'path_cache'")
+        return [x[0] for x in res] != ["view"]
+    
+    def _create_schema(self, c, upgrade=False):
+        """
+        Creates the tables of the db, moving the records of the db from its
+        previous schema if there are any.
+        
+        Paths are stored as a tree of nodes, one per folder name, where the top 
+        nodes are named after the storage roots. The other nodes also hold their
+        root name and db path, so that a path is looked up with a single query.
+        Entity types are stored once and referred to by id.
+        
+        :param upgrade: move the records of the previous schema rather than raise
+        :returns: True if records were moved from the previous schema
+        """
+        res = c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'path_cache'")
+        previous_schema = res.fetchone() is not None
+        if previous_schema and not upgrade:
+            # cores using the previous schema can't open the db once it is upgraded, 
+            # so this has to be requested once none of them share the db anymore
+            raise TankError("The path cache %s uses the schema of a previous version of the core, "
+                            "which may still be in use by other pipeline configurations of the "
+                            "project. Once they all use this version of the core, please run "
+                            "'tank path_cache upgrade' to upgrade the path cache." % self._db_path)
+        
+        for statement in ["CREATE TABLE IF NOT EXISTS path_cache_entity_types (id integer primary key, name text)",
+                          "CREATE UNIQUE INDEX IF NOT EXISTS path_cache_entity_types_name ON path_cache_entity_types(name)",
+                          "CREATE TABLE IF NOT EXISTS path_cache_nodes (id integer primary key, parent_id integer, name text, root text, path text)",
+                          "CREATE UNIQUE INDEX IF NOT EXISTS path_cache_nodes_name ON path_cache_nodes(parent_id, name)",
+                          "CREATE TABLE IF NOT EXISTS path_cache_entries (entity_type_id integer, entity_id integer, entity_name text, node_id integer, primary_entity integer)",
+                          "CREATE INDEX IF NOT EXISTS path_cache_entries_node ON path_cache_entries(node_id, primary_entity)",
+                          "CREATE UNIQUE INDEX IF NOT EXISTS path_cache_entries_all ON path_cache_entries(entity_type_id, entity_id, node_id, primary_entity)"]:
+            c.execute(statement)
+        
+        if "path" not in [x[1] for x in c.execute("PRAGMA table_info(path_cache_nodes)")]:
+            # the tree is from before the nodes held their path
+            c.execute("ALTER TABLE path_cache_nodes ADD COLUMN root text")
+            c.execute("ALTER TABLE path_cache_nodes ADD COLUMN path text")
+            self._set_node_paths(c)
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS path_cache_nodes_path ON path_cache_nodes(path, root)")
+        # cores storing the tree without the paths still share the db, the paths 
+        # of the nodes they create are set from their parent
+        c.execute("""CREATE TRIGGER IF NOT EXISTS path_cache_nodes_path AFTER INSERT ON path_cache_nodes
+                     WHEN NEW.root IS NULL
+                     BEGIN
+                         UPDATE path_cache_nodes SET 
+                             root = coalesce((SELECT p.root FROM path_cache_nodes p WHERE p.id = NEW.parent_id), NEW.name),
+                             path = (SELECT CASE WHEN p.path IS NULL THEN NEW.name ELSE p.path || '/' || NEW.name END
+                                     FROM path_cache_nodes p WHERE p.id = NEW.parent_id)
+                         WHERE id = NEW.id;
+                     END""")
+        
+        if previous_schema:
+            # the db has the previous schema, with a row per record
+            columns = [x[1] for x in c.execute("PRAGMA table_info(path_cache)")]
+            if "primary_entity" in columns:
+                res = c.execute("SELECT entity_type, entity_id, entity_name, root, path, primary_entity FROM path_cache ORDER BY rowid")
+            else:
+                # records from before secondary entities were all primary ones
+                res = c.execute("SELECT entity_type, entity_id, entity_name, root, path, 1 FROM path_cache ORDER BY rowid")
+            self._insert_records(c, res.fetchall())
+            c.execute("DROP TABLE path_cache")
+            records_moved = True
+        else:
+            records_moved = False
+        
+        # the db is shared by all the pipeline configurations of the project, some of 
+        # which may run a core using the previous schema. Such a core would create
+        # an empty path_cache table next to the tree and both cores would miss the
+        # records of the other. Views can't be indexed, so with a view in its place 
+        # the previous core fails to open the db instead.
+        c.execute("CREATE VIEW IF NOT EXISTS path_cache AS SELECT "
+                  "NULL AS entity_type, NULL AS entity_id, NULL AS entity_name, NULL AS root, "
+                  "NULL AS path, NULL AS primary_entity WHERE 0")
+        
+        c.execute("PRAGMA user_version = %d" % SCHEMA_VERSION)
+        return records_moved
+    
+    def _set_node_paths(self, c):
+        """
+        Sets the root name and db path of the nodes of the tree. Top nodes are 
+        named after their storage root and have no db path.
+        """
+        nodes = dict((x[0], (x[1], x[2])) for x in c.execute("SELECT id, parent_id, name FROM path_cache_nodes"))
+        paths = {}
+        def get_path(node_id):
+            if node_id not in paths:
+                (parent_id, name) = nodes[node_id]
+                if parent_id in nodes:
+                    (root_name, parent_path) = get_path(parent_id)
+                    if parent_path is None:
+                        paths[node_id] = (root_name, name)
+                    else:
+                        paths[node_id] = (root_name, parent_path + "/" + name)
+                else:
+                    paths[node_id] = (name, None)
+            return paths[node_id]
+        for node_id in sorted(nodes):
+            get_path(node_id)
+        c.executemany("UPDATE path_cache_nodes SET root = ?, path = ? WHERE id = ?", 
+                      [x[1] + (x[0],) for x in paths.items()])
+    
+    def _get_db_stamp(self, db_path):
+        """
+        Returns a value which changes whenever the given db is modified, made of its 
+        size, modification time and the change counter in its header. Returns None 
+        if the db does not exist or is being written to.
+        """
+        if not os.path.exists(db_path) or os.path.exists(db_path + "-journal"):
+            # a journal means that a transaction is in progress or was interrupted,
+            # the db file on its own may not be consistent
+            return None
+        stat = os.stat(db_path)
+        fh = open(db_path, "rb")
+        try:
+            header = fh.read(100)
+        finally:
+            fh.close()
+        change_counter = 0
+        if len(header) == 100:
+            change_counter = struct.unpack(">I", header[24:28])[0]
+        return "%d:%r:%d" % (stat.st_size, stat.st_mtime, change_counter)
+    
+    def _init_replica(self, db_path, replica_path):
+        """
+        Opens the local replica of the db, copying the db first if the replica is 
+        missing or out of date. The replica is only there to speed reads up, so
+        errors with its location are logged and the db is read from instead.
+        
+        :returns: connection to the replica or None if the db could not be replicated
+        """
+        try:
+            return self._open_replica(db_path, replica_path)
+        except (IOError, OSError, sqlite3.Error), e:
+            log.warning("Could not use the local replica %s of the path cache %s, reading "
+                        "from the path cache instead: %s" % (replica_path, db_path, e))
+            return None
+    
+    def _open_replica(self, db_path, replica_path):
+        """
+        Opens the local replica of the db, see _init_replica.
+        """
+        stamp = self._get_db_stamp(db_path)
+        if stamp is None:
+            return None
+        
+        if os.path.exists(replica_path):
+            connection = sqlite3.connect(replica_path)
+            connection.text_factory = str
+            try:
+                res = connection.execute("SELECT stamp FROM path_cache_replica")
+                if [x[0] for x in res] == [stamp]:
+                    return connection
+            except sqlite3.Error:
+                # not a complete replica
+                pass
+            connection.close()
+        
+        # copy the db next to the replica, then atomically replace the replica
+        # so that other processes never see a partial copy
+        # the replica is shared by all users of the machine, open up permissions
+        replica_folder = os.path.dirname(replica_path)
+        if not os.path.exists(replica_folder):
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(replica_folder, 0777)
+            except OSError:
+                # created by another process in the meantime
+                if not os.path.isdir(replica_folder):
+                    raise
+            finally:
+                os.umask(old_umask)
+        (fd, temp_path) = tempfile.mkstemp(dir=replica_folder, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(db_path, temp_path)
+            os.chmod(temp_path, 0666)
+            if self._get_db_stamp(db_path) != stamp:
+                # the db was modified while being copied
+                return None
+            
+            connection = sqlite3.connect(temp_path)
+            try:
+                if connection.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                    # the db has to be upgraded first, which happens when it is opened
+                    return None
+                connection.execute("CREATE TABLE path_cache_replica (stamp text)")
+                connection.execute("INSERT INTO path_cache_replica VALUES(?)", (stamp,))
+                connection.commit()
+            finally:
+                connection.close()
+            
+            try:
+                os.rename(temp_path, replica_path)
+            except OSError:
+                # windows does not replace existing files
+                os.remove(replica_path)
+                os.rename(temp_path, replica_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+        connection = sqlite3.connect(replica_path)
+        connection.text_factory = str
+        return connection
+    
+    def _get_connection(self):
+        """
+        Returns the connection to the db, which is opened the first time it is
+        needed when reads are served by the replica.
+        """
+        if self._connection is None:
+            self._init_db(self._db_path)
+        return self._connection
+    
+    def _get_read_connection(self):
+        """
+        Returns the connection to read from: the replica, unless the db has 
+        been opened to be written to, in which case the replica is out of date.
+        """
+        if self._connection is None:
+            if not self._replica_checked:
+                # when the db can't be replicated, it is read from
+                self._replica_checked = True
+                replica_path = self._pipeline_configuration.get_path_cache_replica_location()
+                if replica_path:
+                    self._replica_connection = self._init_replica(self._db_path, replica_path)
+            if self._replica_connection is not None:
+                return self._replica_connection
+        return self._get_connection()
+    
+    def _lookup(self, key, method, *args):
+        """
+        Returns the result of a lookup method, from the lookup cache if possible.
+        """
+        lookup_cache = self._lookup_cache
+        if lookup_cache is None:
+            return method(*args)
+        
+        generation = lookup_cache.generation
+        entry = lookup_cache.results.get(key)
+        if entry is not None and time.time() - entry[0] < lookup_cache.ttl:
+            return _copy_result(entry[1])
+        
+        value = method(*args)
+        if _is_miss(value):
+            return value
+        lookup_cache.lock.acquire()
+        try:
+            if lookup_cache.generation == generation:
+                lookup_cache.results.set(key, (time.time(), value))
+        finally:
+            lookup_cache.lock.release()
+        return _copy_result(value)
+    
+    def _lookup_many(self, keys, method):
+        """
+        Returns the results of a bulk lookup method, taking the cached ones from
+        the lookup cache and looking up the others in one go.
+        
+        :param keys: dictionary of the lookup cache keys for the method inputs
+        :param method: method taking a list of inputs and returning a dictionary
+                       of results keyed by input
+        """
+        lookup_cache = self._lookup_cache
+        if lookup_cache is None:
+            return method(list(keys))
+        
+        generation = lookup_cache.generation
+        results = {}
+        missing = []
+        now = time.time()
+        for item, key in keys.iteritems():
+            entry = lookup_cache.results.get(key)
+            if entry is not None and now - entry[0] < lookup_cache.ttl:
+                results[item] = _copy_result(entry[1])
+            else:
+                missing.append(item)
+        
+        if missing:
+            values = method(missing)
+            now = time.time()
+            lookup_cache.lock.acquire()
+            try:
+                if lookup_cache.generation == generation:
+                    for item in missing:
+                        if not _is_miss(values[item]):
+                            lookup_cache.results.set(keys[item], (now, values[item]))
+            finally:
+                lookup_cache.lock.release()
+            for item in missing:
+                results[item] = _copy_result(values[item])
+        return results
     
     def _path_to_dbpath(self, relative_path):
         """
@@ -168,20 +642,227 @@ class PathCache(object):
         if self._connection is not None:
             self._connection.close()
             self._connection = None
+        if self._replica_connection is not None:
+            self._replica_connection.close()
+            self._replica_connection = None
+        
+    ########################################################################################
+    # path tree
+    
+    def _get_db_key(self, path):
+        """
+        Returns the storage root name and db path of a path, or None if the 
+        path does not belong to the project.
+        """
+        try:
+            root_name, relative_path = self._separate_root(path)
+        except TankError:
+            return None
+        return root_name, self._path_to_dbpath(relative_path)
+    
+    def _find_nodes(self, c, db_keys):
+        """
+        Finds the nodes of several paths, looked up by their db path with a 
+        single query.
+        
+        :param db_keys: list of (root name, db path) tuples
+        :returns: dictionary of node ids keyed by (root name, db path) for the 
+                  paths which are in the db
+        """
+        db_keys = set(db_keys)
+        found = {}
+        for chunk in _chunks(list(set(x[1] for x in db_keys))):
+            res = c.execute("SELECT id, root, path FROM path_cache_nodes WHERE path IN (%s)" % ",".join("?" * len(chunk)), chunk)
+            for node_id, root_name, db_path in res:
+                if (root_name, db_path) in db_keys:
+                    found[(root_name, db_path)] = node_id
+        return found
+    
+    def _get_or_create_nodes(self, c, db_keys):
+        """
+        Returns the nodes of several paths, creating the ones missing from the db.
         
+        :param db_keys: list of (root name, db path) tuples
+        :returns: dictionary of node ids keyed by (root name, db path)
+        """
+        node_ids = self._find_nodes(c, db_keys)
+        created = {}
+        for db_key in db_keys:
+            if db_key in node_ids:
+                continue
+            node_id = 0
+            names = [db_key[0]] + db_key[1].split("/")
+            for level, name in enumerate(names):
+                if (node_id, name) in created:
+                    node_id = created[(node_id, name)]
+                    continue
+                row = c.execute("SELECT id FROM path_cache_nodes WHERE parent_id = ? AND name = ?", (node_id, name)).fetchone()
+                if row:
+                    created[(node_id, name)] = row[0]
+                else:
+                    # top nodes are named after their storage root and have no db path
+                    db_path = None
+                    if level:
+                        db_path = "/".join(names[1:level + 1])
+                    c.execute("INSERT INTO path_cache_nodes (parent_id, name, root, path) VALUES(?, ?, ?, ?)", 
+                              (node_id, name, db_key[0], db_path))
+                    created[(node_id, name)] = c.lastrowid
+                node_id = created[(node_id, name)]
+            node_ids[db_key] = node_id
+        return node_ids
+    
+    def _get_db_keys(self, c, node_ids):
+        """
+        Returns the root names and db paths of several nodes. Top nodes, which 
+        are the storage roots, are not included.
+        
+        :returns: dictionary of (root name, db path) tuples keyed by node id
+        """
+        db_keys = {}
+        for chunk in _chunks(list(set(node_ids))):
+            res = c.execute("SELECT id, root, path FROM path_cache_nodes WHERE id IN (%s) AND path IS NOT NULL" 
+                            % ",".join("?" * len(chunk)), chunk)
+            for node_id, root_name, db_path in res:
+                db_keys[node_id] = (root_name, db_path)
+        return db_keys
+    
+    def _get_subtree_nodes(self, c, db_key):
+        """
+        Returns the node of a path and all the nodes below it, looked up with a 
+        range query on their db paths.
+        
+        :param db_key: (root name, db path) tuple, without a trailing slash
+        :returns: dictionary of the paths of the nodes relative to the given path, 
+                  keyed by node id.
+        """
+        (root_name, db_path) = db_key
+        # the paths below start with a slash, "0" is the character which follows it
+        res = c.execute("SELECT id, path FROM path_cache_nodes WHERE (path = ? OR (path > ? AND path < ?)) AND root = ?", 
+                        (db_path, db_path + "/", db_path + "0", root_name))
+        return dict((node_id, path[len(db_path):]) for node_id, path in res)
+    
+    def _get_node_entities(self, c, node_ids, primary=None):
+        """
+        Returns the entities of several nodes.
+        
+        :param primary: True or False to only return primary or secondary entities
+        :returns: dictionary keyed by node id of lists of (entity dict, primary) 
+                  tuples, in the order they were added
+        """
+        query = """SELECT e.node_id, t.name, e.entity_id, e.entity_name, e.primary_entity
+                   FROM path_cache_entries e JOIN path_cache_entity_types t ON t.id = e.entity_type_id 
+                   WHERE e.node_id IN (%s)"""
+        if primary is not None:
+            query += " AND e.primary_entity = %d" % primary
+        query += " ORDER BY e.rowid"
+        
+        entities = {}
+        for chunk in _chunks(list(set(node_ids))):
+            for node_id, entity_type, entity_id, entity_name, is_primary in c.execute(query % ",".join("?" * len(chunk)), chunk):
+                # convert to string, not unicode!
+                entity = {"type": str(entity_type), "id": entity_id, "name": str(entity_name)}
+                entities.setdefault(node_id, []).append((entity, bool(is_primary)))
+        return entities
+    
+    def _get_entity_nodes(self, c, entities, primary_only=False):
+        """
+        Returns the nodes of several entities.
+        
+        :param entities: list of (entity type, entity id) tuples
+        :returns: list of (entity type, entity id, node id) tuples in the order 
+                  they were added
+        """
+        ids_by_type = {}
+        for entity_type, entity_id in entities:
+            ids_by_type.setdefault(entity_type, set()).add(entity_id)
+        
+        query = """SELECT e.rowid, t.name, e.entity_id, e.node_id
+                   FROM path_cache_entries e JOIN path_cache_entity_types t ON t.id = e.entity_type_id 
+                   WHERE t.name = ? AND e.entity_id IN (%s)"""
+        if primary_only:
+            query += " AND e.primary_entity = 1"
+        
+        rows = []
+        for entity_type, entity_ids in ids_by_type.iteritems():
+            for chunk in _chunks(list(entity_ids)):
+                rows.extend(c.execute(query % ",".join("?" * len(chunk)), [entity_type] + chunk))
+        rows.sort()
+        return [(str(x[1]), x[2], x[3]) for x in rows]
+    
+    def _insert_records(self, c, records):
+        """
+        Inserts records, skipping the ones already in the db.
+        
+        :param records: list of (entity type, entity id, entity name, root name, 
+                        db path, primary) tuples
+        """
+        type_ids = {}
+        for entity_type in set(x[0] for x in records):
+            row = c.execute("SELECT id FROM path_cache_entity_types WHERE name = ?", (entity_type,)).fetchone()
+            if row:
+                type_ids[entity_type] = row[0]
+            else:
+                c.execute("INSERT INTO path_cache_entity_types (name) VALUES(?)", (entity_type,))
+                type_ids[entity_type] = c.lastrowid
+        
+        node_ids = self._get_or_create_nodes(c, list(set((x[3], x[4]) for x in records)))
+        rows = [(type_ids[entity_type], entity_id, entity_name, node_ids[(root_name, db_path)], primary) 
+                for entity_type, entity_id, entity_name, root_name, db_path, primary in records]
+        c.executemany("INSERT OR IGNORE INTO path_cache_entries VALUES(?, ?, ?, ?, ?)", rows)
+    
+    def _get_records(self, entities=None):
+        """
+        Returns the records of the db. 
+        
+        :param entities: list of (entity type, entity id) tuples to only return the
+                         records of these entities
+        :returns: list of (entity type, entity id, entity name, root name, db path,
+                  primary) tuples in the order they were added
+        """
+        c = self._get_read_connection().cursor()
+        try:
+            return self._read_records(c, entities)
+        finally:
+            c.close()
+
+    def _read_records(self, c, entities=None):
+        """
+        Returns the records of the db using a given cursor, see _get_records.
+        """
+        query = """SELECT t.name, e.entity_id, e.entity_name, e.node_id, e.primary_entity
+                   FROM path_cache_entries e JOIN path_cache_entity_types t ON t.id = e.entity_type_id"""
+        if entities is None:
+            rows = c.execute(query + " ORDER BY e.rowid").fetchall()
+        else:
+            rows = []
+            for entity_type, entity_id in entities:
+                rows.extend(c.execute(query + " WHERE t.name = ? AND e.entity_id = ? ORDER BY e.rowid", 
+                                      (entity_type, entity_id)))
+        db_keys = self._get_db_keys(c, [x[3] for x in rows])
+        return [(str(t), i, n) + db_keys[node_id] + (bool(p),) for t, i, n, node_id, p in rows if node_id in db_keys]
+    
+    ########################################################################################
+    # public methods
+    
     def delete_path_tree(self, path):
         """
-        Deletes all records that are associated with the given path
+        Deletes all records that are associated with the given path or with
+        paths below it.
         """
-        # there was no entity in the db. So let's create it!
-        c = self._connection.cursor()
         root_name, relative_path = self._separate_root(path)
-        db_path = self._path_to_dbpath(relative_path)
-        query = "DELETE FROM path_cache where root=? and path like '%s%%'" % db_path
-        c.execute(query, (root_name,) )
-        self._connection.commit()
-        c.close()
+        db_key = (root_name, self._path_to_dbpath(relative_path).rstrip("/"))
         
+        connection = self._get_connection()
+        c = connection.cursor()
+        try:
+            node_id = self._find_nodes(c, [db_key]).get(db_key)
+            if node_id is not None:
+                for chunk in _chunks(list(self._get_subtree_nodes(c, db_key))):
+                    c.execute("DELETE FROM path_cache_entries WHERE node_id IN (%s)" % ",".join("?" * len(chunk)), chunk)
+            connection.commit()
+        finally:
+            c.close()
+        _invalidate_lookup_caches(self._db_path)
 
     def add_mapping(self, entity_type, entity_id, entity_name, path, primary=True):
         """
@@ -197,62 +878,128 @@ class PathCache(object):
         :param entity_name: a shotgun entity name
         :param path: a path on disk representing the entity.
         """
-        
-        if primary:
-            # the primary entity must be unique: path/id/type 
-            # see if there are any records for this path
-            # note that get_entity does not return secondary entities
-            curr_entity = self.get_entity(path)
-            new_entity = {"id": entity_id, "type": entity_type, "name": entity_name}
+        entity = {"type": entity_type, "id": entity_id, "name": entity_name}
+        self.add_mappings([{"entity": entity, "path": path, "primary": primary}])
+
+    def add_mappings(self, records):
+        """
+        Adds several associations to the database in a single transaction. This is
+        the same as calling add_mapping for each record in turn: associations which
+        already exist are skipped and a TankError is raised for the first one which
+        conflicts with the database or with a previous record. The records before
+        that one are still added.
+
+        :param records: list of dictionaries with keys "entity", a shotgun entity
+                        dictionary with type, id and name, "path", a path on disk
+                        representing the entity and "primary" (optional, defaults
+                        to True), whether this is the primary entry for the path.
+        """
+        batch = []
+        for record in records:
+            entity = {"type": record["entity"]["type"],
+                      "id": record["entity"]["id"],
+                      "name": record["entity"].get("name")}
+            path = record["path"]
+            try:
+                root_name, relative_path = self._separate_root(path)
+                db_key = (root_name, self._path_to_dbpath(relative_path))
+                root_error = None
+            except TankError, e:
+                # raised when the record is reached, see below
+                db_key, root_error = None, e
+            batch.append((entity, path, bool(record.get("primary", True)), db_key, root_error))
+
+        rows = []
+        connection = self._get_connection()
+        c = connection.cursor()
+        try:
+            # look up what the database holds for all the records at once
+            node_ids = self._find_nodes(c, [x[3] for x in batch if x[3]])
+            
+            # entities already registered for the paths of the records
+            db_entities = self._get_node_entities(c, node_ids.values())
             
-            if curr_entity is not None:
-                # this path is already registered. Ensure it is connected to
-                # our entity! Note! We are only comparing against the type and the id
-                # not against the name. It should be perfectly valid to rename something
-                # in shotgun and if folders are then recreated for that item, nothing happens
-                # because there is already a folder which repreents that item. (although now with 
-                # an incorrect name)
-                if curr_entity["type"] != entity_type or curr_entity["id"] != entity_id:
-    
-                    # format entities nicely for error message
-                    curr_nice_name = "%s %s (id %s)" % (curr_entity["type"], curr_entity["name"], curr_entity["id"])
-                    new_nice_name = "%s %s (id %s)" % (new_entity["type"], new_entity["name"], new_entity["id"])
-    
-                    raise TankError("The path '%s' is already associated with Shotgun "
-                                    "%s. You are trying to associate the same "
-                                    "path with %s. This typically happens "
-                                    "when shots have been relinked to new sequences, if you are "
-                                    "trying to create two shots with the same name or if "
-                                    "you have made big changes to the folder configuration. "
-                                    "Please contact support on toolkitsupport@shotgunsoftware.com "
-                                    "if you need help or advice!" % (path, curr_nice_name, new_nice_name ))
-                    
+            # paths already registered for the entities of secondary records
+            secondary_entities = [(x[0]["type"], x[0]["id"]) for x in batch if not x[2]]
+            db_entity_nodes = set(self._get_entity_nodes(c, secondary_entities))
+
+            # go through the records in order, as if each was added on its own
+            batch_entities = {}
+            batch_entity_nodes = set()
+            error = None
+            for entity, path, primary, db_key, root_error in batch:
+                node_id = node_ids.get(db_key)
+                if primary:
+                    # the primary entity must be unique: path/id/type 
+                    curr_entities = [x[0] for x in db_entities.get(node_id, []) if x[1]]
+                    if len(curr_entities) > 1:
+                        # never supposed to happen!
+                        error = TankError("More than one entry in path database for %s!" % path)
+                        break
+                    elif curr_entities:
+                        curr_entity = curr_entities[0]
+                    else:
+                        curr_entity = batch_entities.get(db_key)
+
+                    if curr_entity is not None:
+                        # this path is already registered. Ensure it is connected to
+                        # our entity! Note! We are only comparing against the type and the id
+                        # not against the name. It should be perfectly valid to rename something
+                        # in shotgun and if folders are then recreated for that item, nothing happens
+                        # because there is already a folder which repreents that item. (although now with 
+                        # an incorrect name)
+                        if curr_entity["type"] != entity["type"] or curr_entity["id"] != entity["id"]:
+                            error = self._get_conflict_error(path, curr_entity, entity)
+                            break
+                        # the entry that exists in the db matches what we are trying to insert
+                        # so skip it
+                        continue
                 else:
-                    # the entry that exists in the db matches what we are trying to insert
-                    # so skip it
-                    return
-                
-        else:
-            # secondary entity
-            # in this case, it is okay with more than one record for a path
-            # but we don't want to insert the exact same record over and over again
-            paths = self.get_paths(entity_type, entity_id, primary_only=False)
-            if path in paths:
-                # we already have the association present in the db.
-                return
-
-        # there was no entity in the db. So let's create it!
-        c = self._connection.cursor()
-        root_name, relative_path = self._separate_root(path)
-        db_path = self._path_to_dbpath(relative_path)
-        c.execute("INSERT INTO path_cache VALUES(?, ?, ?, ?, ?, ?)", (entity_type, 
-                                                                entity_id, 
-                                                                entity_name, 
-                                                                root_name,
-                                                                db_path,
-                                                                primary))
-        self._connection.commit()
-        c.close()
+                    # secondary entity
+                    # in this case, it is okay with more than one record for a path
+                    # but we don't want to insert the exact same record over and over again
+                    entity_node = (entity["type"], entity["id"], node_id)
+                    if entity_node in db_entity_nodes or (entity["type"], entity["id"], db_key) in batch_entity_nodes:
+                        # we already have the association present in the db.
+                        continue
+
+                if root_error is not None:
+                    error = root_error
+                    break
+
+                # there was no entity in the db. So let's create it!
+                rows.append((entity["type"], entity["id"], entity["name"], db_key[0], db_key[1], primary))
+                if primary:
+                    batch_entities[db_key] = entity
+                batch_entity_nodes.add((entity["type"], entity["id"], db_key))
+
+            if rows:
+                self._insert_records(c, rows)
+            connection.commit()
+        finally:
+            c.close()
+            if rows:
+                _invalidate_lookup_caches(self._db_path)
+
+        if error is not None:
+            raise error
+
+    def _get_conflict_error(self, path, curr_entity, new_entity):
+        """
+        Returns the error raised when a path is associated with another entity.
+        """
+        # format entities nicely for error message
+        curr_nice_name = "%s %s (id %s)" % (curr_entity["type"], curr_entity["name"], curr_entity["id"])
+        new_nice_name = "%s %s (id %s)" % (new_entity["type"], new_entity["name"], new_entity["id"])
+
+        return TankError("The path '%s' is already associated with Shotgun "
+                         "%s. You are trying to associate the same "
+                         "path with %s. This typically happens "
+                         "when shots have been relinked to new sequences, if you are "
+                         "trying to create two shots with the same name or if "
+                         "you have made big changes to the folder configuration. "
+                         "Please contact support on toolkitsupport@shotgunsoftware.com "
+                         "if you need help or advice!" % (path, curr_nice_name, new_nice_name ))
 
     def get_paths(self, entity_type, entity_id, primary_only=True):
         """
@@ -262,28 +1009,11 @@ class PathCache(object):
         :params entity_id: a Shotgun entity id
         :returns: a path on disk
         """
-        paths = []
-        c = self._connection.cursor()
-        if primary_only:
-            res = c.execute("SELECT root, path FROM path_cache WHERE entity_type = ? AND entity_id = ? and primary_entity = 1", (entity_type, entity_id))
-        else:
-            res = c.execute("SELECT root, path FROM path_cache WHERE entity_type = ? AND entity_id = ?", (entity_type, entity_id))
+        key = ("paths", entity_type, entity_id, primary_only)
+        return self._lookup(key, self._get_paths, entity_type, entity_id, primary_only)
 
-        for row in res:
-            root_name = row[0]
-            relative_path = row[1]
-            
-            root_path = self._roots.get(root_name)
-            if not root_path:
-                # The root name doesn't match a recognized name, so skip this entry
-                continue
-            
-            # assemble path
-            path_str = self._dbpath_to_path(root_path, relative_path)
-            paths.append(path_str)
-        
-        c.close()
-        return paths
+    def _get_paths(self, entity_type, entity_id, primary_only):
+        return self._get_paths_bulk([(entity_type, entity_id)], primary_only)[(entity_type, entity_id)]
 
     def get_entity(self, path):
         """
@@ -299,29 +1029,10 @@ class PathCache(object):
         :returns: Shotgun entity dict, e.g. {"type": "Shot", "name": "xxx", "id": 123} 
                   or None if not found
         """
-        c = self._connection.cursor()
-        try:
-            root_path, relative_path = self._separate_root(path)
-        except TankError:
-            # fail gracefully if path is not a valid path
-            # eg. doesn't belong to the project
-            return None
+        return self._lookup(("entity", path), self._get_entity, path)
 
-        db_path = self._path_to_dbpath(relative_path)
-        res = c.execute("SELECT entity_type, entity_id, entity_name FROM path_cache WHERE path = ? AND root = ? and primary_entity = 1", (db_path, root_path))
-        data = list(res)
-        c.close()
-        
-        if len(data) > 1:
-            # never supposed to happen!
-            raise TankError("More than one entry in path database for %s!" % path)
-        elif len(data) == 1:
-            # convert to string, not unicode!
-            type_str = str(data[0][0])
-            name_str = str(data[0][2])
-            return {"type": type_str, "id": data[0][1], "name": name_str }
-        else:
-            return None
+    def _get_entity(self, path):
+        return self._get_entities([path])[path]
 
     def get_secondary_entities(self, path):
         """
@@ -331,25 +1042,501 @@ class PathCache(object):
         :returns: list of shotgun entity dicts, e.g. [{"type": "Shot", "name": "xxx", "id": 123}] 
                   or [] if no entities associated.
         """
-        c = self._connection.cursor()
-        try:
-            root_path, relative_path = self._separate_root(path)
-        except TankError:
+        return self._lookup(("secondary", path), self._get_secondary_entities, path)
+
+    def _get_secondary_entities(self, path):
+        db_key = self._get_db_key(path)
+        if db_key is None:
             # fail gracefully if path is not a valid path
             # eg. doesn't belong to the project
             return []
 
-        db_path = self._path_to_dbpath(relative_path)
-        res = c.execute("SELECT entity_type, entity_id, entity_name FROM path_cache WHERE path = ? AND root = ? and primary_entity = 0", (db_path, root_path))
-        data = list(res)
-        c.close()
+        c = self._get_read_connection().cursor()
+        try:
+            node_id = self._find_nodes(c, [db_key]).get(db_key)
+            if node_id is None:
+                return []
+            entities = self._get_node_entities(c, [node_id], primary=False)
+        finally:
+            c.close()
+        return [x[0] for x in entities.get(node_id, [])]
+
+    def get_entities_for_ancestors(self, path):
+        """
+        Returns the entities of a path and of all its parent folders up to the 
+        project root, looked up with a single query.
+        
+        :param path: a path on disk
+        :returns: list of tuples (path, primary entity or None, list of secondary
+                  entities), for the path itself first and up to the project root,
+                  or to the root of the disk if the path is not in the project. 
+                  Entities are shotgun entity dicts, e.g. 
+                  {"type": "Shot", "name": "xxx", "id": 123}
+        """
+        return self._lookup(("ancestors", path), self._get_entities_for_ancestors, path)
 
-        matches = []
-        for d in data:        
-            # convert to string, not unicode!
-            type_str = str(d[0])
-            name_str = str(d[2])
-            matches.append( {"type": type_str, "id": d[1], "name": name_str } )
+    def _get_entities_for_ancestors(self, path):
+        return self._get_entities_for_ancestors_bulk([path])[path]
+    
+    def get_entities_for_ancestors_bulk(self, paths):
+        """
+        Returns the entities of several paths and of all their parent folders up
+        to the project root, looked up with a single query.
+        
+        :param paths: list of paths on disk
+        :returns: dictionary keyed by path of lists of tuples (path, primary entity
+                  or None, list of secondary entities), see get_entities_for_ancestors
+        """
+        keys = dict((x, ("ancestors", x)) for x in set(paths))
+        return self._lookup_many(keys, self._get_entities_for_ancestors_bulk)
+    
+    def _get_entities_for_ancestors_bulk(self, paths):
+        project_roots = [x.lower() for x in self._roots.values() if x]
+
+        # walk up to the project root to find all the paths to look up
+        path_ancestors = {}
+        for path in paths:
+            ancestors = []
+            curr_path = path
+            while True:
+                ancestors.append((curr_path, self._get_db_key(curr_path)))
+
+                if curr_path.lower() in project_roots:
+                    # we have reached a root!
+                    break
+
+                parent_path = os.path.abspath(os.path.join(curr_path, ".."))
+                if curr_path == parent_path:
+                    # We're at the disk root, probably a degenerate path
+                    break
+                curr_path = parent_path
+            path_ancestors[path] = ancestors
+
+        node_ids = {}
+        node_entities = {}
+        db_keys = list(set(x[1] for ancestors in path_ancestors.values() for x in ancestors if x[1]))
+        if db_keys:
+            c = self._get_read_connection().cursor()
+            try:
+                node_ids = self._find_nodes(c, db_keys)
+                node_entities = self._get_node_entities(c, node_ids.values())
+            finally:
+                c.close()
+
+        results = {}
+        for path, ancestors in path_ancestors.items():
+            result = []
+            for curr_path, db_key in ancestors:
+                entities = node_entities.get(node_ids.get(db_key), [])
+                primary_entities = [x[0] for x in entities if x[1]]
+                if len(primary_entities) > 1:
+                    # never supposed to happen!
+                    raise TankError("More than one entry in path database for %s!" % curr_path)
+                entity = primary_entities[0] if primary_entities else None
+                result.append((curr_path, entity, [x[0] for x in entities if not x[1]]))
+            results[path] = result
+        return results
+    
+    def get_child_entities(self, path):
+        """
+        Returns the entities of the folders directly below a folder. Folders which 
+        have no entities themselves but have folders with entities below them are
+        included too, folders which are not included have no entities at any level.
+        
+        :param path: a path on disk
+        :returns: dictionary of tuples (primary entity or None, list of secondary
+                  entities) keyed by folder name, or None if the path is not in
+                  the project
+        """
+        return self._lookup(("children", path), self._get_child_entities, path)
+    
+    def _get_child_entities(self, path):
+        db_key = self._get_db_key(path)
+        if db_key is None:
+            return None
+        
+        c = self._get_read_connection().cursor()
+        try:
+            node_id = self._find_nodes(c, [db_key]).get(db_key)
+            if node_id is None:
+                return {}
+            children = c.execute("SELECT id, name FROM path_cache_nodes WHERE parent_id = ?", (node_id,)).fetchall()
+            node_entities = self._get_node_entities(c, [x[0] for x in children])
+        finally:
+            c.close()
+        
+        result = {}
+        for child_id, name in children:
+            entities = node_entities.get(child_id, [])
+            primary_entities = [x[0] for x in entities if x[1]]
+            entity = primary_entities[0] if primary_entities else None
+            result[str(name)] = (entity, [x[0] for x in entities if not x[1]])
+        return result
+    
+    def get_entities(self, paths):
+        """
+        Returns the entities for several paths. This is the same as calling 
+        get_entity for each of them, with fewer queries.
+
+        :param paths: list of paths on disk
+        :returns: dictionary keyed by path of shotgun entity dicts, e.g. 
+                  {"type": "Shot", "name": "xxx", "id": 123}, or None for the
+                  paths not found
+        """
+        return self._lookup_many(dict((x, ("entity", x)) for x in paths), self._get_entities)
+
+    def _get_entities(self, paths):
+        # paths which don't belong to the project are not found
+        db_keys = dict((x, self._get_db_key(x)) for x in paths)
+
+        node_ids = {}
+        node_entities = {}
+        if [x for x in db_keys.values() if x]:
+            c = self._get_read_connection().cursor()
+            try:
+                node_ids = self._find_nodes(c, [x for x in db_keys.values() if x])
+                node_entities = self._get_node_entities(c, node_ids.values(), primary=True)
+            finally:
+                c.close()
+
+        entities = {}
+        for path in paths:
+            matches = node_entities.get(node_ids.get(db_keys[path]), [])
+            if len(matches) > 1:
+                # never supposed to happen!
+                raise TankError("More than one entry in path database for %s!" % path)
+            entities[path] = matches[0][0] if matches else None
+        return entities
+
+    def get_paths_bulk(self, entities, primary_only=True):
+        """
+        Returns the paths for several shotgun entities. This is the same as 
+        calling get_paths for each of them, with fewer queries.
+
+        :param entities: list of (entity type, entity id) tuples
+        :param primary_only: only return the paths the entities are the primary
+                             entity of
+        :returns: dictionary keyed by (entity type, entity id) of lists of paths 
+                  on disk
+        """
+        keys = dict((x, ("paths", x[0], x[1], primary_only)) for x in entities)
+        return self._lookup_many(keys, lambda x: self._get_paths_bulk(x, primary_only))
+
+    def _get_paths_bulk(self, entities, primary_only):
+        c = self._get_read_connection().cursor()
+        try:
+            entity_nodes = self._get_entity_nodes(c, entities, primary_only)
+            db_keys = self._get_db_keys(c, [x[2] for x in entity_nodes])
+        finally:
+            c.close()
+
+        paths = dict((x, []) for x in entities)
+        for entity_type, entity_id, node_id in entity_nodes:
+            root_name, db_path = db_keys[node_id]
+            root_path = self._roots.get(root_name)
+            if not root_path:
+                # The root name doesn't match a recognized name, so skip this entry
+                continue
+            paths[(entity_type, entity_id)].append(self._dbpath_to_path(root_path, db_path))
+        return paths
+
+    def get_entities_under(self, path):
+        """
+        Returns all the records of a path and of the paths below it. 
+
+        :param path: a path on disk
+        :returns: list of dictionaries with keys "entity", a shotgun entity dict,
+                  e.g. {"type": "Shot", "name": "xxx", "id": 123}, "path", the path 
+                  on disk and "primary", whether the entity is the primary entity 
+                  of the path, sorted by path.
+        """
+        root_name, relative_path = self._separate_root(path)
+        db_key = (root_name, self._path_to_dbpath(relative_path).rstrip("/"))
+        root_path = self._roots.get(root_name)
+
+        c = self._get_read_connection().cursor()
+        try:
+            node_id = self._find_nodes(c, [db_key]).get(db_key)
+            if node_id is None:
+                return []
+            subtree = self._get_subtree_nodes(c, db_key)
+            node_entities = self._get_node_entities(c, subtree.keys())
+        finally:
+            c.close()
+
+        records = []
+        for node_id in sorted(node_entities, key=lambda x: subtree[x]):
+            path = self._dbpath_to_path(root_path, db_key[1] + subtree[node_id])
+            for entity, primary in node_entities[node_id]:
+                records.append({"entity": entity, "path": path, "primary": primary})
+        return records
+
+    ########################################################################################
+    # maintenance
+
+    def get_statistics(self):
+        """
+        Returns statistics about the content and the storage of the db.
+
+        :returns: dictionary with keys 
+                  - "records", "nodes", "entity_types": number of rows of each table
+                  - "records_per_root": number of records keyed by storage root name
+                  - "records_per_entity_type": number of records keyed by entity type
+                  - "unused_nodes": number of nodes with no records at or below them 
+                  - "file_size", "free_size": size of the db file and of its free pages, 
+                    in bytes, the ratio between them being how fragmented the db is
+                  - "indexes": dictionary keyed by index name of the statistics from the 
+                    last ANALYZE, None if it was not analyzed
+                  - "query_plans": dictionary keyed by lookup of the sqlite query plans
+        """
+        stats = {}
+        c = self._get_connection().cursor()
+        try:
+            for table, key in [("path_cache_entries", "records"), 
+                               ("path_cache_nodes", "nodes"), 
+                               ("path_cache_entity_types", "entity_types")]:
+                stats[key] = c.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+
+            res = c.execute("""SELECT t.name, COUNT(*) FROM path_cache_entries e 
+                               JOIN path_cache_entity_types t ON t.id = e.entity_type_id GROUP BY t.name""")
+            stats["records_per_entity_type"] = dict((str(x[0]), x[1]) for x in res)
+
+            res = c.execute("""SELECT n.root, COUNT(*) FROM path_cache_entries e 
+                               JOIN path_cache_nodes n ON n.id = e.node_id GROUP BY n.root""")
+            stats["records_per_root"] = dict((str(x[0]), x[1]) for x in res)
+            used_nodes = [x[0] for x in c.execute("SELECT DISTINCT node_id FROM path_cache_entries")]
+            stats["unused_nodes"] = stats["nodes"] - len(self._get_used_nodes(c, used_nodes))
+
+            page_size = c.execute("PRAGMA page_size").fetchone()[0]
+            stats["file_size"] = c.execute("PRAGMA page_count").fetchone()[0] * page_size
+            stats["free_size"] = c.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+
+            indexes = {}
+            for (name,) in c.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'path_cache_%'").fetchall():
+                indexes[name] = None
+            if c.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+                for name, stat in c.execute("SELECT idx, stat FROM sqlite_stat1"):
+                    if name in indexes:
+                        indexes[name] = stat
+            stats["indexes"] = indexes
+
+            # the indexes used by the lookups
+            queries = {"path": "SELECT id FROM path_cache_nodes WHERE path IN (?)",
+                       "path entities": "SELECT entity_type_id FROM path_cache_entries WHERE node_id IN (?) AND primary_entity = 1",
+                       "entity paths": "SELECT node_id FROM path_cache_entries WHERE entity_type_id = ? AND entity_id IN (?)",
+                       "subtree": "SELECT id FROM path_cache_nodes WHERE (path = ? OR (path > ? AND path < ?)) AND root = ?",
+                       "children": "SELECT id FROM path_cache_nodes WHERE parent_id = ?"}
+            stats["query_plans"] = {}
+            for name, query in queries.items():
+                res = c.execute("EXPLAIN QUERY PLAN %s" % query, [0] * query.count("?"))
+                stats["query_plans"][name] = "; ".join(str(x[-1]) for x in res)
+        finally:
+            c.close()
+        return stats
+
+    def _get_used_nodes(self, c, node_ids):
+        """
+        Returns the given nodes and all the nodes above them.
+        """
+        parents = dict(c.execute("SELECT id, parent_id FROM path_cache_nodes"))
+        used_nodes = set()
+        for node_id in node_ids:
+            while node_id and node_id not in used_nodes:
+                used_nodes.add(node_id)
+                node_id = parents.get(node_id)
+        return used_nodes
+
+    def _execute_exclusive(self, method):
+        """
+        Runs a method taking a cursor while holding the exclusive lock on the db,
+        so that no other process reads or writes at the same time.
+        """
+        connection = self._get_connection()
+        connection.isolation_level = None
+        c = connection.cursor()
+        try:
+            try:
+                c.execute("BEGIN EXCLUSIVE")
+            except sqlite3.OperationalError, e:
+                raise TankError("Could not lock the path cache, it is in use by another "
+                                "process. Please try again later. (%s)" % e)
+            try:
+                result = method(c)
+                c.execute("COMMIT")
+            except:
+                c.execute("ROLLBACK")
+                raise
+        finally:
+            c.close()
+            connection.isolation_level = ""
+            _invalidate_lookup_caches(self._db_path)
+        return result
+
+    def upgrade_schema(self):
+        """
+        Moves the records of a db using the schema of previous versions of the 
+        core to the current schema. Previous cores can't open the db afterwards, 
+        so this is only run once none of the pipeline configurations sharing the 
+        db use them anymore. Dbs using the current schema are left untouched.
+
+        :returns: True if records were moved from the previous schema
+        """
+        self.close()
+        records_moved = self._init_db(self._db_path, upgrade=True)
+        _invalidate_lookup_caches(self._db_path)
+        return records_moved
+
+    def purge_missing_roots(self):
+        """
+        Deletes the records of storage roots which are not roots of the pipeline
+        configuration anymore.
+
+        :returns: number of records deleted, keyed by root name
+        """
+        def purge(c):
+            deleted = {}
+            for (root_name,) in c.execute("SELECT DISTINCT root FROM path_cache_nodes").fetchall():
+                if root_name in self._roots:
+                    continue
+                c.execute("DELETE FROM path_cache_entries WHERE node_id IN "
+                          "(SELECT id FROM path_cache_nodes WHERE root = ?)", (root_name,))
+                deleted[str(root_name)] = c.rowcount
+                c.execute("DELETE FROM path_cache_nodes WHERE root = ?", (root_name,))
+            return deleted
+        return self._execute_exclusive(purge)
+
+    def optimize(self, vacuum=True):
+        """
+        Deletes the nodes with no records at or below them, rebuilds the indexes,
+        updates the statistics sqlite uses to pick indexes and optionally compacts 
+        the db file. The db is locked during the operation.
+
+        :param vacuum: compact the db file, which rewrites all of it
+        :returns: number of nodes deleted
+        """
+        def optimize(c):
+            node_ids = [x[0] for x in c.execute("SELECT DISTINCT node_id FROM path_cache_entries")]
+            used_nodes = self._get_used_nodes(c, node_ids)
+            unused_nodes = [x[0] for x in c.execute("SELECT id FROM path_cache_nodes") if x[0] not in used_nodes]
+            for chunk in _chunks(unused_nodes):
+                c.execute("DELETE FROM path_cache_nodes WHERE id IN (%s)" % ",".join("?" * len(chunk)), chunk)
+            c.execute("REINDEX")
+            c.execute("ANALYZE")
+            return len(unused_nodes)
+        deleted = self._execute_exclusive(optimize)
+
+        if vacuum:
+            # vacuum takes the exclusive lock itself and can't run in a transaction
+            connection = self._get_connection()
+            connection.isolation_level = None
+            try:
+                try:
+                    connection.execute("VACUUM")
+                except sqlite3.OperationalError, e:
+                    raise TankError("Could not compact the path cache, it is in use by another "
+                                    "process. Please try again later. (%s)" % e)
+            finally:
+                connection.isolation_level = ""
+        return deleted
+
+    def _get_db_path_keys(self, paths):
+        """
+        Returns the set of (root name, db path) tuples of paths, see replace_mappings.
+        """
+        db_keys = set()
+        for path in paths:
+            root_name, relative_path = self._separate_root(path)
+            db_keys.add((root_name, self._path_to_dbpath(relative_path).rstrip("/")))
+        return db_keys
+
+    def replace_mappings(self, records, preview=False, keep_paths=None, scanned_paths=None):
+        """
+        Replaces the associations of the db with a list of records, for example
+        when the path cache is rebuilt from the folders on disk. The db is locked 
+        while the records are written.
+
+        :param records: list of dictionaries with keys "entity", "path" and "primary",
+                        see add_mappings
+        :param preview: only compare the records with the db and leave it untouched
+        :param keep_paths: list of paths whose records in the db, and the records of the
+                           paths below them, are kept rather than replaced, for instance 
+                           folders which could not be scanned. Records at the paths of 
+                           the given records are replaced all the same.
+        :param scanned_paths: list of paths the records were found under, for instance
+                              the project folders of the storage roots which were 
+                              scanned. Only the records of the db at or below them are
+                              replaced, all of them are if not specified.
+        :returns: tuple of two lists of records, the ones which are not in the db
+                  and the ones of the db which are not in the given records. The 
+                  path of records in storage roots which are not roots of the 
+                  pipeline configuration anymore is None.
+        """
+        new_rows = []
+        new_keys = set()
+        for record in records:
+            root_name, relative_path = self._separate_root(record["path"])
+            entity = record["entity"]
+            primary = bool(record.get("primary", True))
+            key = (entity["type"], entity["id"], root_name, self._path_to_dbpath(relative_path), primary)
+            if key not in new_keys:
+                new_keys.add(key)
+                new_rows.append((key[0], key[1], entity.get("name")) + key[2:])
+
+        new_paths = set(x[3:5] for x in new_rows)
+        keep_db_keys = self._get_db_path_keys(keep_paths or [])
+        scanned_db_keys = None
+        if scanned_paths is not None:
+            scanned_db_keys = self._get_db_path_keys(scanned_paths)
+
+        def is_below(root_name, db_path, db_keys):
+            # true if a db path is at or below one of the given ones
+            while True:
+                if (root_name, db_path) in db_keys:
+                    return True
+                if not db_path:
+                    return False
+                db_path = db_path.rsplit("/", 1)[0]
+
+        def is_kept(row):
+            (root_name, db_path) = row[3:5]
+            if (root_name, db_path) in new_paths:
+                return False
+            if scanned_db_keys is not None and not is_below(root_name, db_path, scanned_db_keys):
+                # for instance in a storage root which isn't mounted
+                return True
+            return is_below(root_name, db_path, keep_db_keys)
+
+        def replace(c):
+            db_rows = self._read_records(c)
+            db_keys = set((t, i, r, p, x) for t, i, n, r, p, x in db_rows)
+            kept_rows = [x for x in db_rows if is_kept(x)]
+            added = [x for x in new_rows if (x[0], x[1]) + x[3:] not in db_keys]
+            removed = [x for x in db_rows if (x[0], x[1]) + x[3:] not in new_keys and not is_kept(x)]
+            if not preview:
+                c.execute("DELETE FROM path_cache_entries")
+                c.execute("DELETE FROM path_cache_nodes")
+                for chunk in _chunks(new_rows + kept_rows, _INSERT_BATCH_SIZE):
+                    self._insert_records(c, chunk)
+            return added, removed
+
+        if preview:
+            c = self._get_connection().cursor()
+            try:
+                (added, removed) = replace(c)
+            finally:
+                c.close()
+        else:
+            (added, removed) = self._execute_exclusive(replace)
 
-        return matches
-    
\ No newline at end of file
+        diff = []
+        for rows in (added, removed):
+            diff_records = []
+            for entity_type, entity_id, entity_name, root_name, db_path, primary in rows:
+                path = None
+                if root_name in self._roots:
+                    path = self._dbpath_to_path(self._roots[root_name], db_path)
+                diff_records.append({"entity": {"type": entity_type, "id": entity_id, "name": entity_name},
+                                     "path": path,
+                                     "primary": primary})
+            diff.append(diff_records)
+        return tuple(diff)
@@ -15,6 +15,8 @@ across storages, configurations etc.
 import os
 import sys
 import glob
+import hashlib
+import tempfile
 
 from tank_vendor import yaml
 
@@ -324,6 +326,62 @@ class PipelineConfiguration(object):
         """
         return os.path.join(self.get_primary_data_root(), "tank", "cache", constants.CACHE_DB_FILENAME)
 
+    def get_path_cache_replica_location(self):
+        """
+        Returns the path to the local read replica of the path cache, or None if
+        reads should go to the path cache itself. 
+        
+        The replica is enabled by the TANK_PATH_CACHE_REPLICA environment variable or
+        else by the path_cache_replica setting in pipeline_configuration.yml. Both 
+        can be a directory to keep the replica in or true to keep it in the temp 
+        location of the machine.
+        """
+        value = os.environ.get(constants.PATH_CACHE_REPLICA_ENV_VAR)
+        if value is None:
+            data = get_pc_disk_metadata(self._pc_root)
+            value = data.get("path_cache_replica")
+        elif value.lower() in ("0", "false", ""):
+            value = False
+        elif value.lower() in ("1", "true"):
+            value = True
+            
+        if not value:
+            return None
+        
+        if value is True:
+            replica_folder = os.path.join(tempfile.gettempdir(), constants.PATH_CACHE_REPLICA_FOLDER)
+        else:
+            replica_folder = os.path.expanduser(os.path.expandvars(value))
+        
+        # one replica per path cache
+        master_path = self.get_path_cache_location()
+        file_name = "%s_%s" % (hashlib.md5(master_path).hexdigest(), constants.CACHE_DB_FILENAME)
+        return os.path.join(replica_folder, file_name)
+
+    def get_path_cache_lookup_ttl(self):
+        """
+        Returns the number of seconds path cache lookups are cached for, 0 when 
+        they are not cached. This is set by path_cache_lookup_ttl in
+        pipeline_configuration.yml.
+        """
+        data = get_pc_disk_metadata(self._pc_root)
+        ttl = data.get("path_cache_lookup_ttl")
+        if ttl is None:
+            return constants.PATH_CACHE_LOOKUP_TTL
+        return ttl
+
+    def get_shotgun_fields_cache_ttl(self):
+        """
+        Returns the number of seconds the Shotgun field values of template keys are
+        cached for, 0 when they are not cached. This is set by shotgun_fields_cache_ttl
+        in pipeline_configuration.yml.
+        """
+        data = get_pc_disk_metadata(self._pc_root)
+        ttl = data.get("shotgun_fields_cache_ttl")
+        if ttl is None:
+            return constants.SHOTGUN_FIELDS_CACHE_TTL
+        return ttl
+
 
     ########################################################################################
     # paths, core info, apps and engines
@@ -447,6 +505,24 @@ class PipelineConfiguration(object):
         """
         return os.path.join(self._pc_root, "cache")
 
+    def get_templates_cache_location(self):
+        """
+        Returns the path to the file caching the templates for the current platform
+        """
+        return os.path.join(self.get_cache_location(), constants.TEMPLATES_CACHE_FILENAME % sys.platform)
+
+    def get_templates_fields_cache_size(self):
+        """
+        Returns how many get_fields results each template caches, 0 when the
+        cache is disabled. This is set by templates_fields_cache_size in
+        pipeline_configuration.yml.
+        """
+        data = get_pc_disk_metadata(self._pc_root)
+        size = data.get("templates_fields_cache_size")
+        if size is None:
+            return constants.TEMPLATES_FIELDS_CACHE_SIZE
+        return size
+
 
     ########################################################################################
     # configuration
@@ -500,11 +576,16 @@ class PipelineConfiguration(object):
 
         return Environment(env_file, self, context)
 
-    def get_templates_config(self):
+    def get_templates_config(self, included_files=None):
         """
         Returns the templates configuration as an object
+
+        :param included_files: Optional list to which the paths of the templates
+                               file and of the files it includes are appended.
         """
         templates_file = os.path.join(self._pc_root, "config", "core", constants.CONTENT_TEMPLATES_FILE)
+        if included_files is not None:
+            included_files.append(templates_file)
 
         if os.path.exists(templates_file):
             config_file = open(templates_file, "r")
@@ -516,7 +597,7 @@ class PipelineConfiguration(object):
             data = {}
 
         # and process include files
-        data = template_includes.process_includes(templates_file, data)
+        data = template_includes.process_includes(templates_file, data, included_files)
 
         return data
 
@@ -175,9 +175,44 @@ SHELL_ENGINE = "tk-shell"
 # the name of the file that holds the path cache
 CACHE_DB_FILENAME = "path_cache.db"
 
+# environment variable enabling the local read replica of the path cache: either a
+# directory to keep the replica in, "1" for the default location or "0" to disable
+# it. Overrides the path_cache_replica setting in pipeline_configuration.yml
+PATH_CACHE_REPLICA_ENV_VAR = "TANK_PATH_CACHE_REPLICA"
+
+# folder in the temp location where the path cache replicas are kept by default
+PATH_CACHE_REPLICA_FOLDER = "tank_path_cache"
+
+# number of seconds path cache lookups are cached for, unless set by the 
+# path_cache_lookup_ttl setting in pipeline_configuration.yml. Lookups are not
+# cached by default, as entries written by other processes would be missed for
+# that long
+PATH_CACHE_LOOKUP_TTL = 0
+
+# number of path cache lookups cached for each pipeline configuration
+PATH_CACHE_LOOKUP_CACHE_SIZE = 10000
+
+# number of threads listing directories when the path cache is rebuilt from disk
+PATH_CACHE_REBUILD_THREADS = 8
+
+# number of seconds the shotgun field values of template keys are cached for, unless
+# set by the shotgun_fields_cache_ttl setting in pipeline_configuration.yml
+SHOTGUN_FIELDS_CACHE_TTL = 60
+
+# number of shotgun entities whose field values are cached for each tk instance
+SHOTGUN_FIELDS_CACHE_SIZE = 1000
+
 # the name of the file that holds the templates.yml config
 CONTENT_TEMPLATES_FILE = "templates.yml"
 
+# the name of the file that caches the templates read from the templates.yml config,
+# one per platform since roots are platform specific
+TEMPLATES_CACHE_FILENAME = "templates_%s.cache"
+
+# number of get_fields results cached by each template, unless set by the
+# templates_fields_cache_size setting in pipeline_configuration.yml
+TEMPLATES_FIELDS_CACHE_SIZE = 500
+
 # the name of the file that holds the inverse root defs
 CONFIG_BACK_MAPPING_FILE = "tank_configs.yml"
 
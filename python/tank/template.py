@@ -15,12 +15,16 @@ Management of file and directory templates.
 
 import os
 import re
+import UserDict
 
 from tank_vendor import yaml
 
 from . import templatekey
+from . import template_cache
 from .errors import TankError
 from .platform import constants
+from .util.lru_cache import LRUCache
+from .util import memory
 
 
 
@@ -29,6 +33,11 @@ class Template(object):
     Object which manages the translation between paths and file templates
     """
     _key_name_regex = "[a-zA-Z_ 0-9]+"
+
+    # long running processes hold the templates of many configurations
+    __slots__ = ("name", "_repr_def", "_keys", "_required_keys", "_section_keys",
+                 "_section_lengths", "_section_order", "_tokens", "_prefix", "_variations",
+                 "_matcher", "_fields_cache", "__weakref__")
     
     
     @classmethod
@@ -77,33 +86,45 @@ class Template(object):
         """
         self.name = name
         # version for __repr__
-        self._repr_def = self._fix_key_names(definition, keys)
-
-        variations = self._definition_variations(definition)
-        # We want them most inclusive(longest) version first
-        variations.sort(cmp=lambda x, y: cmp(len(x), len(y)), reverse=True)
-
-        # get format keys and types
-        self._keys = []
-        self._ordered_keys = []
-        for variation in variations:
-            var_keys, ordered_keys = self._keys_from_definition(variation, name, keys)
-            self._keys.append(var_keys)
-            self._ordered_keys.append(ordered_keys)
-
-        # substitute aliased key names
-        self._definitions = []
-        for variation in variations:
-            self._definitions.append(self._fix_key_names(variation, keys))
-
-        # get defintion ready for string substitution
-        self._cleaned_definitions = []
-        for definition in self._definitions:
-            self._cleaned_definitions.append(self._clean_definition(definition))
+        self._repr_def = _intern_string(self._fix_key_names(definition, keys))
+
+        sections = self._split_definition(definition)
+
+        # get format keys and types, the required keys are those of the
+        # variation without optional sections
+        self._keys, _ = self._keys_from_definition(definition, name, keys)
+        required_definition = "".join([token for token, optional in sections if not optional])
+        self._required_keys, _ = self._keys_from_definition(required_definition, name, keys)
+        self._section_keys = [self._keys_from_definition(token, name, keys)[0]
+                              for token, optional in sections if optional]
+        # the variations are tried from the longest as written in the definition
+        self._section_lengths = tuple([len(token) for token, optional in sections if optional])
+
+        # definition with substituted aliased key names, as a list of (token,
+        # index of its optional section or None) tuples
+        self._tokens = []
+        for token, optional in self._split_definition(self._repr_def):
+            section = None
+            if optional:
+                section = len([x for x in self._tokens if x[1] is not None])
+            self._tokens.append((_intern_string(token), section))
 
         # string which will be prefixed to definition
         self._prefix = ''
-        self._static_tokens = []
+        # variations of the definition built so far, keyed by their optional section flags
+        self._variations = {}
+        # optional section flags of all the variations in order of precedence, see _get_section_order
+        self._section_order = None
+        # matcher for the definition with its optional sections
+        self._matcher = None
+        # results of get_fields, see set_fields_cache_size
+        self._fields_cache = None
+
+    def __getstate__(self):
+        return templatekey._get_slots_state(self)
+
+    def __setstate__(self, state):
+        templatekey._set_slots_state(self, state)
 
     def __repr__(self):
         class_name = self.__class__.__name__
@@ -117,8 +138,8 @@ class Template(object):
         """
         Property to access Template definition.
         """
-        # Use first definition as it should be most inclusive in case of variations
-        return self._definitions[0]
+        # Use the variation with every optional section as it is the most inclusive
+        return self._get_variation((True,) * len(self._section_lengths)).definition
 
 
     @property
@@ -129,8 +150,7 @@ class Template(object):
         :returns: a dictionary of TemplateKey objects, keyed by TemplateKey name.
         :rtype: dictionary 
         """
-        # First keys should be most inclusive
-        return self._keys[0].copy()
+        return self._keys.copy()
 
     def is_optional(self, key_name):
         """
@@ -142,7 +162,7 @@ class Template(object):
         """
         # the key is required if it's in the 
         # minimum set of keys for this template
-        if key_name in min(self._keys):
+        if key_name in self._required_keys:
             # this key is required
             return False
         else:
@@ -168,9 +188,7 @@ class Template(object):
                   values of None.
         :rtype: list
         """
-        # find shortest keys dictionary
-        keys = min(self._keys)
-        return self._missing_keys(fields, keys, skip_defaults)
+        return self._missing_keys(fields, self._required_keys, skip_defaults)
 
     def _missing_keys(self, fields, keys, skip_defaults):
         """
@@ -199,6 +217,103 @@ class Template(object):
         """
         return self._apply_fields(fields)
 
+    def apply_fields_many(self, base_fields, varying):
+        """
+        Creates paths for every combination of values of some varying fields, for
+        example all the frames of a sequence:
+
+            >>> template.apply_fields_many(fields, {"SEQ": xrange(1001, 1101)})
+
+        This returns the same paths as calling apply_fields for each combination
+        but the fixed fields are only validated once and the paths are built with
+        a format string prepared for the varying fields.
+
+        :param base_fields: Mapping of keys to fields which are the same for all paths.
+        :type base_fields: Dictionary
+        :param varying: Values for the varying fields, either a dictionary of key
+                        names to lists of values or a list of (key name, values)
+                        pairs. With several varying fields the paths cover all
+                        the combinations, the last key varying fastest. Keys of a
+                        dictionary are taken in alphabetical order.
+        :type varying: Dictionary or list
+
+        :returns: Paths in the order of the combinations of varying values.
+        :rtype: List of strings
+        """
+        if isinstance(varying, dict):
+            varying = sorted(varying.items())
+        key_names = [key_name for key_name, _ in varying]
+        values_lists = [list(values) for _, values in varying]
+
+        if not all(values_lists):
+            return []
+
+        all_keys = self._keys
+        if any(None in values and all_keys.get(key_name, None) is not None
+               and all_keys[key_name].default is None
+               for key_name, values in zip(key_names, values_lists)):
+            # missing values may pick another variation for each path
+            paths = []
+            for values in _product(*values_lists):
+                fields = dict(base_fields)
+                fields.update(zip(key_names, values))
+                paths.append(self._apply_fields(fields))
+            return paths
+
+        # a value for each varying key is enough to pick the variation
+        fields = dict(base_fields)
+        fields.update([(key_name, values[0]) for key_name, values in zip(key_names, values_lists)])
+        variation = self._get_variation(self._get_section_flags(fields))
+        keys = variation.keys
+
+        processed_fields = {}
+        for key_name, key in keys.items():
+            if key_name not in key_names:
+                processed_fields[key_name] = key.str_from_value(fields.get(key_name))
+
+        str_lists = []
+        for key_name, values in zip(key_names, values_lists):
+            if key_name in keys:
+                str_lists.append(keys[key_name].strs_from_values(values))
+            else:
+                # ignored by the template, only repeats the paths
+                str_lists.append([None] * len(values))
+
+        (format_string, format_keys) = self._get_format_string(variation.definition,
+                                                               processed_fields, key_names)
+        combinations = _product(*str_lists)
+        positions = [key_names.index(key_name) for key_name in format_keys]
+        if positions != range(len(key_names)):
+            combinations = (tuple([values[x] for x in positions]) for values in combinations)
+        return self._format_many(format_string, combinations)
+
+    def _get_format_string(self, definition, processed_fields, varying_key_names):
+        """
+        Builds a format string for a variation of the definition, with the
+        processed fields filled in and a %s for each occurrence of a varying key.
+
+        :returns: Tuple of the format string and the names of the varying keys,
+                  in the order of their %s in the string.
+        """
+        tokens = re.split(r"{(%s)}" % self._key_name_regex, definition)
+        format_tokens = []
+        format_keys = []
+        for token_index, token in enumerate(tokens):
+            if token_index % 2 == 0:
+                format_tokens.append(token.replace("%", "%%"))
+            elif token in varying_key_names:
+                format_tokens.append("%s")
+                format_keys.append(token)
+            else:
+                format_tokens.append(processed_fields[token].replace("%", "%%"))
+        return "".join(format_tokens), format_keys
+
+    def _format_many(self, format_string, combinations):
+        """
+        Formats a string with each tuple of values.
+        """
+        return [format_string % values for values in combinations]
+
     def _apply_fields(self, fields, ignore_types=None):
         """
         Creates path using fields.
@@ -215,58 +330,117 @@ class Template(object):
         """
         ignore_types = ignore_types or []
 
-        # find largest key mapping without missing values
-        keys = None
-        # index of matching keys will be used to find cleaned_definition
-        index = -1
-        for index, cur_keys in enumerate(self._keys):
-            missing_keys = self._missing_keys(fields, cur_keys, skip_defaults=True)
-            if not missing_keys:
-                keys = cur_keys
-                break
-
-        
-        if keys is None:
-            raise TankError("Tried to resolve a path from the template %s and a set "
-                            "of input fields '%s' but the following required fields were missing "
-                            "from the input: %s" % (self, fields, missing_keys))
+        variation = self._get_variation(self._get_section_flags(fields))
 
         # Process all field values through template keys 
         processed_fields = {}
-        for key_name, key in keys.items():
+        for key_name, key in variation.keys.items():
             value = fields.get(key_name)
             ignore_type =  key_name in ignore_types
             processed_fields[key_name] = key.str_from_value(value, ignore_type=ignore_type)
 
-        return self._cleaned_definitions[index] % processed_fields
+        return variation.cleaned_definition % processed_fields
+
+    def _get_section_flags(self, fields):
+        """
+        Finds the largest variation of the definition which has values for all its
+        keys, which has every optional section whose keys all have values.
+
+        :param fields: Mapping of keys to fields.
+
+        :returns: Tuple of flags telling for each optional section if the variation has it.
+        :throws: TankError if a required field is missing.
+        """
+        missing_keys = self._missing_keys(fields, self._required_keys, skip_defaults=True)
+        if missing_keys:
+            raise TankError("Tried to resolve a path from the template %s and a set "
+                            "of input fields '%s' but the following required fields were missing "
+                            "from the input: %s" % (self, fields, missing_keys))
+        return tuple([not self._missing_keys(fields, section_keys, skip_defaults=True)
+                      for section_keys in self._section_keys])
+
+    def _get_variation(self, sections):
+        """
+        Returns a variation of the definition, built the first time it is needed.
+
+        :param sections: Tuple of flags telling for each optional section if the
+                         variation has it.
 
-    def _definition_variations(self, definition):
+        :returns: _Variation instance.
         """
-        Determines all possible definition based on combinations of optional sectionals.
+        variation = self._variations.get(sections)
+        if variation is None:
+            definition = "".join([token for token, section in self._tokens
+                                  if section is None or sections[section]])
+            variation = _Variation(self, definition)
+            self._variations[sections] = variation
+        return variation
+
+    def _get_variations(self):
+        """
+        Returns all the variations of the definition, in order of precedence.
+        """
+        return [self._get_variation(x) for x in self._get_section_order()]
+
+    def _get_section_order(self, sections=None):
+        """
+        Returns the optional section flags of the variations in order of precedence,
+        see _sort_sections.
+
+        :param sections: Optional tuple telling for each optional section if the
+                         variations have it, None for the sections they may have or not.
+        """
+        if self._section_order is None:
+            self._section_order = self._sort_sections(self._section_lengths)
+        if sections is None:
+            return self._section_order
+        allowed = set(_product(*[(True, False) if x is None else (x,) for x in sections]))
+        return [x for x in self._section_order if x in allowed]
+
+    @classmethod
+    def _sort_sections(cls, section_lengths, sections=None):
+        """
+        Returns the optional section flags of variations in order of precedence:
+        the longest variations come first and variations of the same length are
+        kept in the order they are generated in, without the first sections first.
         
-        "{manne}"               ==> ['{manne}']
-        "{manne}_{ludde}"       ==> ['{manne}_{ludde}']
-        "{manne}[_{ludde}]"     ==> ['{manne}', '{manne}_{ludde}']
-        "{manne}_[{foo}_{bar}]" ==> ['{manne}_', '{manne}_{foo}_{bar}']
+        :param section_lengths: Length of each optional section.
+        :param sections: Optional tuple telling for each optional section if the
+                         variations have it, None for the sections they may have or not.
         
+        :returns: List of tuples of flags.
         """
-        # split definition by optional sections
-        tokens = re.split("(\[[^]]*\])", definition)
+        if sections is None:
+            sections = (None,) * len(section_lengths)
+        all_flags = _product(*[(True, False) if x is None else (x,) for x in sections])
+
+        def precedence(flags):
+            length = sum([x for x, flag in zip(section_lengths, flags) if flag])
+            order = sum([1 << x for x, flag in enumerate(flags) if flag])
+            return (-length, order)
 
-        # seed with empty string
-        definitions = ['']
-        for token in tokens:
-            temp_definitions = []
+        return sorted(all_flags, key=precedence)
+
+    @classmethod
+    def _split_definition(cls, definition):
+        """
+        Splits a definition into its optional and required sections.
+
+        "{manne}_[{foo}_{bar}]" ==> [('{manne}_', False), ('{foo}_{bar}', True)]
+
+        :returns: List of (section without brackets, is optional) tuples.
+        """
+        sections = []
+        # split definition by optional sections
+        for token in re.split("(\[[^]]*\])", definition):
             # regex return some blank strings, skip them
             if token == '':
                 continue
-            if token.startswith('['):
+            optional = token.startswith('[')
+            if optional:
                 # check that optional contains a key
-                if not re.search("{*%s}" % self._key_name_regex, token): 
+                if not re.search("{*%s}" % cls._key_name_regex, token): 
                     raise TankError("Optional sections must include a key definition.")
-
-                # Add definitions skipping this optional value
-                temp_definitions = definitions[:]
                 # strip brackets from token
                 token = re.sub('[\[\]]', '', token)
 
@@ -274,17 +448,27 @@ class Template(object):
             if re.search("[\[\]]", token): 
                 raise TankError("Square brackets are not allowed outside of optional section definitions.")
 
-            # make defintions with token appended
-            for definition in definitions:
-                temp_definitions.append(definition + token)
+            sections.append((token, optional))
+        return sections
 
-            definitions = temp_definitions
+    @classmethod
+    def _check_definition(cls, definition, keys, name=None):
+        """
+        Raises the errors creating a template from a definition would raise,
+        without creating the template.
 
-        return definitions
+        :param definition: Template definition.
+        :param keys: Mapping of key names to keys.
+        :param name: (Optional) name of the template.
+        """
+        cls._split_definition(definition)
+        # every key of the variations appears in the full definition
+        cls._keys_from_definition(definition, name, keys)
 
 
 
-    def _fix_key_names(self, definition, keys):
+    @classmethod
+    def _fix_key_names(cls, definition, keys):
         """
         Substitutes key name for name used in definition
         """
@@ -300,7 +484,7 @@ class Template(object):
         # Create definition with key names as strings with no format, enum or default values
         regex = r"{(%s)}" % self._key_name_regex
         cleaned_definition = re.sub(regex, "%(\g<1>)s", definition)
-        return cleaned_definition
+        return _intern_string(cleaned_definition)
 
     def _calc_static_tokens(self, definition):
         """
@@ -310,7 +494,44 @@ class Template(object):
         regex = r"{%s}" % self._key_name_regex
         tokens = re.split(regex, expanded_definition.lower())
         # Remove empty strings
-        return [x for x in tokens if x]
+        return [_intern_string(x) for x in tokens if x]
+
+    @classmethod
+    def _normalize_definition(cls, definition):
+        """
+        Returns a definition in the form used for the definition variations.
+        """
+        return definition
+
+    @classmethod
+    def _matcher_definition(cls, definition):
+        """
+        Returns a definition with its optional sections in the form used for the
+        definition variations, or None if its variations don't all have that form.
+
+        :param definition: Definition using the keys' names rather than their aliases.
+        """
+        # the prefix is left out of variations starting with a separator, see
+        # _calc_static_tokens, which the matcher only does for the whole definition
+        if not definition.startswith(os.path.sep):
+            for token, optional in cls._split_definition(definition):
+                if token.startswith(os.path.sep):
+                    return None
+                if not optional:
+                    break
+        return definition
+
+    def _calc_matcher(self):
+        """
+        Compiles a path matcher for the definition with its optional sections.
+
+        :returns: TemplatePathMatcher or None if the variations have to be
+                  parsed one by one.
+        """
+        definition = self._matcher_definition(self._repr_def)
+        if definition is None:
+            return None
+        return TemplatePathMatcher(self._prefix, definition, self._keys)
 
     @property
     def parent(self):
@@ -319,6 +540,41 @@ class Template(object):
         """
         raise NotImplementedError
 
+    def _can_locate_key(self, key_name):
+        """
+        Checks if _locate_key can find the value of a key in paths.
+        """
+        return self._matcher is not None and self._matcher.can_locate_key(key_name)
+
+    def _locate_key(self, input_path, key_name):
+        """
+        Finds the value of a key in a normalized path, without validating the value
+        nor the rest of the path. Only for keys for which _can_locate_key is True.
+
+        :returns: Tuple of start and end indexes of the key's value in the path,
+                  None if the path doesn't match or has no value for the key.
+        """
+        return self._matcher.locate_key(input_path, key_name)
+
+    def _get_segments(self):
+        """
+        Returns the path segments matched by each definition variation in order of
+        precedence, see TemplatePathMatcher.get_segments, or None if the definition
+        can't be split into segments.
+        """
+        if self._matcher is None or not self._matcher.is_compilable():
+            return None
+        return [self._matcher.get_segments(x) for x in self._get_section_order()]
+
+    def _get_segment_keys(self):
+        """
+        Returns the keys found in the path segments of each definition variation,
+        see TemplatePathMatcher.get_segment_keys and _get_segments.
+        """
+        if self._matcher is None or not self._matcher.is_compilable():
+            return None
+        return [self._matcher.get_segment_keys(x) for x in self._get_section_order()]
+
 
     def validate(self, path, fields=None, skip_keys=None):
         """
@@ -359,17 +615,86 @@ class Template(object):
         :returns: Values found in the path based on keys in template
         :rtype: Dictionary
         """
-        path_parser = None
-        fields = None
+        if self._fields_cache is None:
+            return self._get_fields(input_path, skip_keys)
+
+        cache_key = (input_path, frozenset(skip_keys or []))
+        # paths which don't fit are cached too, validate mostly sees those
+        (fields, error) = self._fields_cache.get(cache_key, (None, None))
+        if fields is None and error is None:
+            try:
+                fields = self._get_fields(input_path, skip_keys)
+            except TankError, e:
+                error = str(e)
+            self._fields_cache.set(cache_key, (fields, error))
+        if error is not None:
+            raise TankError(error)
+        # callers are free to modify the fields they get
+        return fields.copy()
+
+    def set_fields_cache_size(self, size):
+        """
+        Sets how many get_fields results are cached. Parsing a path again
+        returns a copy of the cached fields.
+
+        :param size: Maximum number of cached results, 0 or None disables the cache.
+        """
+        if size:
+            self._fields_cache = LRUCache(size)
+        else:
+            self._fields_cache = None
 
-        for ordered_keys, static_tokens in zip(self._ordered_keys, self._static_tokens):
-            path_parser = TemplatePathParser(ordered_keys, static_tokens)
+    def clear_fields_cache(self):
+        """
+        Discards the cached get_fields results.
+        """
+        if self._fields_cache is not None:
+            self._fields_cache.clear()
+
+    def get_fields_cache_stats(self):
+        """
+        Returns statistics about the get_fields cache.
+
+        :returns: Dictionary with the number of lookups which found a result
+                  ("hits"), which didn't ("misses") and the number of results
+                  cached ("size"), or None if the cache is disabled.
+        """
+        if self._fields_cache is None:
+            return None
+        return {"hits": self._fields_cache.hits,
+                "misses": self._fields_cache.misses,
+                "size": len(self._fields_cache)}
+
+    def _get_fields(self, input_path, skip_keys):
+        """
+        Extracts key name, value pairs from a string, see get_fields.
+        """
+        last_error = "Tried to extract fields from path '%s', but path does not fit the template." % input_path
+
+        sections = None
+        if self._matcher is not None and self._matcher.is_compiled(skip_keys):
+            # a single match finds the values and which variations the path may fit,
+            # the path doesn't fit the others
+            sections, fields, last_error = self._matcher.match(input_path, skip_keys)
+            if sections is None:
+                raise TankError("Template %s: %s" % (str(self), last_error))
+            if fields:
+                return fields
+
+        # parse the variations the path may fit one by one, in order of precedence
+        fields = None
+        for flags in self._get_section_order(sections):
+            variation = self._get_variation(flags)
+            path_parser = TemplatePathParser(variation.ordered_keys, variation.static_tokens)
             fields = path_parser.parse_path(input_path, skip_keys)
+            last_error = path_parser.last_error
             if fields:
-                break
+                return fields
 
-        if fields is None:
-            raise TankError("Template %s: %s" % (str(self), path_parser.last_error))
+        if fields is None or True in flags:
+            # empty fields are only found for the variation without optional
+            # sections, the path does not fit the variations after the others
+            raise TankError("Template %s: %s" % (str(self), last_error))
 
         return fields
 
@@ -378,6 +703,8 @@ class TemplatePath(Template):
     """
     Class for templates for paths.
     """
+    __slots__ = ()
+
     def __init__(self, definition, keys, root_path, name=None):
         """
         :param definition: Template definition.
@@ -393,24 +720,97 @@ class TemplatePath(Template):
         super(TemplatePath, self).__init__(definition, keys, name=name)
         self._prefix = root_path
 
-        # Make definition use platform seperator
-        for index, rel_definition in enumerate(self._definitions):
-            self._definitions[index] = os.path.join(*split_path(rel_definition))
-
-        # get defintion ready for string substitution
-        self._cleaned_definitions = []
-        for definition in self._definitions:
-            self._cleaned_definitions.append(self._clean_definition(definition))
-
-        # split by format strings the definition string into tokens 
-        self._static_tokens = []
-        for definition in self._definitions:
-            self._static_tokens.append(self._calc_static_tokens(definition))
+        self._matcher = self._calc_matcher()
 
     @property
     def root_path(self):
         return self._prefix
 
+    @classmethod
+    def _normalize_definition(cls, definition):
+        # Make definition use platform seperator
+        return os.path.join(*split_path(definition))
+
+    @classmethod
+    def _matcher_definition(cls, definition):
+        # the definition is normalized with its optional sections, which is only
+        # the form of its variations if leaving sections out doesn't leave empty
+        # or relative segments in the path, and if normalizing doesn't remove keys
+        # the variations are parsed with
+        sections = cls._split_definition(definition)
+        normalized = cls._normalize_definition(definition)
+        try:
+            normalized_sections = cls._split_definition(normalized)
+        except TankError:
+            return None
+
+        key_regex = r"{%s}" % cls._key_name_regex
+        if re.findall(key_regex, definition) != re.findall(key_regex, normalized):
+            return None
+        if ([re.findall(key_regex, token) for token, optional in sections if optional] !=
+                [re.findall(key_regex, token) for token, optional in normalized_sections if optional]):
+            return None
+        for with_sections in (True, False):
+            variation = "".join([token for token, optional in sections if with_sections or not optional])
+            normalized_variation = "".join([token for token, optional in normalized_sections
+                                            if with_sections or not optional])
+            if cls._normalize_definition(variation) != normalized_variation:
+                return None
+        if not cls._has_normalized_variations(normalized_sections):
+            return None
+        return normalized
+
+    @classmethod
+    def _has_normalized_variations(cls, sections):
+        """
+        Checks that no variation of a normalized definition has an empty, "." or
+        ".." path segment. The variations are not built, the possible values of
+        the segment being read are followed through the sections instead.
+
+        :param sections: Definition split by _split_definition.
+        """
+        # the segment being read, keys and other characters count as "x"
+        segments = set([""])
+        for token, optional in sections:
+            token = re.sub(r"{%s}" % cls._key_name_regex, "x", token)
+            next_segments = set()
+            if optional:
+                next_segments.update(segments)
+            for segment in segments:
+                for char in token:
+                    if char == os.path.sep:
+                        if segment in ("", ".", ".."):
+                            return False
+                        segment = ""
+                    else:
+                        segment += char
+                        if segment not in (".", ".."):
+                            segment = "x"
+                next_segments.add(segment)
+            segments = next_segments
+        return not segments.intersection(["", ".", ".."])
+
+    @classmethod
+    def _definition_segments(cls, definition, keys, root_path, name=None):
+        """
+        Splits each variation of a definition into the path segments it matches,
+        as the matcher of the template would, without creating the template.
+
+        :returns: List of segments per variation, see TemplatePathMatcher.get_segments,
+                  or None if the definition can't be split.
+        :raises TankError: If the definition is not valid.
+        """
+        sections = cls._split_definition(definition)
+        definition_keys, _ = cls._keys_from_definition(definition, name, keys)
+        matcher_definition = cls._matcher_definition(cls._fix_key_names(definition, keys))
+        if matcher_definition is None:
+            return None
+        matcher = TemplatePathMatcher(root_path, matcher_definition, definition_keys, lazy=True)
+        if not matcher.is_compilable():
+            return None
+        section_lengths = [len(token) for token, optional in sections if optional]
+        return [matcher.get_segments(x) for x in cls._sort_sections(section_lengths)]
+
     @property
     def parent(self):
         """
@@ -428,20 +828,27 @@ class TemplatePath(Template):
         relative_path = super(TemplatePath, self)._apply_fields(fields, ignore_types)
         return os.path.join(self.root_path, relative_path)
 
+    def _format_many(self, format_string, combinations):
+        if format_string.startswith("%s"):
+            # whether the root is joined depends on the value
+            relative_paths = super(TemplatePath, self)._format_many(format_string, combinations)
+            return [os.path.join(self.root_path, x) for x in relative_paths]
+        format_string = os.path.join(self.root_path.replace("%", "%%"), format_string)
+        return super(TemplatePath, self)._format_many(format_string, combinations)
+
 
 class TemplateString(Template):
     """
     Template class for templates not representing paths.
     """
+    __slots__ = ("validate_with",)
+
     def __init__(self, definition, keys, name=None, validate_with=None):
         super(TemplateString, self).__init__(definition, keys, name=name)
         self.validate_with = validate_with
         self._prefix = "@"
 
-        # split by format strings the definition string into tokens 
-        self._static_tokens = []
-        for definition in self._definitions:
-            self._static_tokens.append(self._calc_static_tokens(definition))
+        self._matcher = self._calc_matcher()
     
     @property
     def parent(self):
@@ -468,6 +875,55 @@ class TemplateString(Template):
         return super(TemplateString, self).get_fields(adj_path, skip_keys=skip_keys)
 
 
+class _Variation(object):
+    """
+    A definition with some of its optional sections, in the form used to
+    apply fields and to parse paths.
+    """
+    __slots__ = ("definition", "cleaned_definition", "keys", "ordered_keys", "static_tokens")
+
+    def __init__(self, template, definition):
+        """
+        :param template: Template the variation belongs to.
+        :param definition: Definition of the variation, using the keys' names
+                           rather than their aliases, before it is normalized.
+        """
+        self.keys, self.ordered_keys = template._keys_from_definition(definition, template.name,
+                                                                      template._keys)
+        definition = template._normalize_definition(definition)
+        self.definition = _intern_string(definition)
+        # get defintion ready for string substitution
+        self.cleaned_definition = template._clean_definition(definition)
+        # split by format strings the definition string into tokens
+        self.static_tokens = template._calc_static_tokens(definition)
+
+    def __getstate__(self):
+        return templatekey._get_slots_state(self)
+
+    def __setstate__(self, state):
+        templatekey._set_slots_state(self, state)
+
+
+
+def _intern_string(value):
+    """
+    Returns the interned version of a byte string, so that equal strings in the
+    templates of different configurations are stored once.
+    """
+    if type(value) is str:
+        return intern(value)
+    return value
+
+
+def _product(*lists):
+    """
+    Returns the cartesian product of lists, as a list of tuples in the order of
+    itertools.product which is not available in python 2.5.
+    """
+    combinations = [()]
+    for values in lists:
+        combinations = [x + (value,) for x in combinations for value in values]
+    return combinations
 
 
 def split_path(input_path):
@@ -673,16 +1129,466 @@ class TemplatePathParser(object):
         
         return value
 
+
+class TemplatePathMatcher(object):
+    """
+    Compiled counterpart of TemplatePathParser.
+
+    A definition is compiled into an anchored regular expression with a named
+    group per key occurrence, built from the key's type, choices and filter.
+    Static tokens match regardless of case. Each optional section of a definition
+    becomes an optional group of the expression, so that the expression grows
+    linearly with the number of sections. Values are only accepted where
+    TemplatePathParser would find them, and are validated by their keys, the
+    values of a repeated key being compared as the parser does.
+
+    A path may fit several variations of a definition, see match for how the
+    first one in order of precedence is found.
+
+    Definitions without a prefix, or with a variation which does not start with
+    a static token or which has two keys next to each other, are not compiled
+    and are parsed by TemplatePathParser.
+    """
+    def __init__(self, prefix, definition, keys, lazy=False):
+        """
+        :param prefix: String prefixed to the definition.
+        :param definition: Definition using the keys' names rather than their aliases.
+                           May contain optional sections.
+        :param keys: Mapping of key names to keys used in the definition.
+        :param lazy: If True, the definition is compiled on first use.
+        """
+        self._key_names = frozenset(keys)
+        # compiled regexes keyed by the set of skipped key names and the required section
+        self._regexes = {}
+        # key element indexes and static tokens of the variations, see _get_parser_tokens
+        self._parser_tokens = {}
+
+        # list of (optional section index or None, static token or None, key or None)
+        self._elements = []
+        self.section_count = 0
+        if prefix:
+            # only the definition may have optional sections, not the prefix
+            expanded_definition = os.path.join(prefix, definition)
+            definition_start = len(expanded_definition) - len(definition)
+            self._add_elements(expanded_definition[:definition_start], keys, None)
+            for token in re.split(r"(\[[^]]*\])", expanded_definition[definition_start:]):
+                if token.startswith("["):
+                    self._add_elements(token[1:-1], keys, self.section_count)
+                    self.section_count += 1
+                else:
+                    self._add_elements(token, keys, None)
+
+        # list of (group name, key) for the key occurrences
+        self._key_groups = []
+        # the group of the first key of each section tells if a path has the section
+        self._section_groups = {}
+        # static tokens with keys after them, TemplatePathParser stops when it finds
+        # one at the end of a path and returns the values found until then
+        end_tokens = set()
+        for index, (section, static_token, key) in enumerate(self._elements):
+            if static_token is None:
+                self._key_groups.append(("k%d" % index, key))
+                if section is not None:
+                    self._section_groups.setdefault(section, "k%d" % index)
+                end_tokens.update([x[1].lower() for x in self._elements[:index] if x[1]])
+        self._end_tokens = tuple(end_tokens)
+
+        self._compilable = bool(prefix) and self._is_compilable()
+        if self._compilable and not lazy:
+            self._get_regex(frozenset())
+
+    def __getstate__(self):
+        # compiled regexes are not pickled, they are compiled again when needed
+        state = self.__dict__.copy()
+        state["_regexes"] = {}
+        return state
+
+    def _add_elements(self, token, keys, section):
+        """
+        Splits a token into static tokens and keys, and adds them to the elements.
+        """
+        for index, part in enumerate(re.split(r"{(%s)}" % Template._key_name_regex, token)):
+            if index % 2:
+                self._elements.append((section, None, keys.get(part)))
+            elif part:
+                self._elements.append((section, part, None))
+
+    def _is_compilable(self):
+        """
+        Checks every variation starts with a static token and has static tokens
+        between its keys. The variations are not built: the start of the path or
+        a key can be followed by a key in some variation if the static tokens in
+        between are all in optional sections which can be left out.
+        """
+        if len(self._section_groups) != self.section_count:
+            return False
+        if [x for x in self._elements if x[1] is None and x[2] is None]:
+            # the definition uses an unknown key
+            return False
+
+        starts = [(None, -1)] + [(section, index) for index, (section, static_token, _)
+                                 in enumerate(self._elements) if static_token is None]
+        for section, start in starts:
+            # optional sections of the static tokens which can be left out
+            skipped = set()
+            for next_section, static_token, _ in self._elements[start + 1:]:
+                if static_token is not None:
+                    if next_section is None or next_section == section:
+                        break
+                    skipped.add(next_section)
+                elif next_section not in skipped:
+                    return False
+        return True
+
+    def is_compilable(self):
+        """
+        :returns: True if the definition can be compiled into a regex.
+        """
+        return self._compilable
+
+    def is_compiled(self, skip_keys):
+        """
+        :param skip_keys: Keys for whom we do not need to find values.
+        :returns: True if paths are matched with a compiled regex when skipping the given keys.
+        """
+        return self._get_regex(self._key_names.intersection(skip_keys or [])) is not None
+
+    def _get_regex(self, skip_keys, required_section=None):
+        """
+        Returns the compiled regex to use when skipping the given keys, or None
+        if the definition can't be compiled.
+
+        :param skip_keys: Frozen set of names of the keys whose values are not parsed.
+        :param required_section: Optional index of a section which is not optional.
+        """
+        if not self._compilable:
+            return None
+        regex_key = (skip_keys, required_section)
+        if regex_key not in self._regexes:
+            self._regexes[regex_key] = self._compile(skip_keys, required_section)
+        return self._regexes[regex_key]
+
+    def _compile(self, skip_keys, required_section):
+        """
+        Compiles the definition into an anchored regex, with a group named after
+        the element of each key occurrence, see _is_parser_split. Values of skipped
+        keys may be anything, as for TemplatePathParser, and each optional section
+        is an optional group.
+
+        :param skip_keys: Frozen set of names of the keys whose values are not parsed.
+        :param required_section: Index of a section which is not optional, or None.
+
+        :returns: Compiled regex, or None if the regex can't be compiled.
+        """
+        regex = ""
+        current_section = None
+        for index, (section, static_token, key) in enumerate(self._elements):
+            if section == required_section:
+                section = None
+            if section != current_section:
+                if current_section is not None:
+                    regex += ")?"
+                if section is not None:
+                    regex += "(?:"
+                current_section = section
+
+            group_name = "k%d" % index
+            if static_token is not None:
+                regex += templatekey._case_insensitive_regex(static_token)
+            elif key.name in skip_keys:
+                # TemplatePathParser accepts anything for a skipped key
+                regex += "(?P<%s>.*?)" % group_name
+            else:
+                regex += "(?P<%s>%s)" % (group_name, key._value_regex())
+        if current_section is not None:
+            regex += ")?"
+
+        try:
+            return re.compile("^%s\\Z" % regex, re.UNICODE | re.DOTALL)
+        except (re.error, AssertionError):
+            # the regex engine limits the number of named groups
+            return None
+
+    def get_segments(self, sections=()):
+        """
+        Splits a variation of the definition into the path segments it matches.
+
+        :param sections: Tuple of flags telling for each optional section if the
+                         variation has it.
+
+        :returns: List with, for each path segment, its lower case string if the
+                  segment has no keys or else a compiled regex matching the segment,
+                  with a group for each key. See get_segment_keys.
+                  None if the definition is not compiled.
+        """
+        segments = self._split_segments(sections)
+        if segments is None:
+            return None
+        return [re.compile("^%s\\Z" % regex, re.UNICODE) if groups else static.lower()
+                for static, regex, groups in segments]
+
+    def get_segment_keys(self, sections=()):
+        """
+        Returns the keys found in each path segment of a variation of the definition.
+
+        :param sections: Tuple of flags telling for each optional section if the
+                         variation has it.
+
+        :returns: List with, for each path segment, a list of (group name, key) for
+                  the keys in the segment, the group names being those of the regexes
+                  returned by get_segments. None if the definition is not compiled.
+        """
+        segments = self._split_segments(sections)
+        if segments is None:
+            return None
+        return [groups for _, _, groups in segments]
+
+    def _split_segments(self, sections):
+        """
+        Splits the elements of a variation of the definition into path segments.
+
+        :returns: List of [static string, regex string, list of (group name, key)]
+                  per segment.
+        """
+        if not self._compilable:
+            return None
+
+        segments = [["", "", []]]
+        for index, (section, static_token, key) in enumerate(self._elements):
+            if section is not None and not sections[section]:
+                continue
+            if key is not None:
+                groups = segments[-1][2]
+                if key.name in [x.name for _, x in groups]:
+                    segments[-1][1] += "(?:%s)" % key._value_regex()
+                else:
+                    group_name = "k%d" % index
+                    segments[-1][1] += "(?P<%s>%s)" % (group_name, key._value_regex())
+                    groups.append((group_name, key))
+                continue
+            for part_index, part in enumerate(static_token.split(os.path.sep)):
+                if part_index > 0:
+                    segments.append(["", "", []])
+                segments[-1][0] += part
+                segments[-1][1] += templatekey._case_insensitive_regex(part)
+        return segments
+
+    def match(self, input_path, skip_keys):
+        """
+        Determines values for keys in a path, and which optional sections the
+        path has. Only for definitions compiled when skipping the given keys.
+
+        The regex finds a variation the path fits. Longer variations, which come
+        first in order of precedence, have sections it doesn't have: if the path
+        doesn't match with any of these sections required, the variation found is
+        the first the path fits.
+
+        :param input_path: Path to parse.
+        :type input_path: String.
+        :param skip_keys: Keys for whom we do not need to find values.
+        :type skip_keys: List of strings.
+
+        :returns: Tuple of flags telling for each optional section if the path has it,
+                  or None if the path does not match, mapping of key names to values or
+                  None, and the reason why the path could not be parsed. Without values,
+                  the flags are None for the sections the path may have or not.
+        """
+        skip_keys = self._key_names.intersection(skip_keys or [])
+        input_path = os.path.normpath(input_path)
+        lower_path = input_path.lower()
+        if lower_path.endswith(self._end_tokens):
+            msg = "Tried to extract fields from path '%s', but the path may end before the template."
+            return (None,) * self.section_count, None, msg % input_path
+
+        match = self._get_regex(skip_keys).match(input_path)
+        if match is None:
+            msg = "Tried to extract fields from path '%s', but path does not fit the template."
+            return None, None, msg % input_path
+
+        sections = []
+        # the sections the path doesn't have for sure
+        absent_sections = []
+        for section in range(self.section_count):
+            flag = match.group(self._section_groups[section]) is not None
+            sections.append(flag)
+            if flag or self._get_regex(skip_keys, section).match(input_path) is not None:
+                absent_sections.append(None)
+            else:
+                absent_sections.append(False)
+        sections = tuple(sections)
+        absent_sections = tuple(absent_sections)
+        if [x for x, y in zip(sections, absent_sections) if x != y and not x]:
+            msg = "Tried to extract fields from path '%s', but it fits several variations of the template."
+            return absent_sections, None, msg % input_path
+
+        fields = {}
+        values = match.groupdict()
+        for group_name, key in self._key_groups:
+            if key.name in skip_keys:
+                continue
+            value_str = values[group_name]
+            if value_str is None:
+                # the key is in a section the path doesn't have
+                continue
+            try:
+                value = key.value_from_str(value_str)
+            except TankError, e:
+                # use the %r form for the error, see TemplatePathParser._process_value
+                msg = "Failed to get value for key '%s' - %r" % (key.name, e)
+                return absent_sections, None, msg
+
+            # a key repeated in the definition must have the same value, which
+            # may be written differently
+            if fields.get(key.name, value) != value:
+                msg = "Conflicting values found for key %s: %s and %s"
+                return absent_sections, None, msg % (key.name, fields[key.name], value)
+
+            if os.path.sep in value_str:
+                msg = "Invalid value found for key %s: %s"
+                return absent_sections, None, msg % (key.name, value)
+            fields[key.name] = value
+
+        if not self._is_parser_split(input_path, match, sections, fields):
+            # the regex found values TemplatePathParser would not find, which
+            # must not make paths the parser rejects or finds ambiguous fit
+            msg = "Tried to extract fields from path '%s', but the values found are ambiguous."
+            return absent_sections, None, msg % input_path
+
+        if not fields:
+            return absent_sections, fields, None
+        return sections, fields, None
+
+    def _get_parser_tokens(self, sections):
+        """
+        Returns the key element indexes and the static tokens of a variation of
+        the definition, as TemplatePathParser has them.
+
+        :param sections: Tuple of flags telling for each optional section if the
+                         variation has it.
+        """
+        parser_tokens = self._parser_tokens.get(sections)
+        if parser_tokens is None:
+            key_indexes = []
+            static_tokens = [""]
+            for index, (section, static_token, key) in enumerate(self._elements):
+                if section is not None and not sections[section]:
+                    continue
+                if key is None:
+                    static_tokens[-1] += static_token.lower()
+                else:
+                    key_indexes.append(index)
+                    static_tokens.append("")
+            parser_tokens = (key_indexes, static_tokens)
+            self._parser_tokens[sections] = parser_tokens
+        return parser_tokens
+
+    def _is_parser_split(self, input_path, match, sections, fields):
+        """
+        Checks a regex match splits the path where TemplatePathParser does. The
+        parser ends a value at the first occurrence of the next static token,
+        while the regex may have backtracked to a later occurrence.
+
+        :param input_path: Normalized path.
+        :param match: Match of the regex for the path.
+        :param sections: Optional section flags of the matched variation.
+        :param fields: Valid values found by the match for the keys which are
+                       not skipped.
+
+        :returns: True if the parser would find the same values.
+        """
+        (key_indexes, static_tokens) = self._get_parser_tokens(sections)
+        lower_path = input_path.lower()
+        path_parser = TemplatePathParser([], [])
+        path_parser.fields = fields
+        # names of the keys whose values the parser has found so far
+        found_keys = set()
+
+        def find_token(key, token, start):
+            if key.name in found_keys:
+                # the parser looks for the value of a repeated key first
+                return path_parser.find_index_of_token(key, token, input_path, start)
+            token_start = lower_path.find(token, start)
+            if token_start < 0:
+                return None
+            return token_start
+
+        for token_index, index in enumerate(key_indexes):
+            token = static_tokens[token_index + 1]
+            if not token:
+                # the last value runs to the end of the path
+                break
+            key = self._elements[index][2]
+            group_name = "k%d" % index
+            start, end = match.span(group_name)
+            token_start = find_token(key, token, start)
+            if (token_start is not None and key.length is not None and start and
+                    token_start - start < key.length):
+                token_start = find_token(key, token, token_start + 1)
+            if token_start != end:
+                return False
+            if key.name in fields:
+                found_keys.add(key.name)
+        return True
+
+    def can_locate_key(self, key_name):
+        """
+        :returns: True if locate_key can find the value of a key in paths, which
+                  requires a compiled definition using the key at most once.
+        """
+        if self._get_regex(frozenset()) is None:
+            return False
+        return len([x for _, _, x in self._elements if x is not None and x.name == key_name]) <= 1
+
+    def locate_key(self, input_path, key_name):
+        """
+        Finds the value of a key in a normalized path, without validating the value
+        nor the rest of the path.
+
+        :param input_path: Normalized path.
+        :param key_name: Name of the key to locate.
+
+        :returns: Tuple of start and end indexes of the key's value in the path,
+                  None if the path doesn't match or has no value for the key.
+        """
+        match = self._get_regex(frozenset()).match(input_path)
+        if match is None:
+            return None
+        for index, (_, _, key) in enumerate(self._elements):
+            if key is not None and key.name == key_name:
+                if match.group("k%d" % index) is None:
+                    return None
+                return match.span("k%d" % index)
+        return None
+
+
 def read_templates(pipeline_configuration):
     """
     Creates templates and keys based on contents of templates file.
 
+    Templates are only created when they are first accessed, see LazyTemplates.
+
     :param pipeline_configuration: pipeline config object
 
     :returns: Dictionary of form {template name: template object}
     """
-    
-    data = pipeline_configuration.get_templates_config()            
+    templates = _read_templates(pipeline_configuration)
+    templates.set_fields_cache_size(pipeline_configuration.get_templates_fields_cache_size())
+    return templates
+
+
+def _read_templates(pipeline_configuration):
+    """
+    Builds the templates from the configuration, read from the cache when possible,
+    see read_templates.
+    """
+    # the configuration is cached along with the roots the templates are built with
+    cache_path = pipeline_configuration.get_templates_cache_location()
+    cache_key = sorted(pipeline_configuration.get_data_roots().items())
+    data = template_cache.load(cache_path, cache_key)
+    if data is None:
+        included_files = []
+        data = pipeline_configuration.get_templates_config(included_files)
+        template_cache.save(cache_path, cache_key, included_files, data)
     
     # get dictionaries from the templates config file:
     def get_data_section(section_name):
@@ -694,18 +1600,247 @@ def read_templates(pipeline_configuration):
         return d            
             
     keys = templatekey.make_keys(get_data_section("keys"))
-    template_paths = make_template_paths(get_data_section("paths"), keys, pipeline_configuration.get_data_roots() )
-    template_strings = make_template_strings(get_data_section("strings"), keys, template_paths)
+    templates = LazyTemplates(keys,
+                              get_data_section("paths"),
+                              get_data_section("strings"),
+                              pipeline_configuration.get_data_roots())
+    return templates
 
-    # Detect duplicate names across paths and strings
-    dup_names =  set(template_paths).intersection(set(template_strings))
-    if dup_names:
-        raise TankError("Detected paths and strings with the same name: %s" % str(list(dup_names)))
 
-    # Put path and strings together
-    templates = template_paths
-    templates.update(template_strings)
-    return templates
+class LazyTemplates(UserDict.DictMixin, object):
+    """
+    Dictionary of templates which only creates a template when it is first accessed.
+    The dictionary methods are provided by DictMixin, as collections.MutableMapping
+    is not available in python 2.5.
+
+    The templates data and definitions are checked when the dictionary is
+    created, so that configuration errors are raised when the templates are read
+    rather than when a template is first accessed.
+    """
+    def __init__(self, keys, paths_data, strings_data, roots):
+        """
+        :param keys: Available keys.
+        :type keys:  Dictionary of form: {<key name> : <TemplateKey object>}
+        :param paths_data: Data from which to construct the template paths.
+        :type paths_data:  Dictionary of form: {<template name>: {<option>: <option value>}}
+        :param strings_data: Data from which to construct the template strings.
+        :type strings_data:  Dictionary of form: {<template name>: {<option>: <option value>}}
+        :param roots: Root paths.
+        :type roots: Dictionary of form: {<root name> : <root path>}
+        """
+        self._keys = keys
+        self._roots = roots
+        # template name: (template class, conformed template data)
+        self._data = {}
+        # templates created so far or set on the dictionary
+        self._templates = {}
+        # number of templates this dictionary has created
+        self.materialized_count = 0
+        # incremented whenever templates are set or deleted
+        self.version = 0
+        # size of the get_fields cache of the templates
+        self._fields_cache_size = 0
+
+        for template_name, template_data in _process_templates_data(paths_data, "path").items():
+            _check_template_path_data(template_name, template_data, roots)
+            self._data[template_name] = (TemplatePath, template_data)
+
+        strings_data = _process_templates_data(strings_data, "path")
+        for template_name, template_data in strings_data.items():
+            _check_template_string_data(template_name, template_data, self._data)
+
+        # Detect duplicate names across paths and strings
+        dup_names = set(self._data).intersection(set(strings_data))
+        if dup_names:
+            raise TankError("Detected paths and strings with the same name: %s" % str(list(dup_names)))
+
+        for template_name, template_data in strings_data.items():
+            self._data[template_name] = (TemplateString, template_data)
+
+        for template_name, (template_class, template_data) in self._data.items():
+            template_class._check_definition(template_data["definition"], keys, template_name)
+
+    def __getstate__(self):
+        # created templates are not pickled, they are created again when needed
+        state = self.__dict__.copy()
+        state["_templates"] = {}
+        state["materialized_count"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # share the keys with the other configurations using the same ones
+        self._keys = dict([(name, templatekey.intern_key(key)) for name, key in self._keys.items()])
+
+    def get_footprint(self):
+        """
+        Returns an estimate of the memory used by the keys and by the templates
+        created so far. Objects shared with other configurations, like keys
+        with the same settings, are included.
+
+        :returns: Dictionary with the number of "keys", the number of "templates"
+                  and of "created_templates", and the size in bytes of the keys
+                  ("keys_bytes") and of the templates without their keys
+                  ("templates_bytes").
+        """
+        seen = set()
+        keys_bytes = memory.get_size(self._keys, seen)
+        templates_bytes = memory.get_size(self._templates, seen)
+        return {"keys": len(self._keys),
+                "templates": len(self),
+                "created_templates": len(self._templates),
+                "keys_bytes": keys_bytes,
+                "templates_bytes": templates_bytes}
+
+    def get_definition(self, template_name):
+        """
+        Returns the definition of a template as found in the templates configuration,
+        without creating the template.
+
+        :param template_name: Name of the template.
+
+        :returns: Definition string.
+        """
+        template = self._templates.get(template_name)
+        if template is not None:
+            return template._repr_def
+        return self._data[template_name][1]["definition"]
+
+    def get_definition_segments(self, template_name):
+        """
+        Returns the path segments matched by the definition variations of a
+        template path, see TemplatePathMatcher.get_segments. Templates which are
+        not created yet are not created.
+
+        :param template_name: Name of the template.
+
+        :returns: List of segments per definition variation, or None for template
+                  strings and for definitions which can't be split into segments.
+        """
+        template = self._templates.get(template_name)
+        if template is not None:
+            if isinstance(template, TemplatePath):
+                return template._get_segments()
+            return None
+
+        template_class, template_data = self._data[template_name]
+        if template_class is not TemplatePath:
+            return None
+        try:
+            return TemplatePath._definition_segments(template_data["definition"],
+                                                     self._keys,
+                                                     self._roots[template_data["root_name"]],
+                                                     template_name)
+        except TankError:
+            # the definition can't be split into segments
+            return None
+
+    def copy(self):
+        """
+        Returns a shallow copy of the dictionary. Templates which are not created
+        yet are not created.
+        """
+        result = self.__class__.__new__(self.__class__)
+        result.__dict__.update(self.__dict__)
+        result._data = self._data.copy()
+        result._templates = self._templates.copy()
+        result.materialized_count = 0
+        result.version = 0
+        return result
+
+    def set_fields_cache_size(self, size):
+        """
+        Sets the size of the get_fields cache of the templates, including the
+        ones which are not created yet. See Template.set_fields_cache_size.
+
+        :param size: Maximum number of results cached by each template, 0 or
+                     None disables the caches.
+        """
+        self._fields_cache_size = size
+        for template in self._templates.values():
+            template.set_fields_cache_size(size)
+
+    def clear_fields_caches(self):
+        """
+        Discards the get_fields results cached by the templates.
+        """
+        for template in self._templates.values():
+            template.clear_fields_cache()
+
+    def get_fields_cache_stats(self):
+        """
+        Returns statistics about the get_fields caches of all the templates
+        created so far, see Template.get_fields_cache_stats.
+
+        :returns: Dictionary with the total number of "hits", "misses" and
+                  cached results ("size").
+        """
+        stats = {"hits": 0, "misses": 0, "size": 0}
+        for template in self._templates.values():
+            template_stats = template.get_fields_cache_stats()
+            if template_stats is not None:
+                for name in stats:
+                    stats[name] += template_stats[name]
+        return stats
+
+    def __getitem__(self, template_name):
+        template = self._templates.get(template_name)
+        if template is None:
+            template_class, template_data = self._data[template_name]
+            if template_class is TemplatePath:
+                template = _make_template_path(template_name, template_data, self._keys, self._roots)
+            else:
+                validator = self.get(template_data.get("validate_with"))
+                template = _make_template_string(template_name, template_data, self._keys, validator)
+            template.set_fields_cache_size(self._fields_cache_size)
+            self._templates[template_name] = template
+            self.materialized_count += 1
+            _materialized_counter[0] += 1
+        return template
+
+    def __setitem__(self, template_name, template):
+        self._templates[template_name] = template
+        self.version += 1
+
+    def __delitem__(self, template_name):
+        if template_name not in self:
+            raise KeyError(template_name)
+        self._templates.pop(template_name, None)
+        self._data.pop(template_name, None)
+        self.version += 1
+
+    def __contains__(self, template_name):
+        return template_name in self._data or template_name in self._templates
+
+    def __iter__(self):
+        for template_name in self._data:
+            yield template_name
+        for template_name in self._templates:
+            if template_name not in self._data:
+                yield template_name
+
+    def __len__(self):
+        return len(self._data) + len([x for x in self._templates if x not in self._data])
+
+    def keys(self):
+        return list(self)
+
+    def __repr__(self):
+        return "<Sgtk %s: %d templates, %d created>" % (self.__class__.__name__,
+                                                        len(self),
+                                                        len(self._templates))
+
+
+# total number of templates created by LazyTemplates in this process
+_materialized_counter = [0]
+
+
+def get_materialized_count():
+    """
+    Returns the number of templates read from templates configurations which were
+    created in this process. Templates are only created when they are accessed.
+    """
+    return _materialized_counter[0]
 
 
 def make_template_paths(data, keys, roots):
@@ -725,19 +1860,8 @@ def make_template_paths(data, keys, roots):
     templates_data = _process_templates_data(data, "path")
 
     for template_name, template_data in templates_data.items():
-        definition = template_data["definition"]
-        root_name = template_data["root_name"]
-        # to avoid confusion between strings and paths, validate to check
-        # that each item contains at least a "/" (#19098)
-        if "/" not in definition:
-            raise TankError("The template %s (%s) does not seem to be a valid path. A valid "
-                            "path needs to contain at least one '/' character. Perhaps this "
-                            "template should be in the strings section "
-                            "instead?" % (template_name, definition))
-
-        root_path = roots[root_name]
-        template_path = TemplatePath(definition, keys, root_path, template_name)
-        template_paths[template_name] = template_path
+        _check_template_path_data(template_name, template_data, roots)
+        template_paths[template_name] = _make_template_path(template_name, template_data, keys, roots)
 
     return template_paths
 
@@ -758,22 +1882,52 @@ def make_template_strings(data, keys, template_paths):
     templates_data = _process_templates_data(data, "path")
 
     for template_name, template_data in templates_data.items():
-        definition = template_data["definition"]
+        _check_template_string_data(template_name, template_data, template_paths)
+        validator = template_paths.get(template_data.get("validate_with"))
+        template_strings[template_name] = _make_template_string(template_name, template_data,
+                                                                keys, validator)
 
-        validator_name = template_data.get("validate_with")
-        validator = template_paths.get(validator_name)
-        if validator_name and not validator:
-            msg = "Template %s validate_with is set to undefined template %s."
-            raise TankError(msg %(template_name, validator_name))
+    return template_strings
 
-        template_string = TemplateString(definition,
-                                         keys,
-                                         template_name,
-                                         validate_with=validator)
+def _check_template_path_data(template_name, template_data, roots):
+    """
+    Checks the data for a TemplatePath is valid.
+    """
+    definition = template_data["definition"]
+    # to avoid confusion between strings and paths, validate to check
+    # that each item contains at least a "/" (#19098)
+    if "/" not in definition:
+        raise TankError("The template %s (%s) does not seem to be a valid path. A valid "
+                        "path needs to contain at least one '/' character. Perhaps this "
+                        "template should be in the strings section "
+                        "instead?" % (template_name, definition))
+    # raises a KeyError for undefined roots
+    roots[template_data["root_name"]]
+
+def _check_template_string_data(template_name, template_data, template_paths):
+    """
+    Checks the data for a TemplateString is valid.
+    """
+    validator_name = template_data.get("validate_with")
+    if validator_name and validator_name not in template_paths:
+        msg = "Template %s validate_with is set to undefined template %s."
+        raise TankError(msg %(template_name, validator_name))
 
-        template_strings[template_name] = template_string
+def _make_template_path(template_name, template_data, keys, roots):
+    """
+    Creates a TemplatePath from its data.
+    """
+    root_path = roots[template_data["root_name"]]
+    return TemplatePath(template_data["definition"], keys, root_path, template_name)
 
-    return template_strings
+def _make_template_string(template_name, template_data, keys, validator):
+    """
+    Creates a TemplateString from its data.
+    """
+    return TemplateString(template_data["definition"],
+                          keys,
+                          template_name,
+                          validate_with=validator)
 
 def _conform_template_data(template_data, template_name):
     """
@@ -0,0 +1,154 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+On disk cache of the templates configuration read from templates.yml.
+
+The cache file holds a header followed by the configuration data, with includes
+resolved, both stored with marshal. Unlike pickle, reading marshal data never
+runs code, so a cache file replaced by someone else can't do more harm than a
+bad templates configuration. The header records the md5 digest of templates.yml
+and of every file it includes, so the cache is rebuilt as soon as one of them
+changes.
+
+NOTE! The cache is typically hosted on an NFS storage and read by many processes
+at once. The file is never modified in place: a new cache is written to a
+temporary file next to it which is then renamed over the old one, so readers
+always see either the previous or the new cache in full.
+"""
+
+import os
+import sys
+import hashlib
+import marshal
+import uuid
+
+# bump this when the layout of the cache file changes
+CACHE_FORMAT_VERSION = 2
+
+# modules producing the cached data, stale caches are ignored when they change
+_TEMPLATE_MODULES = ["pipelineconfig", "template_includes", "template_cache"]
+
+
+def load(cache_path, key):
+    """
+    Reads the templates configuration from a cache file.
+
+    :param cache_path: Path to the cache file.
+    :param key: Value identifying what the configuration was read for, in
+                addition to the configuration files.
+
+    :returns: Dictionary of the templates configuration, as returned by
+              PipelineConfiguration.get_templates_config, or None if the cache 
+              doesn't exist or is out of date.
+    """
+    try:
+        fh = open(cache_path, "rb")
+    except IOError:
+        return None
+
+    try:
+        try:
+            header = marshal.load(fh)
+            if header.get("version") != _get_version() or header.get("key") != _marshal_key(key):
+                return None
+            for file_name, digest in header["files"]:
+                if _get_digest(file_name) != digest:
+                    return None
+            payload = fh.read()
+            if hashlib.md5(payload).hexdigest() != header["payload_digest"]:
+                return None
+            data = marshal.loads(payload)
+            if not isinstance(data, dict):
+                return None
+            return data
+        except Exception:
+            # a corrupt or incompatible cache is simply rebuilt
+            return None
+    finally:
+        fh.close()
+
+
+def save(cache_path, key, file_names, data):
+    """
+    Writes the templates configuration to a cache file. Failing to write the cache
+    is not an error, the configuration will just be read again next time.
+
+    :param cache_path: Path to the cache file.
+    :param key: Value identifying what the configuration was read for, in
+                addition to the configuration files.
+    :param file_names: Configuration files the configuration was read from.
+    :param data: Dictionary of the templates configuration.
+    """
+    cache_folder = os.path.dirname(cache_path)
+    try:
+        payload = marshal.dumps(data)
+        header = {"version": _get_version(),
+                  "key": _marshal_key(key),
+                  "files": [(x, _get_digest(x)) for x in file_names],
+                  "payload_digest": hashlib.md5(payload).hexdigest()}
+
+        # the file is created with the permissions set by the umask of the user, as
+        # other files in the configuration. Unlike mkstemp, which only lets the creator
+        # read the file.
+        temp_path = os.path.join(cache_folder, ".%s.%s" % (os.path.basename(cache_path), uuid.uuid4().hex))
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0666)
+        try:
+            fh = os.fdopen(fd, "wb")
+            try:
+                marshal.dump(header, fh)
+                fh.write(payload)
+            finally:
+                fh.close()
+
+            if sys.platform == "win32" and os.path.exists(cache_path):
+                # renaming doesn't replace files on windows
+                os.remove(cache_path)
+            os.rename(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    except (IOError, OSError, ValueError):
+        # ValueError is raised for data marshal can't store
+        pass
+
+
+def _marshal_key(key):
+    """
+    Returns a key in a form marshal stores and reads back as is.
+    """
+    return repr(key)
+
+def _get_digest(file_name):
+    """
+    Returns the md5 digest of a file's contents, or None if the file doesn't exist.
+    """
+    try:
+        fh = open(file_name, "rb")
+    except IOError:
+        return None
+    try:
+        return hashlib.md5(fh.read()).hexdigest()
+    finally:
+        fh.close()
+
+
+def _get_version():
+    """
+    Returns the version of the cache format and of the code used to build it.
+    """
+    module_times = []
+    for module_name in _TEMPLATE_MODULES:
+        module_path = os.path.join(os.path.dirname(__file__), "%s.py" % module_name)
+        try:
+            module_times.append(os.path.getmtime(module_path))
+        except OSError:
+            module_times.append(None)
+    return (CACHE_FORMAT_VERSION, module_times)
@@ -85,12 +85,13 @@ def _get_includes(file_name, data):
     return resolved_includes
 
 
-def _process_template_includes_r(file_name, data):
+def _process_template_includes_r(file_name, data, included_files=None):
     """
     Recursively add template include files.
     
     For each of the sections keys, strings, path, populate entries based on
-    include files.
+    include files. The paths of the files read are appended to included_files
+    if it is specified.
     """
     
     # return data    
@@ -103,7 +104,10 @@ def _process_template_includes_r(file_name, data):
     included_paths = _get_includes(file_name, data)
     
     for included_path in included_paths:
-                
+
+        if included_files is not None:
+            included_files.append(included_path)
+
         # path exists, so try to read it
         fh = open(included_path, "r")
         try:
@@ -112,7 +116,7 @@ def _process_template_includes_r(file_name, data):
             fh.close()
         
         # before doing any type of processing, allow the included data to be resolved.
-        included_data = _process_template_includes_r(included_path, included_data)
+        included_data = _process_template_includes_r(included_path, included_data, included_files)
         
         # add the included data's different sections
         for ts in constants.TEMPLATE_SECTIONS:
@@ -127,10 +131,12 @@ def _process_template_includes_r(file_name, data):
     
     return output_data
         
-def process_includes(file_name, data):
+def process_includes(file_name, data, included_files=None):
     """
     Processes includes for the main templates file. Will look for 
     any include data structures and transform them into real data.
+    The paths of the included files are appended to included_files
+    if it is specified.
     
     Algorithm (recursive):
     
@@ -141,7 +147,7 @@ def process_includes(file_name, data):
         
     """
     # first recursively load all template data from includes
-    resolved_includes_data = _process_template_includes_r(file_name, data)
+    resolved_includes_data = _process_template_includes_r(file_name, data, included_files)
     
     # Now recursively process any @resolves.
     # these are of the following form:
@@ -0,0 +1,169 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Index used to narrow down the templates which may match a path.
+
+"""
+
+import os
+
+from .template import TemplatePath, LazyTemplates
+
+
+class TemplateIndex(object):
+    """
+    Prefix trie over the path segments of template definitions.
+
+    Segments without keys are stored as static edges, keyed by their lower case
+    string. Segments with keys are stored as wildcard edges holding a regex built
+    from the segment's static tokens and keys. Looking up a path only follows the
+    edges matching its segments, so the templates returned are the few whose
+    definitions can possibly match the path. These still need to be validated.
+
+    Templates which can't be indexed, such as template strings, are returned
+    for every path. Templates of a LazyTemplates dictionary are indexed from
+    their definitions, they are only created once they are returned.
+    """
+    def __init__(self, templates):
+        """
+        :param templates: Dictionary of form {template name: template object}.
+                          The index must be built again if it changes.
+        """
+        self._root = _TemplateTrieNode()
+        self._templates = templates
+        # names of the templates returned for any path
+        self._unindexed = []
+        # position of each template in the templates dictionary, so that
+        # candidates are returned in the order template_from_path always used
+        self._positions = {}
+
+        for position, name in enumerate(templates):
+            self._positions[name] = position
+            if not self._add_template(name):
+                self._unindexed.append(name)
+
+    def _add_template(self, name):
+        """
+        Adds the definition variations of a template to the trie.
+
+        :returns: False if the template can't be indexed.
+        """
+        if isinstance(self._templates, LazyTemplates):
+            all_segments = self._templates.get_definition_segments(name)
+        else:
+            template = self._templates[name]
+            all_segments = None
+            if isinstance(template, TemplatePath):
+                all_segments = template._get_segments()
+        if all_segments is None:
+            return False
+
+        for segments in all_segments:
+            node = self._root
+            for segment in segments:
+                node = node.add_child(segment)
+            node.template_names.add(name)
+        return True
+
+    def get_candidates(self, path):
+        """
+        Returns the templates that may match a path.
+
+        :param path: Path to look up.
+
+        :returns: List of templates, in the order of the templates dictionary
+                  the index was built from.
+        """
+        segments = os.path.normpath(path).split(os.path.sep)
+        nodes = _walk([self._root], segments)
+        return self._collect(nodes)
+
+    def get_candidates_for_paths(self, paths):
+        """
+        Returns the templates that may match each of a list of paths. The trie
+        is only walked once for the parent directory shared by several paths.
+
+        :param paths: Paths to look up.
+
+        :returns: Dictionary of form {path: list of templates}
+        """
+        candidates = {}
+        # nodes reached for each parent directory
+        parent_nodes = {}
+        for path in paths:
+            segments = os.path.normpath(path).split(os.path.sep)
+            parent = tuple(segments[:-1])
+            if parent not in parent_nodes:
+                parent_nodes[parent] = _walk([self._root], segments[:-1])
+            nodes = _walk(parent_nodes[parent], segments[-1:])
+            candidates[path] = self._collect(nodes)
+        return candidates
+
+    def _collect(self, nodes):
+        """
+        Returns the indexed templates ending at the given nodes along with the
+        unindexed templates, in the order of the templates dictionary.
+        """
+        names = set(self._unindexed)
+        for node in nodes:
+            names.update(node.template_names)
+        return [self._templates[name] for name in sorted(names, key=self._positions.get)]
+
+
+class _TemplateTrieNode(object):
+    """
+    Node of the TemplateIndex trie.
+    """
+    def __init__(self):
+        # lower case segment string: child node
+        self.static_children = {}
+        # list of (segment regex, child node)
+        self.wildcard_children = []
+        # names of the templates with a definition ending at this node
+        self.template_names = set()
+
+    def add_child(self, segment):
+        """
+        Returns the child for a segment, creating it if needed.
+
+        :param segment: Lower case string or compiled regex.
+        """
+        if isinstance(segment, basestring):
+            return self.static_children.setdefault(segment, _TemplateTrieNode())
+
+        for regex, child in self.wildcard_children:
+            if regex.pattern == segment.pattern:
+                return child
+        child = _TemplateTrieNode()
+        self.wildcard_children.append((segment, child))
+        return child
+
+
+def _walk(nodes, segments):
+    """
+    Follows the edges matching each segment in turn, starting from the given nodes.
+
+    :returns: List of nodes reached once all segments are consumed.
+    """
+    for segment in segments:
+        lower_segment = segment.lower()
+        next_nodes = []
+        for node in nodes:
+            child = node.static_children.get(lower_segment)
+            if child is not None:
+                next_nodes.append(child)
+            for regex, child in node.wildcard_children:
+                if regex.match(segment):
+                    next_nodes.append(child)
+        nodes = next_nodes
+        if not nodes:
+            break
+    return nodes
@@ -0,0 +1,445 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Search for the paths on disk matching a template.
+
+"""
+
+import os
+import glob
+import fnmatch
+import heapq
+import itertools
+
+from .errors import TankError
+
+
+class TemplateSearch(object):
+    """
+    Walks the file system one path segment at a time to find the paths matching
+    glob patterns built from a template.
+
+    Patterns are matched the same way glob.iglob matches them, but each directory
+    is only listed once for all the patterns searched, and entries are pruned as
+    soon as they can't match the segment of the template at their depth, both its
+    static tokens and its keys' values. Paths found still need to be validated
+    against the template.
+    """
+    def __init__(self, template):
+        """
+        :param template: Template to search for.
+        """
+        self._template = template
+        # directory: names in the directory, or None if it can't be listed
+        self._listings = {}
+        # path: whether the path exists
+        self._exists = {}
+
+        # segments of every variation of the template and the keys they contain,
+        # pruning is only possible when they are all known
+        self._segments = template._get_segments() or []
+        self._segment_keys = template._get_segment_keys() or []
+
+    def iglob(self, pattern):
+        """
+        Finds the paths matching a glob pattern which may match the template.
+
+        :param pattern: Glob pattern, typically built by applying fields to the template.
+
+        :returns: Iterator over the matching paths.
+        """
+        return self._iglob(pattern, self._get_depth_segments(pattern))
+
+    def iglob_sorted(self, pattern, sort_by):
+        """
+        Finds the paths matching a glob pattern which may match the template, in
+        order of the values of the given keys.
+
+        Paths are ordered by the values of the sort keys found in them, in the order
+        of the sort keys, and then by path. Values of keys which can't be found in a
+        path are ignored. Directories are listed in order of the values found in their
+        path so far, so when the first sort keys are in directories above the others,
+        for example when sorting by shot and then by version, the first paths are
+        found without walking the whole tree.
+
+        :param pattern: Glob pattern, typically built by applying fields to the template.
+        :param sort_by: Names of the keys to sort by.
+
+        :returns: Iterator over (sort key, path) tuples, sorted by sort key.
+                  Sort keys of paths found by different patterns can be compared.
+        """
+        depth_segments = self._get_depth_segments(pattern)
+        pattern_segments = pattern.split(os.path.sep)
+        start = 1
+        while start < len(pattern_segments) and not glob.has_magic(pattern_segments[start]):
+            start += 1
+        if not os.path.isabs(pattern) or start == len(pattern_segments):
+            # nothing to walk in order, the values are only known once found
+            found = [(self._get_path_values(x, depth_segments), x) for x in self.iglob(pattern)]
+            for sort_key in sorted([(_get_sort_key(x, sort_by, True), y) for x, y in found]):
+                yield sort_key, sort_key[1]
+            return
+
+        # best first walk: directories are listed in order of the values of the sort
+        # keys in their path up to the first key not found yet, all the paths below
+        # them have sort keys starting with these values. On equal values they are
+        # listed before the paths found are yielded.
+        root = os.path.sep.join(pattern_segments[:start]) + os.path.sep
+        values = self._get_path_values(root, depth_segments)
+        heap = [(_get_sort_key(values, sort_by, False), False, root, values)]
+        while heap:
+            sort_key, is_path, path, values = heapq.heappop(heap)
+            if is_path:
+                yield (sort_key, path), path
+                continue
+            depth = len(path.rstrip(os.path.sep).split(os.path.sep))
+            basename = pattern_segments[depth]
+            if glob.has_magic(basename):
+                names = self._glob1(path, basename, depth_segments)
+            else:
+                names = self._glob0(path, basename, depth_segments)
+            is_path = depth == len(pattern_segments) - 1
+            for name in names:
+                child_values = values.copy()
+                child_values.update(self._get_entry_values(name, depth, depth_segments))
+                heapq.heappush(heap, (_get_sort_key(child_values, sort_by, is_path), is_path,
+                                      os.path.join(path, name), child_values))
+
+    def matches(self, pattern, path):
+        """
+        Checks if a path found by a search would have been found by a glob pattern.
+
+        :param pattern: Glob pattern.
+        :param path: Path found by searching for a glob pattern.
+        """
+        pattern_segments = pattern.split(os.path.sep)
+        path_segments = path.split(os.path.sep)
+        if len(pattern_segments) != len(path_segments):
+            return False
+        for pattern_segment, name in zip(pattern_segments, path_segments):
+            if not glob.has_magic(pattern_segment):
+                if os.path.normcase(name) != os.path.normcase(pattern_segment):
+                    return False
+            elif (name[:1] == "." and pattern_segment[0] != ".") or \
+                 not fnmatch.fnmatch(name, pattern_segment):
+                return False
+        return True
+
+    def _get_depth_segments(self, pattern):
+        """
+        Returns the segments and segment keys of the variations with as many
+        segments as a pattern, no path deeper or shallower than the pattern can
+        be found.
+        """
+        pattern_segments = pattern.split(os.path.sep)
+        if not os.path.isabs(pattern) or "" in pattern_segments[1:]:
+            return []
+        return [(segments, segment_keys)
+                for segments, segment_keys in zip(self._segments, self._segment_keys)
+                if len(segments) == len(pattern_segments)]
+
+    def _iglob(self, pathname, depth_segments):
+        """
+        Recursive implementation of iglob, following glob.iglob.
+        """
+        dirname, basename = os.path.split(pathname)
+        if not glob.has_magic(pathname):
+            if basename:
+                if self._lexists(pathname):
+                    yield pathname
+            else:
+                # Patterns ending with a slash should match only directories
+                if os.path.isdir(dirname):
+                    yield pathname
+            return
+        if not dirname:
+            for name in self._glob1(os.curdir, basename, depth_segments):
+                yield name
+            return
+        if dirname != pathname and glob.has_magic(dirname):
+            dirs = self._iglob(dirname, depth_segments)
+        else:
+            dirs = [dirname]
+        if glob.has_magic(basename):
+            glob_in_dir = self._glob1
+        else:
+            glob_in_dir = self._glob0
+        for dirname in dirs:
+            for name in glob_in_dir(dirname, basename, depth_segments):
+                yield os.path.join(dirname, name)
+
+    def _get_path_values(self, path, depth_segments):
+        """
+        Returns the values of the keys found in the segments of a path.
+        """
+        values = {}
+        for depth, name in enumerate(path.rstrip(os.path.sep).split(os.path.sep)):
+            values.update(self._get_entry_values(name, depth, depth_segments))
+        return values
+
+    def _get_entry_values(self, name, depth, depth_segments):
+        """
+        Returns the values of the keys found in a directory entry at a given depth,
+        read with the segment at this depth of the first variation matching it.
+        """
+        for segments, segment_keys in depth_segments:
+            segment = segments[depth]
+            if isinstance(segment, basestring):
+                continue
+            match = segment.match(name)
+            if match is None:
+                continue
+            values = {}
+            for group_name, key in segment_keys[depth]:
+                value_str = match.group(group_name)
+                try:
+                    values[key.name] = key.value_from_str(value_str)
+                except TankError:
+                    values[key.name] = value_str
+            return values
+        return {}
+
+    def _glob1(self, dirname, pattern, depth_segments):
+        """
+        Returns the names in a directory matching a pattern and the template.
+        """
+        names = self._listdir(dirname or os.curdir)
+        if names is None:
+            return []
+        if pattern[0] != ".":
+            names = [x for x in names if x[0] != "."]
+        names = fnmatch.filter(names, pattern)
+
+        if depth_segments:
+            depth = len(os.path.join(dirname, pattern).split(os.path.sep)) - 1
+            names = [x for x in names if _matches_segment(x, depth, depth_segments)]
+        return names
+
+    def _glob0(self, dirname, basename, depth_segments):
+        """
+        Returns the literal name if it exists in a directory.
+        """
+        if basename == "":
+            # `os.path.split()` returns an empty basename for paths ending with a
+            # directory separator.  'q*x/' should match only directories.
+            if os.path.isdir(dirname):
+                return [basename]
+        else:
+            if self._lexists(os.path.join(dirname, basename)):
+                return [basename]
+        return []
+
+    def _listdir(self, dirname):
+        """
+        Lists a directory, only once.
+        """
+        if dirname not in self._listings:
+            try:
+                self._listings[dirname] = os.listdir(dirname)
+            except os.error:
+                self._listings[dirname] = None
+        return self._listings[dirname]
+
+    def _lexists(self, path):
+        """
+        Checks if a path exists, only once.
+        """
+        if path not in self._exists:
+            self._exists[path] = os.path.lexists(path)
+        return self._exists[path]
+
+
+def _get_sort_key(values, sort_by, is_path):
+    """
+    Returns the sort key of a path or a directory from the values of the keys in it.
+    The values of the sort keys missing from a path are left out, the sort key of a
+    directory stops at the first one missing as it may be found further down.
+    """
+    sort_key = []
+    for key_name in sort_by:
+        if key_name in values:
+            sort_key.append(values[key_name])
+        elif not is_path:
+            break
+    return tuple(sort_key)
+
+def _matches_segment(name, depth, depth_segments):
+    """
+    Checks if a directory entry matches the segment at its depth of any of
+    the template variations.
+    """
+    for segments, _ in depth_segments:
+        segment = segments[depth]
+        if isinstance(segment, basestring):
+            if name.lower() == segment:
+                return True
+        elif segment.match(name):
+            return True
+    return False
+
+
+class FrameSequence(object):
+    """
+    Sequence of frame files found on disk for a template.
+
+    The frames are stored as ranges of consecutive frames, which keeps sequences
+    of thousands of frames compact.
+    """
+    def __init__(self, path, fields, frames):
+        """
+        :param path: Abstract path of the sequence, with a frame spec for the frame.
+        :param fields: Values of the keys of the template other than the frame.
+        :param frames: Frame numbers found, in any order.
+        """
+        self.path = path
+        self.fields = fields
+        # list of (first frame, last frame) of each range of consecutive frames
+        self.frame_ranges = []
+        for frame in sorted(set(frames)):
+            if self.frame_ranges and self.frame_ranges[-1][1] == frame - 1:
+                self.frame_ranges[-1] = (self.frame_ranges[-1][0], frame)
+            else:
+                self.frame_ranges.append((frame, frame))
+
+    def __repr__(self):
+        return "<Sgtk %s %s: %s>" % (self.__class__.__name__,
+                                     self.path,
+                                     ", ".join([("%d-%d" % x) if x[0] != x[1] else str(x[0])
+                                                for x in self.frame_ranges]))
+
+    def __len__(self):
+        return sum([last - first + 1 for first, last in self.frame_ranges])
+
+    @property
+    def first_frame(self):
+        """
+        First frame of the sequence.
+        """
+        return self.frame_ranges[0][0]
+
+    @property
+    def last_frame(self):
+        """
+        Last frame of the sequence.
+        """
+        return self.frame_ranges[-1][1]
+
+    @property
+    def frame_range(self):
+        """
+        Tuple of the first and last frames of the sequence.
+        """
+        return self.first_frame, self.last_frame
+
+    @property
+    def frames(self):
+        """
+        Iterator over the frames found, in order.
+        """
+        for first, last in self.frame_ranges:
+            for frame in xrange(first, last + 1):
+                yield frame
+
+    @property
+    def missing_frames(self):
+        """
+        List of the frames missing between the first and last frames.
+        """
+        missing_frames = []
+        for (_, previous_last), (first, _) in zip(self.frame_ranges[:-1], self.frame_ranges[1:]):
+            missing_frames.extend(range(previous_last + 1, first))
+        return missing_frames
+
+
+def find_sequences(template, paths, key_name, frame_value=None):
+    """
+    Groups frame files into sequences.
+
+    Paths are grouped by what surrounds the frame in them, found with the compiled
+    template. Only one path of each group is parsed into fields, the frames of the
+    other paths are just validated by the frame key. Templates whose frame can't be
+    located this way have each of their paths parsed.
+
+    :param template: Template with a sequence key.
+    :param paths: Normalized paths which may match the template, typically found by
+                  a TemplateSearch with the frame key skipped.
+    :param key_name: Name of the sequence key.
+    :param frame_value: Value for the sequence key in the abstract paths of the sequences,
+                        for example "%04d" or "FORMAT: $F". Defaults to the key's default.
+
+    :returns: List of FrameSequence, sorted by path.
+    """
+    key = template.keys[key_name]
+
+    # (text before the frame, text after the frame): frame strings
+    frame_strs = {}
+    # paths which can only be grouped using their fields
+    other_paths = []
+    if template._can_locate_key(key_name):
+        for path in paths:
+            span = template._locate_key(path, key_name)
+            if span is None:
+                continue
+            frame_str = path[span[0]:span[1]]
+            if frame_str.isdigit():
+                frame_strs.setdefault((path[:span[0]], path[span[1]:]), []).append(frame_str)
+    else:
+        other_paths = paths
+
+    # abstract path: (fields, frames)
+    sequences = {}
+    for (prefix, suffix), cur_frame_strs in frame_strs.items():
+        path = prefix + cur_frame_strs[0] + suffix
+        try:
+            fields = template.get_fields(path)
+        except TankError:
+            continue
+        if fields.get(key_name) != key.value_from_str(cur_frame_strs[0]):
+            # the template read the path differently, so go through its fields
+            other_paths = itertools.chain(other_paths, [prefix + x + suffix for x in cur_frame_strs])
+            continue
+
+        frames = []
+        for frame_str in cur_frame_strs:
+            try:
+                frames.append(key.value_from_str(frame_str))
+            except TankError:
+                pass
+        del fields[key_name]
+        _add_frames(sequences, template, fields, frames, key_name, frame_value)
+
+    # fields of the paths: frames
+    fields_frames = {}
+    for path in other_paths:
+        try:
+            fields = template.get_fields(path)
+        except TankError:
+            continue
+        frame = fields.pop(key_name, None)
+        if isinstance(frame, (int, long)):
+            fields_frames.setdefault(tuple(sorted(fields.items())), []).append(frame)
+
+    for fields, frames in fields_frames.items():
+        _add_frames(sequences, template, dict(fields), frames, key_name, frame_value)
+
+    return [FrameSequence(path, fields, frames)
+            for path, (fields, frames) in sorted(sequences.items()) if frames]
+
+
+def _add_frames(sequences, template, fields, frames, key_name, frame_value):
+    """
+    Adds frames to the sequence with the abstract path built from the fields.
+    """
+    abstract_fields = fields.copy()
+    if frame_value is not None:
+        abstract_fields[key_name] = frame_value
+    path = template.apply_fields(abstract_fields)
+    sequences.setdefault(path, (fields, []))[1].extend(frames)
@@ -12,7 +12,9 @@
 Classes for fields on TemplatePaths and TemplateStrings
 """
 
+import os
 import re
+import weakref
 
 from .errors import TankError
 
@@ -22,6 +24,12 @@ VALID_FORMAT_STRINGS = ["%d", "#", "@", "$F"]
 
 class TemplateKey(object):
     """Base class for template keys. Should not be used directly."""
+
+    # keys are held by many templates in long running processes, slots keep them small
+    __slots__ = ("name", "default", "choices", "exclusions", "shotgun_entity_type",
+                 "shotgun_field_name", "is_abstract", "length", "_abstractor",
+                 "_interned", "__weakref__")
+
     def __init__(self,
                  name,
                  default=None,
@@ -49,7 +57,6 @@ class TemplateKey(object):
         self.shotgun_field_name = shotgun_field_name
         self.is_abstract = abstract
         self.length = length
-        self._last_error = ""
 
         # Validation
         if self.shotgun_field_name and not self.shotgun_entity_type:
@@ -58,12 +65,53 @@ class TemplateKey(object):
         if self.is_abstract and self.default is None:
             raise TankError("%s: Fields marked as abstract needs to have a default value!" % self)
 
-        if not ((self.default is None) or self.validate(default)):
-            raise TankError(self._last_error)
-        
-        if not all(self.validate(choice) for choice in self.choices):
-            raise TankError(self._last_error)
+        if self.default is not None:
+            error = self._validate(default)
+            if error is not None:
+                raise TankError(error)
+
+        for choice in self.choices:
+            error = self._validate(choice)
+            if error is not None:
+                raise TankError(error)
     
+    def __setattr__(self, name, value):
+        if not name.startswith("_") and getattr(self, "_interned", False):
+            raise AttributeError("%s is shared by all the templates using it, its settings "
+                                 "can't be modified. Modify a copy of it instead." % self)
+        object.__setattr__(self, name, value)
+
+    def __getstate__(self):
+        state = _get_slots_state(self)
+        # copies and unpickled keys are not shared until they are interned
+        state.pop("_interned", None)
+        for name, value in state.items():
+            if isinstance(value, _FrozenList):
+                state[name] = list(value)
+        return state
+
+    def __setstate__(self, state):
+        _set_slots_state(self, state)
+
+    def _intern(self):
+        """
+        Makes the settings of the key read only, once it is shared by intern_key.
+        """
+        for name in _get_slot_names(self.__class__):
+            value = getattr(self, name, None)
+            if isinstance(value, list) and not name.startswith("_"):
+                object.__setattr__(self, name, _FrozenList(value))
+        object.__setattr__(self, "_interned", True)
+
+    def _get_signature(self):
+        """
+        Returns a hashable value which is the same for keys with the same
+        class and settings.
+        """
+        settings = [(x, _freeze(getattr(self, x, None)))
+                    for x in _get_slot_names(self.__class__) if not x.startswith("_")]
+        return (self.__class__, tuple(settings))
+
     def str_from_value(self, value=None, ignore_type=False):
         """
         Returns a string version of a value as appropriate for the key's setting.
@@ -82,10 +130,21 @@ class TemplateKey(object):
         elif ignore_type:
             return value if isinstance(value, basestring) else str(value)
 
-        if self.validate(value):
-            return self._as_string(value)
-        else:
-            raise TankError(self._last_error)
+        error = self._validate(value)
+        if error is not None:
+            raise TankError(error)
+        return self._as_string(value)
+
+    def strs_from_values(self, values):
+        """
+        Returns string versions of several values, as str_from_value would.
+
+        :param values: List of values to process.
+
+        :returns: List of strings.
+        :throws: TankError if a value is not valid for the key.
+        """
+        return [self.str_from_value(value) for value in values]
 
     def value_from_str(self, str_value):
         """
@@ -95,11 +154,10 @@ class TemplateKey(object):
 
         :returns: The translated value.
         """
-        if self.validate(str_value):
-            value = self._as_value(str_value)
-        else:
-            raise TankError(self._last_error)
-        return value
+        error = self._validate(str_value)
+        if error is not None:
+            raise TankError(error)
+        return self._as_value(str_value)
 
     def validate(self, value):
         """
@@ -109,25 +167,34 @@ class TemplateKey(object):
 
         :returns: Bool
         """
+        return self._validate(value) is None
+
+    def _validate(self, value):
+        """
+        Checks a value is valid for this key. The reason a value is not valid is
+        returned rather than kept on the key, as keys are shared between the
+        configurations and threads of a process.
+
+        :param value: Value to test.
+
+        :returns: Error message, or None if the value is valid.
+        """
         
         str_value = value if isinstance(value, basestring) else str(value)
 
         # We are not case sensitive
-        if str_value.lower() in [str(x).lower() for x in self.exclusions]:
-            self._last_error = "%s Illegal value: %s is forbidden for this key." % (self, value)
-            return False
+        if self.exclusions and str_value.lower() in [str(x).lower() for x in self.exclusions]:
+            return "%s Illegal value: %s is forbidden for this key." % (self, value)
 
         if not((value is None) or (self.choices == [])):
             if str_value.lower() not in [str(x).lower() for x in self.choices]:
-                self._last_error = "%s Illegal value: '%s' not in choices: %s" % (self, value, str(self.choices))
-                return False
+                return "%s Illegal value: '%s' not in choices: %s" % (self, value, str(self.choices))
         
         if self.length is not None and len(str_value) != self.length:
-            self._last_error = ("%s Illegal value: '%s' does not have a length of "
-                                "%d characters." % (self, value, self.length))
-            return False
+            return ("%s Illegal value: '%s' does not have a length of "
+                    "%d characters." % (self, value, self.length))
                         
-        return True
+        return None
 
     def _as_string(self, value):
         raise NotImplementedError
@@ -135,6 +202,25 @@ class TemplateKey(object):
     def _as_value(self, str_value):
         return str_value
 
+    def _value_regex(self):
+        """
+        Returns a regular expression matching the strings this key can take
+        in a path. The expression may accept strings which validate() rejects
+        but it never rejects a valid one, so matches still need validating.
+        """
+        if self.choices:
+            # choices are compared case insensitively, longest first so that
+            # the alternation does not stop at a shorter choice sharing a prefix
+            choices = sorted([str(x) for x in self.choices], key=len, reverse=True)
+            return "(?:%s)" % "|".join([_case_insensitive_regex(x) for x in choices])
+        return self._char_regex() + _quantifier_regex(self.length)
+
+    def _char_regex(self):
+        """
+        Returns a regular expression matching a single character of a value.
+        """
+        return "[^%s]" % re.escape(os.path.sep)
+
     def __repr__(self):
         return "<Sgtk %s %s>" % (self.__class__.__name__, self.name)
 
@@ -147,6 +233,8 @@ class StringKey(TemplateKey):
     """
     Keys whose values are strings.
     """
+    __slots__ = ("filter_by", "_filter_regex_u", "_custom_regex_u")
+
     def __init__(self,
                  name,
                  default=None,
@@ -200,7 +288,7 @@ class StringKey(TemplateKey):
                                         abstract=abstract,
                                         length=length)
 
-    def validate(self, value):
+    def _validate(self, value):
 
         u_value = value
         if not isinstance(u_value, unicode):
@@ -213,25 +301,35 @@ class StringKey(TemplateKey):
             # so here we are checking that there are occurances of 
             # that pattern in the string
             if self._filter_regex_u.search(u_value):
-                self._last_error = "%s Illegal value '%s' does not fit filter_by '%s'" % (self, value, self.filter_by)
-                return False
+                return "%s Illegal value '%s' does not fit filter_by '%s'" % (self, value, self.filter_by)
         
         elif self._custom_regex_u:
             # check for any user specified regexes
             if self._custom_regex_u.match(u_value) is None:
-                self._last_error = "%s Illegal value '%s' does not fit filter_by '%s'" % (self, value, self.filter_by)
-                return False
+                return "%s Illegal value '%s' does not fit filter_by '%s'" % (self, value, self.filter_by)
             
-        return super(StringKey, self).validate(value)
+        return super(StringKey, self)._validate(value)
 
     def _as_string(self, value):
         return value if isinstance(value, basestring) else str(value)
 
+    def _char_regex(self):
+        # validate() works on unicode decoded from utf-8 while paths are
+        # usually byte strings, so any non-ascii byte has to be let through
+        if self.filter_by == "alphanumeric":
+            return r"(?:[^\W_]|[\x80-\xff])"
+        elif self.filter_by == "alpha":
+            return r"(?:[^\W_0-9]|[\x80-\xff])"
+        # custom filter_by regexes are only applied during validation
+        return super(StringKey, self)._char_regex()
+
 
 class IntegerKey(TemplateKey):
     """
     Key whose value is an integer.
     """
+    __slots__ = ("format_spec",)
+
     def __init__(self,
                  name,
                  default=None,
@@ -270,15 +368,42 @@ class IntegerKey(TemplateKey):
 
         self.format_spec = format_spec
 
-    def validate(self, value):
+    def value_from_str(self, str_value):
+        # keys are hit for every frame of a sequence, digits are turned into
+        # numbers straight away when no other check applies
+        if self._is_unrestricted():
+            if isinstance(str_value, int):
+                return str_value
+            if isinstance(str_value, basestring) and str_value.isdigit():
+                return int(str_value)
+        return super(IntegerKey, self).value_from_str(str_value)
+
+    def _validate(self, value):
 
         if value is not None:
             if not (isinstance(value, int) or value.isdigit()):
-                self._last_error = "%s Illegal value %s, expected an Integer" % (self, value)
-                return False
+                return "%s Illegal value %s, expected an Integer" % (self, value)
+            elif self._is_unrestricted():
+                return None
             else:
-                return super(IntegerKey, self).validate(value)
-        return True
+                return super(IntegerKey, self)._validate(value)
+        return None
+
+    def _is_unrestricted(self):
+        """
+        Returns True if any integer is a valid value for this key.
+        """
+        return not self.choices and not self.exclusions and self.length is None
+
+    def strs_from_values(self, values):
+        if self.choices or self.exclusions or self.length is not None:
+            return super(IntegerKey, self).strs_from_values(values)
+        # without restrictions any integer is valid, so a check of the types
+        # is all the validation needed
+        if not all(isinstance(value, int) for value in values):
+            return super(IntegerKey, self).strs_from_values(values)
+        format_string = "%%%sd" % (self.format_spec or "")
+        return [format_string % value for value in values]
 
     def _as_string(self, value):
         if self.format_spec:
@@ -289,10 +414,20 @@ class IntegerKey(TemplateKey):
     def _as_value(self, str_value):
         return int(str_value)
 
+    def _value_regex(self):
+        if self.choices or self.length is not None:
+            return super(IntegerKey, self)._value_regex()
+        return r"\d+?"
+
+    def _char_regex(self):
+        return r"\d"
+
 class SequenceKey(IntegerKey):
     """
     Key whose value is a integer sequence.
     """
+    __slots__ = ("_frame_specs", "_frame_spec_set")
+
     def __init__(self,
                  name,
                  default=None,
@@ -305,6 +440,7 @@ class SequenceKey(IntegerKey):
         # determine the actual frame specs given the padding (format_spec)
         # and the allowed formats
         self._frame_specs = [ _resolve_frame_spec(x, format_spec) for x in VALID_FORMAT_STRINGS ]
+        self._frame_spec_set = frozenset(self._frame_specs)
 
         # all sequences are abstract by default and have a default value of %0Xd
         abstract = True
@@ -322,35 +458,39 @@ class SequenceKey(IntegerKey):
                                           abstract=abstract)
 
 
-    def validate(self, value):
+    def _validate(self, value):
 
-        # use a std error message
-        full_format_strings = ["%s %s" % (FRAMESPEC_FORMAT_INDICATOR, x) for x in VALID_FORMAT_STRINGS]
-        error_msg = "%s Illegal value '%s', expected an Integer, a frame spec or format spec.\n" % (self, value)
-        error_msg += "Valid frame specs: %s\n" % str(self._frame_specs)
-        error_msg += "Valid format strings: %s\n" % full_format_strings
-        
+        if isinstance(value, int):
+            return super(SequenceKey, self)._validate(value)
 
-        if isinstance(value, basestring) and value.startswith(FRAMESPEC_FORMAT_INDICATOR):
+        elif isinstance(value, basestring) and value.startswith(FRAMESPEC_FORMAT_INDICATOR):
             # FORMAT: YXZ string - check that XYZ is in VALID_FORMAT_STRINGS
             pattern = _extract_format_string(value)        
             if pattern in VALID_FORMAT_STRINGS:
-                return True
+                return None
             else:
-                self._last_error = error_msg
-                return False
+                return self._get_error_message(value)
                 
-        elif not(isinstance(value, int) or value.isdigit()):
+        elif not value.isdigit():
             # not a digit - so it must be a frame spec! (like %05d)
             # make sure that it has the right length and formatting.
-            if value in self._frame_specs:
-                return True
+            if value in self._frame_spec_set:
+                return None
             else:
-                self._last_error = error_msg
-                return False
+                return self._get_error_message(value)
                 
         else:
-            return super(SequenceKey, self).validate(value)
+            return super(SequenceKey, self)._validate(value)
+
+    def _get_error_message(self, value):
+        """
+        Returns the std error message for an invalid value.
+        """
+        full_format_strings = ["%s %s" % (FRAMESPEC_FORMAT_INDICATOR, x) for x in VALID_FORMAT_STRINGS]
+        error_msg = "%s Illegal value '%s', expected an Integer, a frame spec or format spec.\n" % (self, value)
+        error_msg += "Valid frame specs: %s\n" % str(self._frame_specs)
+        error_msg += "Valid format strings: %s\n" % full_format_strings
+        return error_msg
 
     def _as_string(self, value):
         
@@ -359,7 +499,7 @@ class SequenceKey(IntegerKey):
             pattern = _extract_format_string(value)
             return _resolve_frame_spec(pattern, self.format_spec)
 
-        if value in self._frame_specs:
+        if value in self._frame_spec_set:
             # a frame spec like #### @@@@@ or %08d
             return value
         
@@ -367,11 +507,18 @@ class SequenceKey(IntegerKey):
             return super(SequenceKey, self)._as_string(value)
 
     def _as_value(self, str_value):
-        if str_value in self._frame_specs:
+        if str_value in self._frame_spec_set:
             return str_value
         else:
             return super(SequenceKey, self)._as_value(str_value)
 
+    def _value_regex(self):
+        # a frame number, one of the frame specs or a FORMAT: string
+        frame_specs = sorted(self._frame_specs, key=len, reverse=True)
+        alternatives = [r"\d+?"] + [re.escape(x) for x in frame_specs]
+        alternatives.append("%s%s*?" % (re.escape(FRAMESPEC_FORMAT_INDICATOR),
+                                        TemplateKey._char_regex(self)))
+        return "(?:%s)" % "|".join(alternatives)
 
 
 
@@ -386,6 +533,29 @@ def _extract_format_string(value):
         pattern = value
     return pattern
 
+def _case_insensitive_regex(value):
+    """
+    Returns a regular expression matching the string value regardless of case.
+
+    "Shots/v"  ==> "[sS][hH][oO][tT][sS]/[vV]"
+    """
+    regex = ""
+    for char in value:
+        if char.lower() != char.upper():
+            regex += "[%s%s]" % (char.lower(), char.upper())
+        else:
+            regex += re.escape(char)
+    return regex
+
+def _quantifier_regex(length):
+    """
+    Returns the regular expression quantifier for a value of the given length,
+    or a lazy quantifier for any length if length is None.
+    """
+    if length is None:
+        return "*?"
+    return "{%d}" % length
+
 def _resolve_frame_spec(format_string, format_spec):
     """
     Turns a format_string %d and a format_spec "03" into a sequence identifier (%03d)
@@ -462,6 +632,88 @@ def make_keys(data):
             key_name = initial_key_name
 
         key = KeyClass(key_name, **prepped_data)
-        keys[initial_key_name] = key
+        keys[initial_key_name] = intern_key(key)
     return keys
 
+
+# keys in use, by signature
+_interned_keys = weakref.WeakValueDictionary()
+
+
+def intern_key(key):
+    """
+    Returns a key with the same class and settings as the given key, sharing a
+    single key object between all the templates and configurations using it.
+    The settings of the keys returned can't be modified.
+
+    :param key: TemplateKey object.
+
+    :returns: The first key in use with these settings, or the given key.
+    """
+    signature = key._get_signature()
+    interned_key = _interned_keys.get(signature)
+    if interned_key is None:
+        key._intern()
+        _interned_keys[signature] = key
+        return key
+    return interned_key
+
+
+class _FrozenList(list):
+    """
+    List setting of an interned key, which can't be modified as the key is shared.
+    Copies are plain lists.
+    """
+    def _modify(self, *args, **kwargs):
+        raise TypeError("The settings of interned template keys can't be modified.")
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = _modify
+    __iadd__ = __imul__ = append = extend = insert = pop = remove = reverse = sort = _modify
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+
+def _freeze(value):
+    """
+    Returns a hashable version of a setting value.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple([_freeze(x) for x in value])
+    if isinstance(value, dict):
+        return tuple(sorted([(k, _freeze(v)) for k, v in value.items()]))
+    return value
+
+
+def _get_slot_names(cls):
+    """
+    Returns the names of the attributes in the slots of a class and of its bases.
+    """
+    names = []
+    for base in reversed(cls.__mro__):
+        for name in base.__dict__.get("__slots__", ()):
+            if name not in ("__weakref__", "__dict__") and name not in names:
+                names.append(name)
+    return names
+
+
+def _get_slots_state(obj):
+    """
+    Returns the pickled state of an object using slots.
+    """
+    state = {}
+    for name in _get_slot_names(obj.__class__):
+        if hasattr(obj, name):
+            state[name] = getattr(obj, name)
+    # subclasses without slots
+    state.update(getattr(obj, "__dict__", {}))
+    return state
+
+
+def _set_slots_state(obj, state):
+    """
+    Restores the state of an object using slots, see _get_slots_state.
+    """
+    for name, value in state.items():
+        setattr(obj, name, value)
+
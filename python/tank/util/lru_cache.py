@@ -0,0 +1,129 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Bounded least recently used cache.
+"""
+
+import threading
+
+# indexes of the links of the list of items
+_PREVIOUS, _NEXT, _KEY, _VALUE = range(4)
+
+
+class LRUCache(object):
+    """
+    Mapping holding at most a given number of items. When it is full, adding an
+    item discards the item which was used least recently.
+
+    The cache counts lookups which found an item (hits) and lookups which didn't
+    (misses). It can be shared between threads.
+
+    Items are kept in a circular doubly linked list ordered from the least to the
+    most recently used, along with a dictionary of the links by key, as
+    collections.OrderedDict is not available in python 2.5.
+    """
+    def __init__(self, max_size):
+        """
+        :param max_size: Maximum number of items in the cache.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        # key: [previous link, next link, key, value]
+        self._links = {}
+        # sentinel link of the list, its next link is the least recently used item
+        self._root = []
+        self._root[:] = [self._root, self._root, None, None]
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # locks can't be pickled, the items are not worth keeping
+        return {"max_size": self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_size"])
+
+    def __len__(self):
+        return len(self._links)
+
+    def __contains__(self, key):
+        return key in self._links
+
+    def _unlink(self, link):
+        """
+        Removes a link from the list.
+        """
+        link[_PREVIOUS][_NEXT] = link[_NEXT]
+        link[_NEXT][_PREVIOUS] = link[_PREVIOUS]
+
+    def _append(self, link):
+        """
+        Adds a link at the most recently used end of the list.
+        """
+        last = self._root[_PREVIOUS]
+        link[_PREVIOUS] = last
+        link[_NEXT] = self._root
+        last[_NEXT] = link
+        self._root[_PREVIOUS] = link
+
+    def get(self, key, default=None):
+        """
+        Returns the item for a key and marks it as the most recently used.
+
+        :param key: Key of the item.
+        :param default: Value returned when there is no item for the key.
+        """
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self._unlink(link)
+            self._append(link)
+            self.hits += 1
+            return link[_VALUE]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        """
+        Adds or replaces an item, discarding the least recently used item if the
+        cache is full.
+
+        :param key: Key of the item.
+        :param value: Value of the item.
+        """
+        self._lock.acquire()
+        try:
+            link = self._links.pop(key, None)
+            if link is not None:
+                self._unlink(link)
+            link = [None, None, key, value]
+            self._append(link)
+            self._links[key] = link
+            while len(self._links) > self.max_size:
+                oldest = self._root[_NEXT]
+                self._unlink(oldest)
+                del self._links[oldest[_KEY]]
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """
+        Discards all the items. Hit and miss counts are kept.
+        """
+        self._lock.acquire()
+        try:
+            self._links.clear()
+            self._root[:] = [self._root, self._root, None, None]
+        finally:
+            self._lock.release()
@@ -0,0 +1,83 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Estimation of the memory used by objects.
+"""
+
+import sys
+import types
+
+# objects which are shared by the whole process and not worth counting
+_SKIPPED_TYPES = (type, types.ClassType, types.ModuleType, types.FunctionType,
+                  types.BuiltinFunctionType, types.MethodType)
+
+
+def _estimate_object_size(obj):
+    """
+    Estimates the number of bytes used by an object from the sizes declared by
+    its type. Memory allocated separately, like the items of lists and dictionaries,
+    is not included.
+    """
+    cls = type(obj)
+    size = cls.__basicsize__
+    if cls.__itemsize__:
+        try:
+            size += cls.__itemsize__ * len(obj)
+        except TypeError:
+            pass
+    return size
+
+
+# sys.getsizeof is not available in python 2.5
+get_object_size = getattr(sys, "getsizeof", _estimate_object_size)
+
+
+def get_size(obj, seen=None):
+    """
+    Returns the number of bytes used by an object and by all the objects it
+    refers to through containers, instance dictionaries and slots.
+
+    :param obj: Object to measure.
+    :param seen: Set of the ids of objects already counted, which are not
+                 counted again. Passing the same set to several calls measures
+                 what each object adds to the previous ones.
+
+    :returns: Size in bytes.
+    """
+    if seen is None:
+        seen = set()
+
+    size = 0
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, _SKIPPED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += get_object_size(obj)
+
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            pending.extend(obj)
+        elif not isinstance(obj, basestring):
+            obj_dict = getattr(obj, "__dict__", None)
+            if isinstance(obj_dict, dict):
+                pending.append(obj_dict)
+            for cls in type(obj).__mro__:
+                slots = cls.__dict__.get("__slots__", ())
+                if isinstance(slots, basestring):
+                    slots = (slots,)
+                for name in slots:
+                    if name not in ("__weakref__", "__dict__") and hasattr(obj, name):
+                        pending.append(getattr(obj, name))
+    return size
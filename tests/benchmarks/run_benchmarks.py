@@ -0,0 +1,134 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Runs the template benchmarks and compares the results with a baseline.
+
+    $ python run_benchmarks.py --output results.json
+    $ python run_benchmarks.py --sizes small,medium --variants plain,typed --save-baseline
+
+The exit code is 1 when a benchmark is slower than its baseline by more than
+the tolerance. Each timing is divided by the time of a calibration workload
+run along with the benchmarks, and the baseline keeps these ratios rather than
+seconds, so that it can be compared against on machines of different speeds.
+"""
+
+import sys
+import os
+import time
+import platform
+from optparse import OptionParser
+
+benchmarks_path = os.path.abspath(os.path.dirname(__file__))
+tests_path = os.path.dirname(benchmarks_path)
+sys.path = [os.path.join(tests_path, "..", "python"), os.path.join(tests_path, "python")] + sys.path
+
+# use api json to cover py 2.5
+from tank_vendor import shotgun_api3
+json = shotgun_api3.shotgun.json
+
+import template_benchmarks
+
+DEFAULT_BASELINE = os.path.join(benchmarks_path, "baseline.json")
+
+
+def compare(ratios, baseline, tolerance):
+    """
+    Compares results with a baseline.
+
+    :param ratios: Times of the benchmarks divided by the calibration time.
+    :param baseline: Ratios of the baseline.
+
+    :returns: List of (name, ratio, baseline ratio, slowdown) for the
+              benchmarks slower than the baseline by more than the tolerance.
+    """
+    regressions = []
+    for name in sorted(ratios):
+        if name not in baseline:
+            continue
+        slowdown = ratios[name] / max(baseline[name], 1e-9)
+        if slowdown > 1.0 + tolerance:
+            regressions.append((name, ratios[name], baseline[name], slowdown))
+    return regressions
+
+
+def write_json(data, path):
+    fh = open(path, "w")
+    try:
+        json.dump(data, fh, indent=4, sort_keys=True)
+    finally:
+        fh.close()
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option("--sizes", default="small,medium",
+                      help="comma separated configuration sizes out of %s" %
+                           ", ".join(sorted(template_benchmarks.CONFIG_SIZES)))
+    parser.add_option("--variants", default=",".join(sorted(template_benchmarks.CONFIG_VARIANTS)),
+                      help="comma separated configuration variants out of %s" %
+                           ", ".join(sorted(template_benchmarks.CONFIG_VARIANTS)))
+    parser.add_option("--benchmarks", default=None,
+                      help="comma separated names of benchmarks to run, all by default")
+    parser.add_option("--repeat", type="int", default=5,
+                      help="number of timed runs of each benchmark, the best one is kept")
+    parser.add_option("--output", default=None, help="file to write the JSON results to")
+    parser.add_option("--baseline", default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_option("--save-baseline", action="store_true", default=False,
+                      help="write the results to the baseline file")
+    parser.add_option("--tolerance", type="float", default=0.25,
+                      help="slowdown relative to the baseline reported as a regression")
+    (options, args) = parser.parse_args()
+
+    sizes = options.sizes.split(",")
+    variants = options.variants.split(",")
+    names = options.benchmarks.split(",") if options.benchmarks else None
+    calibration = template_benchmarks.calibrate(options.repeat)
+    results = template_benchmarks.run(sizes, variants, names, options.repeat,
+                                      log=lambda x: sys.stdout.write(x + "\n"))
+    calibration = min(calibration, template_benchmarks.calibrate(options.repeat))
+    ratios = dict((name, seconds / calibration) for (name, seconds) in results.items())
+
+    data = {"python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "calibration": calibration,
+            "ratios": ratios}
+
+    if options.output:
+        write_json(dict(data, results=results), options.output)
+
+    if options.save_baseline:
+        write_json(data, options.baseline)
+        print "Baseline written to %s" % options.baseline
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print "No baseline found at %s" % options.baseline
+        return 0
+
+    fh = open(options.baseline)
+    try:
+        baseline_data = json.load(fh)
+    finally:
+        fh.close()
+
+    regressions = compare(ratios, baseline_data["ratios"], options.tolerance)
+    for name, ratio, baseline_ratio, slowdown in regressions:
+        print "REGRESSION %-50s %10.4f, baseline %10.4f (x%.2f)" % (name, ratio,
+                                                                  baseline_ratio, slowdown)
+    if regressions:
+        return 1
+    print "No regression against %s" % options.baseline
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
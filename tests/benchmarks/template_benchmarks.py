@@ -0,0 +1,311 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Benchmarks of the template API, run by run_benchmarks.py.
+
+Each benchmark runs against a synthetic configuration whose size is given by
+one of the CONFIG_SIZES below and whose variant is one of the CONFIG_VARIANTS.
+The configuration has several families of templates mixing string, integer and
+sequence keys with and without optional sections, and a directory tree with
+versions and frames for the render templates. The variant sets the number of
+optional sections and the types of the keys of the file templates.
+"""
+
+import os
+import time
+
+from tank_vendor import yaml
+
+from tank_test import tank_test_base
+from tank_test.tank_test_base import TankTestBase
+
+import tank
+from tank.template import read_templates
+
+
+# number of template groups, versions and frames for each configuration size
+CONFIG_SIZES = {"small": {"groups": 5, "versions": 3, "frames": 20},
+                "medium": {"groups": 25, "versions": 10, "frames": 50},
+                "large": {"groups": 100, "versions": 20, "frames": 100}}
+
+# number of optional sections and types of the keys in the file templates
+CONFIG_VARIANTS = {"plain": {"optional_sections": 0, "key_types": ["str"]},
+                   "optional": {"optional_sections": 3, "key_types": ["str"]},
+                   "typed": {"optional_sections": 3, "key_types": ["str", "int", "sequence"]},
+                   "optional5": {"optional_sections": 5, "key_types": ["str"]},
+                   "optional6": {"optional_sections": 6, "key_types": ["str"]}}
+
+# number of keys in the file names of the file templates, at least the
+# number of optional sections of every variant
+FILE_KEY_COUNT = 6
+
+FILE_KEY_TYPES = {"str": {"type": "str", "filter_by": "alphanumeric"},
+                  "int": {"type": "int", "format_spec": "03"},
+                  "sequence": {"type": "sequence", "format_spec": "04"}}
+
+# template definitions in each group, %(group)s is replaced by the group name
+TEMPLATE_DEFINITIONS = {
+    "shot_area": "sequences/{Sequence}/{Shot}/{Step}/%(group)s",
+    "shot_work": "sequences/{Sequence}/{Shot}/{Step}/%(group)s/work/{Shot}_{name}.v{version}.ma",
+    "shot_snapshot": "sequences/{Sequence}/{Shot}/{Step}/%(group)s/work/snapshots/"
+                     "{Shot}_{name}.v{version}.{timestamp}.ma",
+    "shot_render": "sequences/{Sequence}/{Shot}/{Step}/%(group)s/renders/{name}/v{version}/"
+                   "{Shot}_{name}[_{eye}].v{version}[.{SEQ}].exr",
+    "asset_work": "assets/{sg_asset_type}/{Asset}/{Step}/%(group)s/work/{Asset}_{name}[_{variant}].v{version}.ma",
+    "asset_publish": "assets/{sg_asset_type}/{Asset}/{Step}/%(group)s/publish/{Asset}_{name}.v{version}.ma",
+}
+
+KEYS = {
+    "Sequence": {"type": "str"},
+    "Shot": {"type": "str"},
+    "Step": {"type": "str"},
+    "Asset": {"type": "str"},
+    "sg_asset_type": {"type": "str", "choices": ["Character", "Prop", "Environment"]},
+    "name": {"type": "str", "filter_by": "alphanumeric"},
+    "variant": {"type": "str", "filter_by": "alpha"},
+    "eye": {"type": "str", "choices": ["L", "R"]},
+    "timestamp": {"type": "str"},
+    "version": {"type": "int", "format_spec": "03"},
+    "SEQ": {"type": "sequence", "format_spec": "04"},
+}
+
+# fields of the render files created on disk
+RENDER_FIELDS = {"Sequence": "seq_01", "Shot": "shot_010", "Step": "Light", "name": "beauty"}
+
+
+def make_file_definition(optional_sections, key_types):
+    """
+    Returns the definition of the file templates of a configuration variant and
+    the keys it uses. The first keys of the file name are in optional sections.
+    """
+    keys = {}
+    definition = "sequences/{Sequence}/{Shot}/{Step}/%(group)s/files/{Shot}"
+    for index in range(FILE_KEY_COUNT):
+        key_type = key_types[index % len(key_types)]
+        key_name = "file_%s%d" % (key_type, index)
+        keys[key_name] = FILE_KEY_TYPES[key_type]
+        section = "_{%s}" % key_name
+        if index < optional_sections:
+            section = "[%s]" % section
+        definition += section
+    return definition + ".ma", keys
+
+
+def make_templates_data(groups, variant):
+    """
+    Returns the data of a templates.yml file with a number of template groups.
+    """
+    file_definition, file_keys = make_file_definition(**CONFIG_VARIANTS[variant])
+    definitions = dict(TEMPLATE_DEFINITIONS, shot_file=file_definition)
+    paths = {}
+    for index in range(groups):
+        group = "g%03d" % index
+        for name, definition in definitions.items():
+            paths["%s_%s" % (name, group)] = definition % {"group": group}
+    strings = {"shot_publish_name": "{Shot}_{name}_v{version}"}
+    return {"keys": dict(KEYS, **file_keys), "paths": paths, "strings": strings}
+
+
+class BenchmarkProject(TankTestBase):
+    """
+    Test project set up with a synthetic configuration.
+    """
+    def __init__(self, size, variant):
+        super(BenchmarkProject, self).__init__()
+        self.size = size
+        self.variant = variant
+        self.config = CONFIG_SIZES[size]
+
+    def runTest(self):
+        # needed to instantiate the test case, never run
+        pass
+
+    def setUp(self):
+        super(BenchmarkProject, self).setUp()
+        self.setup_fixtures()
+        self.templates_file = os.path.join(self.project_config, "core", "templates.yml")
+        self.create_file(self.templates_file, yaml.dump(make_templates_data(self.config["groups"],
+                                                                            self.variant)))
+        self.tk = tank.Tank(self.project_root)
+        # the parsing itself is measured, not the get_fields cache
+        self.tk.templates.set_fields_cache_size(0)
+
+        self.render_template = self.tk.templates["shot_render_g000"]
+        self.render_paths = []
+        for version in range(1, self.config["versions"] + 1):
+            for frame in range(1, self.config["frames"] + 1):
+                fields = dict(RENDER_FIELDS, version=version, SEQ=frame)
+                path = self.render_template.apply_fields(fields)
+                self.create_file(path)
+                self.render_paths.append(path)
+
+        # a sample of paths of all the template families, and paths which fit none
+        self.sample_fields = []
+        self.sample_paths = []
+        sample_groups = tuple("_g%03d" % x for x in range(min(5, self.config["groups"])))
+        for template_name in sorted(self.tk.templates):
+            if not template_name.endswith(sample_groups):
+                continue
+            template = self.tk.templates[template_name]
+            fields = self._make_fields(template)
+            self.sample_fields.append((template, fields))
+            self.sample_paths.append(template.apply_fields(fields))
+        self.unknown_paths = [os.path.join(self.project_root, "unknown", "%d.ma" % x) for x in range(10)]
+
+        # paths of the file template with each combination of optional fields
+        self.file_template = self.tk.templates["shot_file_g000"]
+        file_fields = self._make_fields(self.file_template)
+        optional_names = sorted(x for x in self.file_template.keys
+                                if self.file_template.is_optional(x))
+        self.file_paths = []
+        for mask in range(2 ** len(optional_names)):
+            fields = dict(file_fields)
+            for index, key_name in enumerate(optional_names):
+                if mask & (1 << index):
+                    del fields[key_name]
+            self.file_paths.append(self.file_template.apply_fields(fields))
+
+    def _make_fields(self, template):
+        fields = {}
+        for key_name, key in template.keys.items():
+            if key.choices:
+                fields[key_name] = key.choices[0]
+            elif isinstance(key, tank.templatekey.IntegerKey):
+                fields[key_name] = 3
+            else:
+                fields[key_name] = "value%s" % key_name.lower().replace("_", "")
+        return fields
+
+    def clear_templates_cache(self):
+        cache_path = self.pipeline_configuration.get_templates_cache_location()
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+
+def bench_read_templates_cold(project):
+    project.clear_templates_cache()
+    read_templates(project.pipeline_configuration)
+
+def bench_read_templates_cached(project):
+    read_templates(project.pipeline_configuration)
+
+def bench_get_fields(project):
+    for template, path in zip([x[0] for x in project.sample_fields], project.sample_paths):
+        template.get_fields(path)
+
+def bench_get_fields_frames(project):
+    get_fields = project.render_template.get_fields
+    for path in project.render_paths:
+        get_fields(path)
+
+def bench_get_fields_optional(project):
+    get_fields = project.file_template.get_fields
+    for path in project.file_paths:
+        get_fields(path)
+
+def bench_validate(project):
+    templates = [x[0] for x in project.sample_fields]
+    for template in templates[:10]:
+        for path in project.sample_paths + project.unknown_paths:
+            template.validate(path)
+
+def bench_apply_fields(project):
+    for template, fields in project.sample_fields:
+        template.apply_fields(fields)
+
+def bench_template_from_path(project):
+    for path in project.sample_paths + project.unknown_paths:
+        project.tk.template_from_path(path)
+
+def bench_paths_from_template(project):
+    project.tk.paths_from_template(project.render_template, RENDER_FIELDS)
+
+def bench_abstract_paths_from_template(project):
+    project.tk.abstract_paths_from_template(project.render_template, RENDER_FIELDS)
+
+
+BENCHMARKS = [bench_read_templates_cold,
+              bench_read_templates_cached,
+              bench_get_fields,
+              bench_get_fields_frames,
+              bench_get_fields_optional,
+              bench_validate,
+              bench_apply_fields,
+              bench_template_from_path,
+              bench_paths_from_template,
+              bench_abstract_paths_from_template]
+
+
+# shortest duration of a timed run, quick benchmarks are called several times per run
+MIN_RUN_TIME = 0.05
+
+
+def time_call(func, project, repeat):
+    """
+    Returns the time of a call of a benchmark, in seconds, from the best out
+    of several timed runs.
+    """
+    # the first call warms up lazy templates and compiled expressions
+    start = time.time()
+    func(project)
+    number = max(1, int(MIN_RUN_TIME / max(time.time() - start, 1e-6)))
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        for _ in xrange(number):
+            func(project)
+        times.append((time.time() - start) / number)
+    return min(times)
+
+
+def _calibration_workload(project):
+    values = {}
+    for index in xrange(20000):
+        values["%d" % (index % 100)] = index * 2
+
+def calibrate(repeat=5):
+    """
+    Returns the time of a fixed pure python workload, in seconds, measuring the
+    speed of the machine the benchmarks run on.
+    """
+    return time_call(_calibration_workload, None, repeat)
+
+
+def run(sizes, variants, names=None, repeat=5, log=None):
+    """
+    Runs benchmarks for configurations of the given sizes and variants.
+
+    :param sizes: Names of configuration sizes, see CONFIG_SIZES.
+    :param variants: Names of configuration variants, see CONFIG_VARIANTS.
+    :param names: Names of the benchmarks to run, all of them if None.
+    :param repeat: Number of timed calls of each benchmark.
+    :param log: Function called with a message after each benchmark.
+
+    :returns: Dictionary of form {"<size>/<variant>/<benchmark name>": seconds}
+    """
+    tank_test_base.setUpModule()
+    results = {}
+    for size in sizes:
+        for variant in variants:
+            project = BenchmarkProject(size, variant)
+            project.setUp()
+            try:
+                for func in BENCHMARKS:
+                    name = func.__name__[len("bench_"):]
+                    if names and name not in names:
+                        continue
+                    result_name = "%s/%s/%s" % (size, variant, name)
+                    results[result_name] = time_call(func, project, repeat)
+                    if log:
+                        log("%-50s %10.6f s" % (result_name, results[result_name]))
+            finally:
+                project.tearDown()
+    return results
@@ -0,0 +1,156 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import tank
+from mock import patch
+from tank import path_cache
+from tank import folder
+from tank_test.tank_test_base import *
+
+
+class TestRebuildPathCache(TankTestBase):
+    """
+    Tests rebuilding the path cache from the folders on disk.
+    """
+    def setUp(self):
+        super(TestRebuildPathCache, self).setUp()
+        self.setup_fixtures()
+
+        self.seq = {"type": "Sequence",
+                    "id": 2,
+                    "code": "seq_code",
+                    "project": self.project}
+        self.shot = {"type": "Shot",
+                     "id": 1,
+                     "code": "shot_code",
+                     "sg_sequence": self.seq,
+                     "project": self.project}
+        self.other_shot = {"type": "Shot",
+                           "id": 5,
+                           "code": "shot_code",
+                           "sg_sequence": {"type": "Sequence", "id": 6},
+                           "project": self.project}
+        self.step = {"type": "Step",
+                     "id": 3,
+                     "code": "step_code",
+                     "short_name": "step_short_name"}
+        self.asset = {"type": "Asset",
+                      "id": 4,
+                      "sg_asset_type": "assettype",
+                      "code": "assetname",
+                      "project": self.project}
+        self.task = {"type": "Task",
+                     "id": 1,
+                     "content": "this task",
+                     "entity": self.shot,
+                     "step": {"type": "Step", "id": 3},
+                     "project": self.project}
+
+        self.add_to_sg_mock_db([self.shot, self.other_shot, self.seq, self.step,
+                                self.project, self.asset, self.task])
+
+        # add mock schema data so that a list of the asset type enum values can be returned
+        data = {}
+        data["properties"] = {}
+        data["properties"]["valid_values"] = {}
+        data["properties"]["valid_values"]["value"] = ["assettype"]
+        data["data_type"] = {}
+        data["data_type"]["value"] = "list"
+        self.add_to_sg_schema_db("Asset", "sg_asset_type", data)
+
+        self.tk = tank.Tank(self.project_root)
+        # the fixture pipeline configuration has another project id than the mocked project
+        self.tk.pipeline_configuration.get_project_id = lambda: self.project["id"]
+
+        folder.process_filesystem_structure(self.tk, "Task", [self.task["id"]], preview=False, engine=None)
+        folder.process_filesystem_structure(self.tk, "Asset", [self.asset["id"]], preview=False, engine=None)
+
+        self.path_cache = path_cache.PathCache(self.tk.pipeline_configuration)
+        self.shot_path = os.path.join(self.project_root, "sequences", "seq_code", "shot_code")
+
+    def tearDown(self):
+        self.path_cache.close()
+        self.path_cache = None
+        super(TestRebuildPathCache, self).tearDown()
+
+    def _get_records(self):
+        return sorted((t, i, r, p, x) for t, i, n, r, p, x in self.path_cache._get_records())
+
+    def test_rebuild(self):
+        records = self._get_records()
+        self.assertTrue(("Shot", self.shot["id"], "primary", "/sequences/seq_code/shot_code", True) in records)
+
+        self.path_cache.replace_mappings([])
+        self.assertEquals([], self.path_cache.get_paths("Shot", self.shot["id"]))
+
+        result = folder.rebuild_path_cache(self.tk, preview=False)
+        self.assertEquals(records, self._get_records())
+        self.assertEquals([], result["removed"])
+        self.assertEquals(len(records), len(result["added"]))
+        self.assertEquals([self.shot_path], self.path_cache.get_paths("Shot", self.shot["id"]))
+
+    def test_single_thread(self):
+        records = self._get_records()
+        self.path_cache.replace_mappings([])
+        folder.rebuild_path_cache(self.tk, preview=False, num_threads=1)
+        self.assertEquals(records, self._get_records())
+
+    def test_preview(self):
+        stale_path = os.path.join(self.project_root, "sequences", "seq_code", "old_shot")
+        self.path_cache.add_mapping("Shot", 99, "old_shot", stale_path)
+        records = self._get_records()
+
+        result = folder.rebuild_path_cache(self.tk, preview=True)
+        self.assertEquals([], result["added"])
+        self.assertEquals([{"entity": {"type": "Shot", "id": 99, "name": "old_shot"},
+                            "path": stale_path,
+                            "primary": True}], result["removed"])
+        self.assertEquals(records, self._get_records())
+
+        folder.rebuild_path_cache(self.tk, preview=False)
+        self.assertEquals([], self.path_cache.get_paths("Shot", 99))
+        self.assertEquals(len(records) - 1, len(self._get_records()))
+
+    def test_unresolved(self):
+        unknown_path = os.path.join(self.project_root, "sequences", "seq_code", "unknown_shot")
+        os.makedirs(os.path.join(unknown_path, "step_short_name"))
+
+        result = folder.rebuild_path_cache(self.tk, preview=True)
+        # the folders below the unknown shot are not reported
+        self.assertEquals([unknown_path], result["unresolved"])
+        self.assertEquals([], result["added"])
+
+    def test_unresolved_kept(self):
+        unknown_path = os.path.join(self.project_root, "sequences", "seq_code", "unknown_shot")
+        os.makedirs(unknown_path)
+        self.path_cache.add_mapping("Shot", 99, "unknown_shot", unknown_path)
+
+        result = folder.rebuild_path_cache(self.tk, preview=False)
+        self.assertEquals([unknown_path], result["unresolved"])
+        self.assertEquals([], result["removed"])
+        self.assertEquals([unknown_path], self.path_cache.get_paths("Shot", 99))
+
+    @patch("tank.folder.rebuild.os.listdir", side_effect=os.listdir)
+    def test_unreadable_kept(self, listdir):
+        records = self._get_records()
+        self.assertTrue([x for x in records if x[3].startswith("/sequences/seq_code/shot_code/")])
+
+        original_listdir = listdir.side_effect
+        def failing_listdir(path):
+            if path == self.shot_path:
+                raise OSError("Stale file handle")
+            return original_listdir(path)
+        listdir.side_effect = failing_listdir
+
+        result = folder.rebuild_path_cache(self.tk, preview=False)
+        self.assertEquals([self.shot_path], result["unreadable"])
+        self.assertEquals([], result["removed"])
+        self.assertEquals(records, self._get_records())
@@ -180,6 +180,9 @@ class TankTestBase(unittest.TestCase):
         
         self.pipeline_configuration = sgtk.pipelineconfig.from_path(project_tank)        
 
+        # lookups cached by previous tests are about another path cache db
+        sgtk.path_cache.clear_lookup_caches()
+
         # add project to mock sg and path cache db
         self.add_production_path(self.project_root, self.project)
         
@@ -13,6 +13,8 @@ import unittest2 as unittest
 
 from mock import Mock, patch
 
+from tank_vendor import yaml
+
 import tank
 from tank.api import Tank
 from tank.errors import TankError
@@ -28,6 +30,65 @@ class TestInit(TankTestBase):
         self.assertEquals(self.project_root, tank.project_path)
 
 
+class TestTemplates(TankTestBase):
+    """Cases testing the Tank.templates dictionary"""
+    def setUp(self):
+        super(TestTemplates, self).setUp()
+        self.setup_fixtures()
+        self.tk = Tank(self.project_root)
+
+    def test_lazy(self):
+        self.assertTrue(len(self.tk.templates) > 0)
+        self.assertEquals(0, self.tk.templates.materialized_count)
+        self.tk.templates["maya_shot_work"]
+        self.assertEquals(1, self.tk.templates.materialized_count)
+
+    def test_reload(self):
+        template = self.tk.templates["maya_shot_work"]
+        self.tk.reload_templates()
+        self.assertEquals(0, self.tk.templates.materialized_count)
+        self.assertFalse(template is self.tk.templates["maya_shot_work"])
+
+    def test_reload_invalid_definition(self):
+        templates = self.tk.templates
+        config_file = os.path.join(self.project_config, "core", "templates.yml")
+        data = yaml.load(open(config_file))
+        data["paths"]["bad_path"] = "shots/{missing}"
+        self.create_file(config_file, yaml.dump(data))
+        self.assertRaises(TankError, self.tk.reload_templates)
+        # the previous templates are kept
+        self.assertTrue(templates is self.tk.templates)
+        self.assertFalse("bad_path" in self.tk.templates)
+
+    def test_memory_footprint(self):
+        self.tk.templates["maya_shot_work"]
+        footprint = self.tk.get_memory_footprint()
+        self.assertEquals(1, footprint["created_templates"])
+        self.assertEquals(len(self.tk.templates), footprint["templates"])
+        self.assertTrue(footprint["keys_bytes"] > 0)
+        self.tk.templates = {}
+        self.assertEquals(None, self.tk.get_memory_footprint())
+
+    def test_fields_cache(self):
+        template = self.tk.templates["maya_shot_work"]
+        path = template.apply_fields({"Sequence": "seq_1", "Shot": "shot_1", "Step": "Anm",
+                                      "name": "main", "version": 3})
+        template.get_fields(path)
+        template.get_fields(path)
+        self.assertEquals({"hits": 1, "misses": 1, "size": 1}, self.tk.templates.get_fields_cache_stats())
+        # cleared on reload
+        self.tk.reload_templates()
+        self.assertEquals(0, template.get_fields_cache_stats()["size"])
+
+    def test_fields_cache_disabled(self):
+        config_file = os.path.join(self.project_config, "core", "pipeline_configuration.yml")
+        data = yaml.load(open(config_file))
+        data["templates_fields_cache_size"] = 0
+        self.create_file(config_file, yaml.dump(data))
+        self.tk.reload_templates()
+        self.assertEquals(None, self.tk.templates["maya_shot_work"].get_fields_cache_stats())
+
+
 class TestTemplateFromPath(TankTestBase):
     """Cases testing Tank.template_from_path method"""
     def setUp(self):
@@ -58,6 +119,56 @@ class TestTemplateFromPath(TankTestBase):
         self.assertIsInstance(template, TemplateString)
 
 
+    def test_templates_changed(self):
+        """Templates added after the first look up are found."""
+        file_path = os.path.join(self.project_root, "foo", "bar_1.ma")
+        self.assertTrue(self.tk.template_from_path(file_path) is None)
+        keys = {"name": StringKey("name")}
+        template = TemplatePath("foo/{name}.ma", keys, self.project_root)
+        self.tk.templates["foo_template"] = template
+        self.assertEquals(template, self.tk.template_from_path(file_path))
+
+    def test_templates_not_created(self):
+        """Looking up a path only creates the templates which may match it."""
+        file_path = os.path.join(self.project_root, "foo", "bar_1.ma")
+        self.tk.template_from_path(file_path)
+        self.assertTrue(self.tk.templates.materialized_count < len(self.tk.templates) / 2)
+
+    def test_ambiguous_path(self):
+        keys = {"name": StringKey("name")}
+        self.tk.templates["foo_a"] = TemplatePath("foo/{name}.ma", keys, self.project_root)
+        self.tk.templates["foo_b"] = TemplatePath("foo/bar_{name}.ma", keys, self.project_root)
+        file_path = os.path.join(self.project_root, "foo", "bar_1.ma")
+        self.assertRaises(TankError, self.tk.template_from_path, file_path)
+
+
+class TestTemplatesFromPaths(TankTestBase):
+    """Cases testing Tank.templates_from_paths method"""
+    def setUp(self):
+        super(TestTemplatesFromPaths, self).setUp()
+        self.setup_fixtures()
+        self.tk = Tank(self.project_root)
+
+    def test_same_as_template_from_path(self):
+        paths = [os.path.join(self.project_root, "sequences", "Sequence_1", "shot_010", "Anm",
+                              "publish", "shot_010.jfk.v001.ma"),
+                 os.path.join(self.project_root, "sequences", "Sequence_1", "shot_010", "Anm",
+                              "publish", "shot_010.jfk.v002.ma"),
+                 os.path.join(self.project_root, "sequences", "Sequence_1", "shot_010", "Anm",
+                              "publish", "unknown.ma"),
+                 os.path.join(self.project_root, "sequences", "Sequence_1", "shot_010"),
+                 "Nuke Script Name, v02"]
+        result = self.tk.templates_from_paths(paths)
+        self.assertEquals(set(paths), set(result))
+        for path in paths:
+            self.assertEquals(self.tk.template_from_path(path), result[path])
+            # same as validating the path against every template
+            matched = [t for t in self.tk.templates.values() if t.validate(path)]
+            self.assertEquals(matched[:1], [result[path]] if result[path] else [])
+        self.assertTrue(result[paths[2]] is None)
+        self.assertIsInstance(result[paths[0]], TemplatePath)
+
+
 class TestTemplatesLoaded(TankTestBase):
     """Test case for the loading of templates from project level config."""
     def setUp(self):
@@ -184,6 +295,145 @@ class TestPathsFromTemplate(TankTestBase):
         self.assertNotIn(bad_file_path, result)
 
 
+class TestIterPathsFromTemplate(TankTestBase):
+    """Tests for Tank.iter_paths_from_template."""
+    def setUp(self):
+        super(TestIterPathsFromTemplate, self).setUp()
+        self.tk = Tank(self.project_root)
+        keys = {"Shot": StringKey("Shot"),
+                "name": StringKey("name"),
+                "version": IntegerKey("version", format_spec="03")}
+        self.template = TemplatePath("{Shot}/work/{name}[.v{version}].ma", keys, self.project_root)
+
+        self.paths = []
+        for shot in ["shot_1", "shot_2"]:
+            for version in [10, 2, 1]:
+                path = self.template.apply_fields({"Shot": shot, "name": "scene", "version": version})
+                self.create_file(path)
+                self.paths.append(path)
+        path = self.template.apply_fields({"Shot": "shot_1", "name": "scene"})
+        self.create_file(path)
+        self.paths.append(path)
+
+    def test_same_as_paths_from_template(self):
+        fields = {"name": "scene"}
+        expected = self.tk.paths_from_template(self.template, fields, skip_missing_optional_keys=True)
+        actual = list(self.tk.iter_paths_from_template(self.template, fields,
+                                                       skip_missing_optional_keys=True))
+        self.assertEquals(sorted(expected), sorted(actual))
+        self.assertEquals(sorted(self.paths), sorted(actual))
+
+    def test_deduplicated(self):
+        # versioned files match the globs of both variations
+        actual = list(self.tk.iter_paths_from_template(self.template, {}, skip_missing_optional_keys=True))
+        self.assertEquals(len(set(actual)), len(actual))
+        self.assertEquals(sorted(self.paths), sorted(actual))
+
+    @patch("tank.template_search.os.listdir", side_effect=os.listdir)
+    def test_early_termination(self, listdir):
+        paths = self.tk.iter_paths_from_template(self.template, {"name": "scene"},
+                                                 skip_keys=["version"], sort_by=["Shot"])
+        first_path = paths.next()
+        self.assertEquals("shot_1", self.template.get_fields(first_path)["Shot"])
+        # the directories of other shots were not searched
+        listed = [args[0] for args, kwargs in listdir.call_args_list]
+        self.assertFalse(os.path.join(self.project_root, "shot_2", "work") in listed)
+
+    def test_sort_by(self):
+        fields = {"Shot": "shot_1", "name": "scene"}
+        actual = list(self.tk.iter_paths_from_template(self.template, fields, skip_keys=["version"],
+                                                       sort_by=["version"]))
+        expected = [self.template.apply_fields(dict(fields, version=x)) for x in [1, 2, 10]]
+        expected.insert(0, self.template.apply_fields(fields))
+        self.assertEquals(expected, actual)
+
+    def test_sort_by_across_directories(self):
+        actual = list(self.tk.iter_paths_from_template(self.template, {"name": "scene"},
+                                                       skip_keys=["version"], sort_by="version"))
+        fields = [self.template.get_fields(x) for x in actual]
+        self.assertEquals([None, 1, 1, 2, 2, 10, 10], [x.get("version") for x in fields])
+        self.assertEquals(["shot_1"] + ["shot_1", "shot_2"] * 3, [x["Shot"] for x in fields])
+
+    def test_sort_by_several_keys(self):
+        actual = list(self.tk.iter_paths_from_template(self.template, {"name": "scene"},
+                                                       skip_keys=["version"], sort_by=["Shot", "version"]))
+        fields = [self.template.get_fields(x) for x in actual]
+        self.assertEquals(["shot_1"] * 4 + ["shot_2"] * 3, [x["Shot"] for x in fields])
+        self.assertEquals([None, 1, 2, 10, 1, 2, 10], [x.get("version") for x in fields])
+
+
+class UnlocatedTemplatePath(TemplatePath):
+    """Template whose keys can't be located in paths."""
+    __slots__ = ()
+
+    def _can_locate_key(self, key_name):
+        return False
+
+
+class TestSequencesFromTemplate(TankTestBase):
+    """Tests for Tank.sequences_from_template."""
+    def setUp(self):
+        super(TestSequencesFromTemplate, self).setUp()
+        self.tk = Tank(self.project_root)
+        self.keys = {"Shot": StringKey("Shot"),
+                     "name": StringKey("name"),
+                     "frame": SequenceKey("frame", format_spec="04")}
+        self.template = TemplatePath("{Shot}/renders/{name}.{frame}.exr", self.keys, self.project_root)
+
+        for name, frames in [("beauty", range(1, 6) + range(7, 11)), ("depth", [1001, 1002])]:
+            for frame in frames:
+                self.create_file(self.template.apply_fields({"Shot": "shot_1", "name": name, "frame": frame}))
+        self.create_file(os.path.join(self.project_root, "shot_1", "renders", "notes.txt"))
+
+    def test_sequences(self):
+        sequences = self.tk.sequences_from_template(self.template, {"Shot": "shot_1"})
+        self.assertEquals(2, len(sequences))
+        beauty, depth = sequences
+
+        self.assertEquals(os.path.join(self.project_root, "shot_1", "renders", "beauty.%04d.exr"), beauty.path)
+        self.assertEquals({"Shot": "shot_1", "name": "beauty"}, beauty.fields)
+        self.assertEquals((1, 10), beauty.frame_range)
+        self.assertEquals([(1, 5), (7, 10)], beauty.frame_ranges)
+        self.assertEquals([6], beauty.missing_frames)
+        self.assertEquals(9, len(beauty))
+        self.assertEquals(range(1, 6) + range(7, 11), list(beauty.frames))
+
+        self.assertEquals((1001, 1002), depth.frame_range)
+        self.assertEquals([], depth.missing_frames)
+
+    def test_same_as_abstract_paths(self):
+        expected = self.tk.abstract_paths_from_template(self.template, {"Shot": "shot_1"})
+        sequences = self.tk.sequences_from_template(self.template, {"Shot": "shot_1"})
+        self.assertEquals(sorted(expected), [x.path for x in sequences])
+
+    def test_frame_spec(self):
+        for frame_value, frame_spec in [("FORMAT: #", "####"),
+                                        ("FORMAT: $F", "$F4"),
+                                        ("@@@@", "@@@@")]:
+            sequences = self.tk.sequences_from_template(self.template, {"Shot": "shot_1",
+                                                                        "name": "depth",
+                                                                        "frame": frame_value})
+            expected = os.path.join(self.project_root, "shot_1", "renders", "depth.%s.exr" % frame_spec)
+            self.assertEquals([expected], [x.path for x in sequences])
+
+    @patch("tank.template.TemplatePath.get_fields", autospec=True,
+           side_effect=TemplatePath.get_fields)
+    def test_fields_read_once_per_sequence(self, get_fields):
+        self.tk.sequences_from_template(self.template, {"Shot": "shot_1"})
+        self.assertEquals(2, get_fields.call_count)
+
+    def test_parsed_without_compiled_template(self):
+        # the paths of templates whose frame can't be located are parsed one by one
+        template = UnlocatedTemplatePath("{Shot}/renders/{name}.{frame}.exr", self.keys, self.project_root)
+        sequences = self.tk.sequences_from_template(template, {"Shot": "shot_1"})
+        self.assertEquals([(1, 10), (1001, 1002)], [x.frame_range for x in sequences])
+        self.assertEquals([6], sequences[0].missing_frames)
+
+    def test_no_sequence_key(self):
+        template = TemplatePath("{Shot}/renders/{name}.exr", self.keys, self.project_root)
+        self.assertRaises(TankError, self.tk.sequences_from_template, template, {})
+
+
 class TestAbstractPathsFromTemplate(TankTestBase):
     """Tests Tank.abstract_paths_from_template method."""
     def setUp(self):
@@ -306,7 +556,7 @@ class TestAbstractPathsFromTemplate(TankTestBase):
 
 
 class TestPathsFromTemplateGlob(TankTestBase):
-    """Tests for Tank.paths_from_template method which check the string sent to glob.glob."""
+    """Tests for Tank.paths_from_template method which check the glob string searched for."""
     def setUp(self):
         super(TestPathsFromTemplateGlob, self).setUp()
         self.tk = Tank(self.project_root)
@@ -316,7 +566,7 @@ class TestPathsFromTemplateGlob(TankTestBase):
 
         self.template = TemplatePath("{Shot}/{version}/filename.{seq_num}", keys, root_path=self.project_root)
 
-    @patch("tank.api.glob.iglob")
+    @patch("tank.api.TemplateSearch.iglob")
     def assert_glob(self, fields, expected_glob, skip_keys, mock_glob):
         # want to ensure that value returned from glob is returned
         expected = [os.path.join(self.project_root, "shot_1","001","filename.00001")]
@@ -374,6 +624,28 @@ class TestPathsFromTemplateGlob(TankTestBase):
         self.assert_glob(fields, expected_glob, skip_keys)
 
     
+class TestEntitiesFromPaths(TankTestBase):
+    def setUp(self):
+        super(TestEntitiesFromPaths, self).setUp()
+        self.tk = Tank(self.project_root)
+        self.seq = {"type": "Sequence", "id": 2, "name": "seq_1"}
+        self.shot = {"type": "Shot", "id": 1, "name": "shot_1"}
+        self.seq_path = os.path.join(self.project_root, "sequences", "seq_1")
+        self.shot_path = os.path.join(self.seq_path, "shot_1")
+        self.add_production_path(self.seq_path, self.seq)
+        self.add_production_path(self.shot_path, self.shot)
+
+    def test_entities_from_paths(self):
+        other_path = os.path.join(self.project_root, "other")
+        result = self.tk.entities_from_paths([self.shot_path, self.seq_path, other_path])
+        self.assertEquals({self.shot_path: self.shot, self.seq_path: self.seq, other_path: None}, result)
+
+    def test_paths_from_entities(self):
+        result = self.tk.paths_from_entities([("Shot", 1), ("Sequence", 2), ("Shot", 3)])
+        self.assertEquals({("Shot", 1): [self.shot_path],
+                           ("Sequence", 2): [self.seq_path],
+                           ("Shot", 3): []}, result)
+
 class TestVersionProperty(TankTestBase):
     """
     test api.version property
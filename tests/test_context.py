@@ -229,6 +229,20 @@ class TestFromPath(TestContext):
 
 
 
+    @patch("tank.util.login.get_current_user")
+    def test_paths(self, get_current_user):
+        """Check contexts from several paths match the contexts from each path."""
+        get_current_user.return_value = self.current_user
+        external_path = os.path.abspath(os.path.join(self.project_root, ".."))
+        paths = [self.shot_path, self.other_user_path, self.alt_1_shot_path, external_path]
+
+        result = self.tk.contexts_from_paths(paths)
+        self.assertEquals(sorted(paths), sorted(result))
+        for path in paths:
+            self.assertEquals(self.tk.context_from_path(path), result[path])
+        self.assertEquals(self.other_user["id"], result[self.other_user_path].user["id"])
+
+
 class TestFromPathWithPrevious(TestContext):
 
     def get_task_context(self):
@@ -268,6 +282,85 @@ class TestFromPathWithPrevious(TestContext):
         self.assertEquals(self.current_user["type"], result.user["type"])
 
 
+class TestFromPathCache(TestContext):
+    """
+    Tests reusing the path cache lookups of from_path for the files of a folder.
+    """
+    def setUp(self):
+        super(TestFromPathCache, self).setUp()
+        # lookups are only cached when a time to live is set
+        config_file = os.path.join(self.pipeline_configuration.get_path(), "config", "core", "pipeline_configuration.yml")
+        data = yaml.load(open(config_file))
+        data["path_cache_lookup_ttl"] = 10
+        self.create_file(config_file, yaml.dump(data))
+        self.lookups = []
+        self.get_entities_for_ancestors = tank.path_cache.PathCache.get_entities_for_ancestors
+        def get_entities_for_ancestors(path_cache, path):
+            self.lookups.append(path)
+            return self.get_entities_for_ancestors(path_cache, path)
+        tank.path_cache.PathCache.get_entities_for_ancestors = get_entities_for_ancestors
+        self.work_path = os.path.join(self.step_path, "work")
+
+    def tearDown(self):
+        tank.path_cache.PathCache.get_entities_for_ancestors = self.get_entities_for_ancestors
+        super(TestFromPathCache, self).tearDown()
+
+    def test_sibling_files(self):
+        first = self.tk.context_from_path(os.path.join(self.work_path, "scene_v001.ma"))
+        self.assertEquals(1, len(self.lookups))
+        second = self.tk.context_from_path(os.path.join(self.work_path, "scene_v002.ma"))
+        self.assertEquals(1, len(self.lookups))
+
+        self.assertEquals(self.shot["id"], second.entity["id"])
+        self.assertEquals(self.step["id"], second.step["id"])
+        self.assertEquals(first, second)
+
+    def test_folders_below(self):
+        self.tk.context_from_path(os.path.join(self.step_path, "scene_v001.ma"))
+        self.assertEquals(1, len(self.lookups))
+
+        # the user folder has entities, the work folder has none
+        result = self.tk.context_from_path(self.other_user_path)
+        self.assertEquals(self.other_user["id"], result.user["id"])
+        result = self.tk.context_from_path(self.work_path)
+        self.assertEquals(self.current_user["id"], result.user["id"])
+        self.assertEquals(1, len(self.lookups))
+
+        # the paths further down need another lookup, their folders may be new
+        result = self.tk.context_from_path(os.path.join(self.work_path, "snapshots", "scene_v001.ma"))
+        self.assertEquals(self.step["id"], result.step["id"])
+        self.assertEquals(self.current_user["id"], result.user["id"])
+        self.assertEquals(2, len(self.lookups))
+        result = self.tk.context_from_path(os.path.join(self.other_user_path, "scene_v001.ma"))
+        self.assertEquals(self.other_user["id"], result.user["id"])
+        self.assertEquals(3, len(self.lookups))
+
+    def test_write_invalidates(self):
+        file_path = os.path.join(self.work_path, "scene_v001.ma")
+        result = self.tk.context_from_path(file_path)
+        self.assertEquals(self.current_user["id"], result.user["id"])
+
+        self.add_to_path_cache(self.work_path, self.other_user)
+        result = self.tk.context_from_path(file_path)
+        self.assertEquals(self.other_user["id"], result.user["id"])
+        self.assertEquals(2, len(self.lookups))
+
+    def test_previous_context(self):
+        task = {"id": 1,
+                "type": "Task",
+                "content": "task_content",
+                "project": self.project,
+                "entity": self.shot,
+                "step": self.step}
+        self.add_to_sg_mock_db(task)
+        prev_ctx = context.from_entity(self.tk, task["type"], task["id"])
+
+        self.tk.context_from_path(os.path.join(self.work_path, "scene_v001.ma"))
+        result = self.tk.context_from_path(os.path.join(self.work_path, "scene_v002.ma"), prev_ctx)
+        self.assertEquals(task["id"], result.task["id"])
+        self.assertEquals(1, len(self.lookups))
+
+
 class TestUrl(TestContext):
 
     def setUp(self):
@@ -438,6 +531,73 @@ class TestFromEntity(TestContext):
         task = {"type": "Task", "id": 13, "name": "never_seen_me_before", "content": "no_content"}
         self.assertRaises(TankError, context.from_entity, self.tk, task["type"], task["id"])
 
+    @patch("tank.util.login.get_current_user")
+    def test_entities_from_cache(self, get_current_user):
+        """
+        Case that several entities are found in the path cache, or in shotgun
+        """
+        get_current_user.return_value = self.current_user
+        other_shot = {"type": "Shot", "id": 13, "code": "other_shot", "project": self.project}
+        self.add_to_sg_mock_db(other_shot)
+
+        result = self.tk.contexts_from_entities("Shot", [self.shot["id"], other_shot["id"]])
+        self.assertEquals(sorted([self.shot["id"], other_shot["id"]]), sorted(result))
+        self.assertEquals(context.from_entity(self.tk, "Shot", self.shot["id"]), result[self.shot["id"]])
+        self.check_entity(self.shot, result[self.shot["id"]].entity)
+        self.check_entity(self.project, result[self.shot["id"]].project)
+        self.assertEquals(other_shot["id"], result[other_shot["id"]].entity["id"])
+        self.assertIsNone(result[other_shot["id"]].step)
+
+    @patch("tank.util.login.get_current_user")
+    def test_tasks_from_sg(self, get_current_user):
+        """
+        Case that several tasks are fetched with a single shotgun query
+        """
+        get_current_user.return_value = self.current_user
+        other_task = {"id": 2,
+                      "type": "Task",
+                      "content": "other_content",
+                      "project": self.project,
+                      "entity": self.shot}
+        self.add_to_sg_mock_db(other_task)
+
+        self.sg_mock.find.reset_mock()
+        self.sg_mock.find_one.reset_mock()
+        result = self.tk.contexts_from_entities("Task", [self.task["id"], other_task["id"]])
+        self.assertEquals(1, self.sg_mock.find.call_count)
+        self.assertFalse(self.sg_mock.find_one.called)
+
+        self.assertEquals(context.from_entity(self.tk, "Task", self.task["id"]), result[self.task["id"]])
+        self.assertEquals(self.task["content"], result[self.task["id"]].task["name"])
+        self.check_entity(self.step, result[self.task["id"]].step)
+        self.assertEquals(other_task["content"], result[other_task["id"]].task["name"])
+        self.check_entity(self.shot, result[other_task["id"]].entity)
+        self.assertIsNone(result[other_task["id"]].step)
+
+    @patch("tank.util.login.get_current_user")
+    def test_published_files_same_link(self, get_current_user):
+        """
+        Case that several published files are linked with the same task
+        """
+        get_current_user.return_value = self.current_user
+        published_files = [{"type": "PublishedFile", "id": x, "code": "file_%d" % x,
+                            "project": self.project, "entity": self.shot, "task": self.task}
+                           for x in [1, 2]]
+        self.add_to_sg_mock_db(published_files)
+
+        result = self.tk.contexts_from_entities("PublishedFile", [1, 2])
+        self.assertEquals(context.from_entity(self.tk, "Task", self.task["id"]), result[1])
+        self.assertEquals(result[1], result[2])
+        self.assertFalse(result[1] is result[2])
+        result[1].entity["name"] = "modified"
+        self.assertEquals(self.shot["name"], result[2].entity["name"])
+
+    def test_tasks_missing(self):
+        """
+        Case that one of the tasks does not exist in shotgun
+        """
+        self.assertRaises(TankError, context.from_entities, self.tk, "Task", [self.task["id"], 13])
+
     def check_entity(self, first_entity, second_entity):
         "Checks two entity dictionaries have the same values for keys type, id and name."
         self.assertEquals(first_entity["type"], second_entity["type"])
@@ -532,6 +692,68 @@ class TestAsTemplateFields(TestContext):
         # Check that the shotgun method find_one was not used
         self.assertFalse(self.sg_mock.find_one.called)
 
+    def test_query_grouped(self):
+        """
+        Test that the keys of an entity are fetched with a single query.
+        """
+        self.keys["shot_extra"] = StringKey("shot_extra", shotgun_entity_type="Shot", shotgun_field_name="extra_field")
+        self.keys["shot_seq"] = StringKey("shot_seq", shotgun_entity_type="Shot", shotgun_field_name="sg_sequence")
+        template_def = "/sequence/{Sequence}/{Shot}/{Step}/work/{shot_extra}.{shot_seq}.ext"
+        template = TemplatePath(template_def, self.keys, self.project_root)
+
+        self.sg_mock.find_one.reset_mock()
+        result = self.ctx.as_template_fields(template)
+        self.assertEquals("extravalue", result["shot_extra"])
+        self.assertEquals("seq_name", result["shot_seq"])
+        self.assertEquals(1, self.sg_mock.find_one.call_count)
+
+    def test_query_shared_cache(self):
+        """
+        Test that values fetched for a context are reused by other contexts of the
+        same tk instance.
+        """
+        query_key = StringKey("shot_extra", shotgun_entity_type="Shot", shotgun_field_name="extra_field")
+        self.keys["shot_extra"] = query_key
+        template_def = "/sequence/{Sequence}/{Shot}/{Step}/work/{shot_extra}.ext"
+        template = TemplatePath(template_def, self.keys, self.project_root)
+        self.ctx.as_template_fields(template)
+
+        self.sg_mock.find_one.reset_mock()
+        ctx = context.Context(self.tk, project=self.project, entity=self.shot, step=self.step)
+        result = ctx.as_template_fields(template)
+        self.assertEquals("extravalue", result["shot_extra"])
+        self.assertFalse(self.sg_mock.find_one.called)
+
+        # other keys of the entity are fetched without the cached ones
+        self.keys["shot_seq"] = StringKey("shot_seq", shotgun_entity_type="Shot", shotgun_field_name="sg_sequence")
+        template_def = "/sequence/{Sequence}/{Shot}/{Step}/work/{shot_extra}.{shot_seq}.ext"
+        template = TemplatePath(template_def, self.keys, self.project_root)
+        result = ctx.as_template_fields(template)
+        self.assertEquals("seq_name", result["shot_seq"])
+        self.assertEquals(1, self.sg_mock.find_one.call_count)
+        self.assertEquals(["sg_sequence"], self.sg_mock.find_one.call_args[0][2])
+
+    def test_query_shared_cache_disabled(self):
+        """
+        Test that values are not shared between contexts when the cache is disabled.
+        """
+        config_file = os.path.join(self.pipeline_configuration.get_path(), "config", "core", "pipeline_configuration.yml")
+        data = yaml.load(open(config_file))
+        data["shotgun_fields_cache_ttl"] = 0
+        self.create_file(config_file, yaml.dump(data))
+        tk = tank.Tank(self.project_root)
+
+        query_key = StringKey("shot_extra", shotgun_entity_type="Shot", shotgun_field_name="extra_field")
+        self.keys["shot_extra"] = query_key
+        template_def = "/sequence/{Sequence}/{Shot}/{Step}/work/{shot_extra}.ext"
+        template = TemplatePath(template_def, self.keys, self.project_root)
+        context.Context(tk, project=self.project, entity=self.shot, step=self.step).as_template_fields(template)
+
+        self.sg_mock.find_one.reset_mock()
+        ctx = context.Context(tk, project=self.project, entity=self.shot, step=self.step)
+        self.assertEquals("extravalue", ctx.as_template_fields(template)["shot_extra"])
+        self.assertTrue(self.sg_mock.find_one.called)
+
     def test_shot_step(self):
         expected_step_name = "step_short_name"
         expected_shot_name = "shot_code"
@@ -9,12 +9,15 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import time
 import sqlite3
 
 from tank_test.tank_test_base import *
 
 from tank import path_cache
+from tank.errors import TankError
 from tank.platform import constants
+from tank_vendor import yaml
 
 class TestPathCache(TankTestBase):
     """Base class for path cache tests."""
@@ -36,6 +39,7 @@ class TestInit(TestPathCache):
             os.remove(db_path)
         self.assertFalse(os.path.exists(db_path))
         pc = path_cache.PathCache(self.pipeline_configuration)
+        pc.get_paths("Shot", 1)
         pc.close()
         self.assertTrue(os.path.exists(db_path))
 
@@ -47,11 +51,146 @@ class TestInit(TestPathCache):
         
     def test_db_columns(self):
         """Test that expected columns are created in db"""
-        expected = ["entity_type", "entity_id", "entity_name", "root", "path", "primary_entity"]
-        self.db_cursor = self.path_cache._connection.cursor()
-        ret = self.db_cursor.execute("PRAGMA table_info(path_cache)")
+        expected = ["entity_type_id", "entity_id", "entity_name", "node_id", "primary_entity"]
+        self.db_cursor = self.path_cache._get_connection().cursor()
+        ret = self.db_cursor.execute("PRAGMA table_info(path_cache_entries)")
         column_names = [x[1] for x in ret.fetchall()]
         self.assertEquals(expected, column_names)
+        ret = self.db_cursor.execute("PRAGMA user_version")
+        self.assertEquals(path_cache.SCHEMA_VERSION, ret.fetchone()[0])
+
+    def _create_legacy_db(self, with_primary_entity):
+        self.path_cache.close()
+        db_path = self.pipeline_configuration.get_path_cache_location()
+        os.remove(db_path)
+        connection = sqlite3.connect(db_path)
+        if with_primary_entity:
+            connection.execute("CREATE TABLE path_cache (entity_type text, entity_id integer, entity_name text, root text, path text, primary_entity integer)")
+            rows = [("Project", 1, "project_name", "primary", "", 1),
+                    ("Shot", 2, "shot_2", "primary", "/seq/shot_2", 1),
+                    ("Shot", 2, "shot_2", "alternate_1", "/seq/shot_2", 1),
+                    ("Sequence", 3, "seq", "primary", "/seq/shot_2", 0)]
+            connection.executemany("INSERT INTO path_cache VALUES(?, ?, ?, ?, ?, ?)", rows)
+        else:
+            connection.execute("CREATE TABLE path_cache (entity_type text, entity_id integer, entity_name text, root text, path text)")
+            rows = [("Project", 1, "project_name", "primary", ""),
+                    ("Shot", 2, "shot_2", "primary", "/seq/shot_2")]
+            connection.executemany("INSERT INTO path_cache VALUES(?, ?, ?, ?, ?)", rows)
+            rows = [x + (1,) for x in rows]
+        connection.commit()
+        connection.close()
+        return [x[:5] + (bool(x[5]),) for x in rows]
+
+    def test_upgrade(self):
+        """Test that records are moved from the previous schema"""
+        for with_primary_entity in (True, False):
+            rows = self._create_legacy_db(with_primary_entity)
+            self.path_cache = path_cache.PathCache(self.pipeline_configuration)
+            self.assertTrue(self.path_cache.upgrade_schema())
+            self.assertEquals(rows, self.path_cache._get_records())
+            shot_path = os.path.join(self.project_root, "seq", "shot_2")
+            self.assertEquals("shot_2", self.path_cache.get_entity(shot_path)["name"])
+            c = self.path_cache._get_connection().cursor()
+            res = c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'path_cache'")
+            self.assertEquals([], res.fetchall())
+            c.close()
+
+    def test_upgrade_requested(self):
+        """Test that the previous schema is only upgraded when requested"""
+        rows = self._create_legacy_db(True)
+        self.path_cache = path_cache.PathCache(self.pipeline_configuration)
+        self.assertRaises(TankError, self.path_cache.get_entity, os.path.join(self.project_root, "seq", "shot_2"))
+        # the db is left untouched for the previous core
+        connection = sqlite3.connect(self.pipeline_configuration.get_path_cache_location())
+        try:
+            self.assertEquals(len(rows), len(connection.execute("SELECT * FROM path_cache").fetchall()))
+            self.assertEquals([], connection.execute("SELECT name FROM sqlite_master WHERE name LIKE 'path_cache_%'").fetchall())
+        finally:
+            connection.close()
+        self.assertTrue(self.path_cache.upgrade_schema())
+        self.assertEquals("shot_2", self.path_cache.get_entity(os.path.join(self.project_root, "seq", "shot_2"))["name"])
+        # nothing left to upgrade
+        self.assertFalse(self.path_cache.upgrade_schema())
+
+    def _create_tree_db(self):
+        """Creates a db storing the tree without the paths of the nodes"""
+        self.path_cache.close()
+        db_path = self.pipeline_configuration.get_path_cache_location()
+        os.remove(db_path)
+        connection = sqlite3.connect(db_path)
+        connection.executescript("""
+            CREATE TABLE path_cache_entity_types (id integer primary key, name text);
+            CREATE TABLE path_cache_nodes (id integer primary key, parent_id integer, name text);
+            CREATE UNIQUE INDEX path_cache_nodes_name ON path_cache_nodes(parent_id, name);
+            CREATE TABLE path_cache_entries (entity_type_id integer, entity_id integer, entity_name text, node_id integer, primary_entity integer);
+            CREATE VIEW path_cache AS SELECT NULL AS entity_type WHERE 0;
+            INSERT INTO path_cache_entity_types VALUES(1, 'Shot');
+            INSERT INTO path_cache_nodes VALUES(1, 0, 'primary');
+            INSERT INTO path_cache_nodes VALUES(2, 1, '');
+            INSERT INTO path_cache_nodes VALUES(3, 2, 'seq');
+            INSERT INTO path_cache_nodes VALUES(4, 3, 'shot_2');
+            INSERT INTO path_cache_entries VALUES(1, 2, 'shot_2', 4, 1);
+            PRAGMA user_version = 2;
+        """)
+        connection.close()
+
+    def test_upgrade_tree(self):
+        """Test that the paths of the nodes are set on dbs storing the tree without them"""
+        self._create_tree_db()
+        self.path_cache = path_cache.PathCache(self.pipeline_configuration)
+        shot_path = os.path.join(self.project_root, "seq", "shot_2")
+        self.assertEquals("shot_2", self.path_cache.get_entity(shot_path)["name"])
+        self.assertEquals([shot_path], self.path_cache.get_paths("Shot", 2))
+        c = self.path_cache._get_connection().cursor()
+        res = c.execute("SELECT id, root, path FROM path_cache_nodes ORDER BY id")
+        self.assertEquals([(1, "primary", None), (2, "primary", ""), (3, "primary", "/seq"), (4, "primary", "/seq/shot_2")],
+                          res.fetchall())
+        c.close()
+
+    def test_node_paths_set_for_tree_cores(self):
+        """Test that the paths of nodes inserted without them are set"""
+        self.path_cache.add_mapping("Shot", 2, "shot_2", os.path.join(self.project_root, "seq", "shot_2"))
+        c = self.path_cache._get_connection().cursor()
+        node_id = self.path_cache._find_nodes(c, [("primary", "/seq")])[("primary", "/seq")]
+        # as a core storing the tree without the paths would
+        c.execute("INSERT INTO path_cache_nodes (parent_id, name) VALUES(?, ?)", (node_id, "shot_3"))
+        c.execute("INSERT INTO path_cache_nodes (parent_id, name) VALUES(?, ?)", (0, "other_root"))
+        self.assertEquals([("primary", "/seq/shot_3"), ("other_root", None)],
+                          c.execute("SELECT root, path FROM path_cache_nodes WHERE name IN ('shot_3', 'other_root') ORDER BY id").fetchall())
+        c.close()
+
+    def test_previous_core(self):
+        """Test that a core using the previous schema fails to open the db"""
+        self.path_cache.add_mapping("Shot", 2, "shot_2", os.path.join(self.project_root, "shot_2"))
+        self.path_cache.close()
+        connection = sqlite3.connect(self.pipeline_configuration.get_path_cache_location())
+        try:
+            # the statements the previous core runs when opening the db
+            self.assertRaises(sqlite3.OperationalError, connection.executescript, """
+                CREATE TABLE IF NOT EXISTS path_cache (entity_type text, entity_id integer, entity_name text, root text, path text, primary_entity integer);
+                CREATE INDEX IF NOT EXISTS path_cache_entity ON path_cache(entity_type, entity_id);
+            """)
+        finally:
+            connection.close()
+
+    def test_legacy_table_recreated(self):
+        """Test that records written to a legacy table after the upgrade are moved when requested"""
+        self.path_cache.close()
+        connection = sqlite3.connect(self.pipeline_configuration.get_path_cache_location())
+        connection.execute("DROP VIEW path_cache")
+        connection.execute("CREATE TABLE path_cache (entity_type text, entity_id integer, entity_name text, root text, path text, primary_entity integer)")
+        connection.execute("INSERT INTO path_cache VALUES('Shot', 2, 'shot_2', 'primary', '/shot_2', 1)")
+        connection.commit()
+        connection.close()
+
+        self.path_cache = path_cache.PathCache(self.pipeline_configuration)
+        self.assertRaises(TankError, self.path_cache.get_entity, os.path.join(self.project_root, "shot_2"))
+        self.path_cache.upgrade_schema()
+        self.assertEquals("shot_2", self.path_cache.get_entity(os.path.join(self.project_root, "shot_2"))["name"])
+        c = self.path_cache._get_connection().cursor()
+        res = c.execute("SELECT type FROM sqlite_master WHERE name = 'path_cache'")
+        self.assertEquals([("view",)], res.fetchall())
+        c.close()
 
 
 
@@ -64,8 +203,8 @@ class TestAddMapping(TestPathCache):
                        "id":1,
                        "name":"EntityName"}
 
-        # get db connection
-        self.db_cursor = self.path_cache._connection.cursor()
+    def _select_paths(self, entity_type, entity_id):
+        return [(x[4], x[3]) for x in self.path_cache._get_records([(entity_type, entity_id)])]
 
     def test_primary_path(self):
         """
@@ -75,8 +214,8 @@ class TestAddMapping(TestPathCache):
         full_path = os.path.join(self.project_root, relative_path)
         self.path_cache.add_mapping(self.entity["type"], self.entity["id"], self.entity["name"], full_path)
 
-        res = self.db_cursor.execute("SELECT path, root FROM path_cache WHERE entity_type = ? AND entity_id = ?", (self.entity["type"], self.entity["id"]))
-        entry = res.fetchall()[0]
+        paths = self._select_paths(self.entity["type"], self.entity["id"])
+        entry = paths[0]
         self.assertEquals("/shot", entry[0])
         self.assertEquals("primary", entry[1])
 
@@ -98,8 +237,8 @@ class TestAddMapping(TestPathCache):
         self.assertRaises(tank.TankError, self.path_cache.add_mapping, self.entity["type"], self.entity["id"]+1, "foo", full_path)         
 
         # finally, make sure that there is exactly a single record in the db representing the path
-        res = self.db_cursor.execute("SELECT path, root FROM path_cache WHERE entity_type = ? AND entity_id = ?", (self.entity["type"], self.entity["id"]))
-        self.assertEqual( len(res.fetchall()), 1)
+        paths = self._select_paths(self.entity["type"], self.entity["id"])
+        self.assertEqual( len(paths), 1)
         
 
 
@@ -144,8 +283,8 @@ class TestAddMapping(TestPathCache):
         self.assertEquals( paths[0], full_path)
 
         # finally, make sure that there no dupe records
-        res = self.db_cursor.execute("SELECT path, root FROM path_cache WHERE entity_type = ? AND entity_id = ?", (self.entity["type"], self.entity["id"]+3))
-        self.assertEqual( len(res.fetchall()), 1)
+        paths = self._select_paths(self.entity["type"], self.entity["id"]+3)
+        self.assertEqual( len(paths), 1)
 
 
 
@@ -157,8 +296,8 @@ class TestAddMapping(TestPathCache):
         full_path = os.path.join(self.alt_root_1, relative_path)
         self.path_cache.add_mapping(self.entity["type"], self.entity["id"], self.entity["name"], full_path)
 
-        res = self.db_cursor.execute("SELECT path, root FROM path_cache WHERE entity_type = ? AND entity_id = ?", (self.entity["type"], self.entity["id"]))
-        entry = res.fetchall()[0]
+        paths = self._select_paths(self.entity["type"], self.entity["id"])
+        entry = paths[0]
         self.assertEquals("/shot", entry[0])
         self.assertEquals("alternate_1", entry[1])
 
@@ -173,9 +312,87 @@ class TestAddMapping(TestPathCache):
         entity_name = "someunicode\xe8"
         self.path_cache.add_mapping(entity_type, entity_id, entity_name, full_path)
 
-        res = self.db_cursor.execute("SELECT entity_name FROM path_cache WHERE entity_type = ? AND entity_id = ?", (entity_type, entity_id))
-        entry = res.fetchall()[0]
-        self.assertEquals(entity_name, entry[0])
+        entry = self.path_cache._get_records([(entity_type, entity_id)])[0]
+        self.assertEquals(entity_name, entry[2])
+
+
+class TestAddMappings(TestPathCache):
+    def setUp(self):
+        super(TestAddMappings, self).setUp()
+        self.shot = {"type": "Shot", "id": 1, "name": "shot_1"}
+        self.other_shot = {"type": "Shot", "id": 2, "name": "shot_2"}
+        self.task = {"type": "Task", "id": 3, "name": "comp"}
+        self.shot_path = os.path.join(self.project_root, "shot_1")
+        self.step_path = os.path.join(self.project_root, "shot_1", "comp")
+        # the fixtures already register the project
+        self.initial_rows = self._count_rows()
+
+    def _count_rows(self):
+        return len(self.path_cache._get_records()) - getattr(self, "initial_rows", 0)
+
+    def test_primary_and_secondary(self):
+        records = [{"entity": self.shot, "path": self.shot_path},
+                   {"entity": self.task, "path": self.step_path},
+                   {"entity": self.shot, "path": self.step_path, "primary": False}]
+        self.path_cache.add_mappings(records)
+
+        self.assertEquals(self.shot, self.path_cache.get_entity(self.shot_path))
+        self.assertEquals(self.task, self.path_cache.get_entity(self.step_path))
+        self.assertEquals([self.shot], self.path_cache.get_secondary_entities(self.step_path))
+        self.assertEquals(3, self._count_rows())
+
+        # adding the same records again does nothing
+        self.path_cache.add_mappings(records)
+        self.assertEquals(3, self._count_rows())
+
+    def test_duplicates_in_batch(self):
+        records = [{"entity": self.shot, "path": self.shot_path},
+                   {"entity": dict(self.shot, name="renamed"), "path": self.shot_path},
+                   {"entity": self.shot, "path": self.step_path, "primary": False},
+                   {"entity": self.shot, "path": self.step_path, "primary": False},
+                   # already there as the primary path of the shot
+                   {"entity": self.shot, "path": self.shot_path, "primary": False}]
+        self.path_cache.add_mappings(records)
+        self.assertEquals(2, self._count_rows())
+
+    def test_conflict_with_db(self):
+        self.path_cache.add_mapping("Shot", 2, "shot_2", self.shot_path)
+        records = [{"entity": self.task, "path": self.step_path},
+                   {"entity": self.shot, "path": self.shot_path}]
+        try:
+            self.path_cache.add_mappings(records)
+        except tank.TankError, batch_error:
+            pass
+        else:
+            self.fail("No error raised for a conflicting path")
+
+        # the records before the conflict are added, as with add_mapping
+        self.assertEquals(self.task, self.path_cache.get_entity(self.step_path))
+        self.assertEquals(self.other_shot, self.path_cache.get_entity(self.shot_path))
+
+        # and the error is the one add_mapping raises
+        try:
+            self.path_cache.add_mapping("Shot", 1, "shot_1", self.shot_path)
+        except tank.TankError, error:
+            self.assertEquals(str(error), str(batch_error))
+            self.assertTrue("is already associated with Shotgun Shot shot_2 (id 2)" in str(error))
+        else:
+            self.fail("No error raised for a conflicting path")
+
+    def test_conflict_in_batch(self):
+        records = [{"entity": self.other_shot, "path": self.shot_path},
+                   {"entity": self.task, "path": self.step_path},
+                   {"entity": self.shot, "path": self.shot_path},
+                   {"entity": self.shot, "path": os.path.join(self.project_root, "shot_3")}]
+        self.assertRaises(tank.TankError, self.path_cache.add_mappings, records)
+        self.assertEquals(self.other_shot, self.path_cache.get_entity(self.shot_path))
+        self.assertEquals(2, self._count_rows())
+
+    def test_path_outside_project(self):
+        records = [{"entity": self.shot, "path": self.shot_path},
+                   {"entity": self.task, "path": os.path.join(self.tank_temp, "outside", "comp")}]
+        self.assertRaises(tank.TankError, self.path_cache.add_mappings, records)
+        self.assertEquals(1, self._count_rows())
 
 
 class TestGetEntity(TestPathCache):
@@ -272,3 +489,370 @@ class Test_SeperateRoots(TestPathCache):
         # returns relative path starting with seperator
         self.assertEquals(os.sep + relative_path, relative_result)
 
+
+class TestLookupCache(TestPathCache):
+    def setUp(self):
+        super(TestLookupCache, self).setUp()
+        # lookups are only cached when a time to live is set
+        self._set_lookup_ttl(10)
+        self.shot = {"type": "Shot", "id": 1, "name": "shot_1"}
+        self.shot_path = os.path.join(self.project_root, "shot_1")
+        self.path_cache.add_mapping("Shot", 1, "shot_1", self.shot_path)
+
+    def _set_lookup_ttl(self, ttl):
+        config_file = os.path.join(self.pipeline_configuration.get_path(), "config", "core", "pipeline_configuration.yml")
+        data = yaml.load(open(config_file))
+        data["path_cache_lookup_ttl"] = ttl
+        self.create_file(config_file, yaml.dump(data))
+        path_cache.clear_lookup_caches()
+        self.path_cache.close()
+        self.path_cache = path_cache.PathCache(self.pipeline_configuration)
+
+    def _rename_shot(self, name):
+        # modifies the db like another process would
+        connection = sqlite3.connect(self.pipeline_configuration.get_path_cache_location())
+        connection.execute("UPDATE path_cache_entries SET entity_name = ? WHERE entity_id = 1", (name,))
+        connection.commit()
+        connection.close()
+
+    def test_cached(self):
+        self.assertEquals(self.shot, self.path_cache.get_entity(self.shot_path))
+        self._rename_shot("renamed")
+        self.assertEquals(self.shot, self.path_cache.get_entity(self.shot_path))
+
+        # lookups are shared with other PathCache objects, which don't open the db
+        other = path_cache.PathCache(self.pipeline_configuration)
+        try:
+            self.assertEquals(self.shot, other.get_entity(self.shot_path))
+            self.assertEquals(None, other._connection)
+        finally:
+            other.close()
+
+        path_cache.clear_lookup_caches()
+        self.assertEquals("renamed", self.path_cache.get_entity(self.shot_path)["name"])
+
+    def test_expired(self):
+        self.path_cache._lookup_cache.ttl = 0.01
+        self.assertEquals([self.shot_path], self.path_cache.get_paths("Shot", 1))
+        self._rename_shot("renamed")
+        time.sleep(0.02)
+        self.assertEquals("renamed", self.path_cache.get_entity(self.shot_path)["name"])
+
+    def test_invalidated_by_write(self):
+        other_path = os.path.join(self.project_root, "shot_2")
+        self.assertEquals(None, self.path_cache.get_entity(other_path))
+        self.assertEquals([], self.path_cache.get_secondary_entities(self.shot_path))
+
+        other = path_cache.PathCache(self.pipeline_configuration)
+        try:
+            other.add_mapping("Shot", 2, "shot_2", other_path)
+            other.add_mapping("Shot", 2, "shot_2", self.shot_path, primary=False)
+        finally:
+            other.close()
+        self.assertEquals("shot_2", self.path_cache.get_entity(other_path)["name"])
+        self.assertEquals(1, len(self.path_cache.get_secondary_entities(self.shot_path)))
+
+        self.path_cache.delete_path_tree(other_path)
+        self.assertEquals(None, self.path_cache.get_entity(other_path))
+
+    def test_misses_not_cached(self):
+        other_path = os.path.join(self.project_root, "shot_2")
+        self.assertEquals(None, self.path_cache.get_entity(other_path))
+        self.assertEquals([], self.path_cache.get_paths("Shot", 2))
+        self.assertEquals({other_path: None}, self.path_cache.get_entities([other_path]))
+        ancestors = self.path_cache.get_entities_for_ancestors(other_path)
+        self.assertEquals(None, ancestors[0][1])
+        self.assertEquals(0, len(self.path_cache._lookup_cache.results))
+
+        self.path_cache.get_entity(self.shot_path)
+        self.assertEquals(1, len(self.path_cache._lookup_cache.results))
+
+    def test_result_copied(self):
+        self.path_cache.get_entity(self.shot_path)["name"] = "modified"
+        self.assertEquals(self.shot, self.path_cache.get_entity(self.shot_path))
+
+    def test_disabled(self):
+        self._set_lookup_ttl(0)
+        self.assertEquals(None, self.path_cache._lookup_cache)
+        self.assertEquals(self.shot, self.path_cache.get_entity(self.shot_path))
+        self._rename_shot("renamed")
+        self.assertEquals("renamed", self.path_cache.get_entity(self.shot_path)["name"])
+
+    def test_disabled_by_default(self):
+        config_file = os.path.join(self.pipeline_configuration.get_path(), "config", "core", "pipeline_configuration.yml")
+        data = yaml.load(open(config_file))
+        del data["path_cache_lookup_ttl"]
+        self.create_file(config_file, yaml.dump(data))
+        self.assertEquals(0, self.pipeline_configuration.get_path_cache_lookup_ttl())
+
+
+class TestReplica(TestPathCache):
+    def setUp(self):
+        super(TestReplica, self).setUp()
+        self.replica_folder = os.path.join(self.tank_temp, "path_cache_replica")
+        os.environ[constants.PATH_CACHE_REPLICA_ENV_VAR] = self.replica_folder
+        self.shot = {"type": "Shot", "id": 1, "name": "shot_1"}
+        self.shot_path = os.path.join(self.project_root, "shot_1")
+        self.path_cache.add_mapping("Shot", 1, "shot_1", self.shot_path)
+
+    def tearDown(self):
+        del os.environ[constants.PATH_CACHE_REPLICA_ENV_VAR]
+        super(TestReplica, self).tearDown()
+
+    def test_replica_location(self):
+        replica_path = self.pipeline_configuration.get_path_cache_replica_location()
+        self.assertEquals(self.replica_folder, os.path.dirname(replica_path))
+        os.environ[constants.PATH_CACHE_REPLICA_ENV_VAR] = "0"
+        self.assertEquals(None, self.pipeline_configuration.get_path_cache_replica_location())
+
+    def test_read_from_replica(self):
+        replica = path_cache.PathCache(self.pipeline_configuration)
+        try:
+            self.assertEquals(self.shot, replica.get_entity(self.shot_path))
+            self.assertEquals([self.shot_path], replica.get_paths("Shot", 1))
+            # the path cache itself is not opened for reads
+            self.assertEquals(None, replica._connection)
+        finally:
+            replica.close()
+        self.assertTrue(os.path.exists(self.pipeline_configuration.get_path_cache_replica_location()))
+
+    def test_refresh(self):
+        replica = path_cache.PathCache(self.pipeline_configuration)
+        replica.close()
+
+        other_path = os.path.join(self.project_root, "shot_2")
+        self.path_cache.add_mapping("Shot", 2, "shot_2", other_path)
+        replica = path_cache.PathCache(self.pipeline_configuration)
+        try:
+            self.assertEquals("shot_2", replica.get_entity(other_path)["name"])
+        finally:
+            replica.close()
+
+    def test_write_to_master(self):
+        replica = path_cache.PathCache(self.pipeline_configuration)
+        other_path = os.path.join(self.project_root, "shot_2")
+        try:
+            replica.add_mapping("Shot", 2, "shot_2", other_path)
+            # reads now see the write
+            self.assertEquals("shot_2", replica.get_entity(other_path)["name"])
+        finally:
+            replica.close()
+        self.assertEquals("shot_2", self.path_cache.get_entity(other_path)["name"])
+
+    def test_broken_replica_location(self):
+        # a file where the replica folder should be
+        self.create_file(self.replica_folder)
+        replica = path_cache.PathCache(self.pipeline_configuration)
+        try:
+            self.assertEquals(self.shot, replica.get_entity(self.shot_path))
+            self.assertNotEquals(None, replica._connection)
+        finally:
+            replica.close()
+            os.remove(self.replica_folder)
+
+    def test_no_replica_during_write(self):
+        journal_path = self.pipeline_configuration.get_path_cache_location() + "-journal"
+        self.create_file(journal_path)
+        try:
+            replica = path_cache.PathCache(self.pipeline_configuration)
+            try:
+                replica.get_paths("Shot", 1)
+                self.assertNotEquals(None, replica._connection)
+            finally:
+                replica.close()
+        finally:
+            os.remove(journal_path)
+
+class TestGetEntitiesForAncestors(TestPathCache):
+    def setUp(self):
+        super(TestGetEntitiesForAncestors, self).setUp()
+        self.seq = {"type": "Sequence", "id": 1, "name": "seq_1"}
+        self.shot = {"type": "Shot", "id": 2, "name": "shot_1"}
+        self.step = {"type": "Step", "id": 3, "name": "comp"}
+        self.seq_path = os.path.join(self.project_root, "seq_1")
+        self.shot_path = os.path.join(self.seq_path, "shot_1")
+        self.step_path = os.path.join(self.shot_path, "comp")
+        self.path_cache.add_mappings([{"entity": self.seq, "path": self.seq_path},
+                                      {"entity": self.shot, "path": self.shot_path},
+                                      {"entity": self.step, "path": self.step_path},
+                                      {"entity": self.seq, "path": self.shot_path, "primary": False}])
+
+    def test_ancestors(self):
+        path = os.path.join(self.step_path, "work", "scene.ma")
+        result = self.path_cache.get_entities_for_ancestors(path)
+        expected = [(path, None, []),
+                    (os.path.dirname(path), None, []),
+                    (self.step_path, self.step, []),
+                    (self.shot_path, self.shot, [self.seq]),
+                    (self.seq_path, self.seq, []),
+                    (self.project_root, self.path_cache.get_entity(self.project_root), [])]
+        self.assertEquals(expected, result)
+        self.assertEquals("Project", result[-1][1]["type"])
+
+    def test_same_as_single_lookups(self):
+        result = self.path_cache.get_entities_for_ancestors(os.path.join(self.alt_root_1, "seq_1"))
+        for curr_path, entity, secondary_entities in result:
+            self.assertEquals(self.path_cache.get_entity(curr_path), entity)
+            self.assertEquals(self.path_cache.get_secondary_entities(curr_path), secondary_entities)
+        self.assertEquals(self.alt_root_1, result[-1][0])
+
+    def test_path_outside_project(self):
+        path = os.path.join(self.tank_temp, "outside", "file.ma")
+        result = self.path_cache.get_entities_for_ancestors(path)
+        self.assertEquals(path, result[0][0])
+        self.assertEquals(os.path.abspath(os.sep), result[-1][0])
+        self.assertEquals([], [x for x in result if x[1] or x[2]])
+
+class TestBulkLookups(TestPathCache):
+    def setUp(self):
+        super(TestBulkLookups, self).setUp()
+        # more records than fit in a single query
+        self.paths = {}
+        records = []
+        for shot_id in range(1, 1201):
+            entity = {"type": "Shot", "id": shot_id, "name": "shot_%d" % shot_id}
+            path = os.path.join(self.project_root, "shot_%d" % shot_id)
+            self.paths[shot_id] = path
+            records.append({"entity": entity, "path": path})
+        records.append({"entity": {"type": "Shot", "id": 1, "name": "shot_1"},
+                        "path": os.path.join(self.alt_root_1, "shot_1")})
+        records.append({"entity": {"type": "Shot", "id": 1, "name": "shot_1"},
+                        "path": os.path.join(self.project_root, "shot_2"),
+                        "primary": False})
+        self.path_cache.add_mappings(records)
+
+    def test_get_entities(self):
+        unknown_path = os.path.join(self.project_root, "unknown")
+        outside_path = os.path.join(self.tank_temp, "outside")
+        paths = self.paths.values() + [unknown_path, outside_path]
+        result = self.path_cache.get_entities(paths)
+        self.assertEquals(len(paths), len(result))
+        for path in paths:
+            self.assertEquals(self.path_cache.get_entity(path), result[path])
+        self.assertEquals(None, result[unknown_path])
+        self.assertEquals(None, result[outside_path])
+        self.assertEquals({"type": "Shot", "id": 12, "name": "shot_12"}, result[self.paths[12]])
+
+    def test_get_paths_bulk(self):
+        entities = [("Shot", x) for x in self.paths] + [("Shot", 5000), ("Asset", 1)]
+        result = self.path_cache.get_paths_bulk(entities)
+        self.assertEquals(len(entities), len(result))
+        for entity in entities:
+            self.assertEquals(self.path_cache.get_paths(*entity), result[entity])
+        self.assertEquals([self.paths[1], os.path.join(self.alt_root_1, "shot_1")], result[("Shot", 1)])
+        self.assertEquals([], result[("Shot", 5000)])
+
+        result = self.path_cache.get_paths_bulk([("Shot", 1)], primary_only=False)
+        self.assertEquals(3, len(result[("Shot", 1)]))
+
+    def test_get_entities_for_ancestors_bulk(self):
+        outside_path = os.path.join(self.tank_temp, "outside", "file.ma")
+        paths = [os.path.join(self.paths[x], "work") for x in sorted(self.paths)] + [outside_path]
+        result = self.path_cache.get_entities_for_ancestors_bulk(paths)
+        self.assertEquals(len(paths), len(result))
+        for path in paths[:3] + paths[-3:]:
+            self.assertEquals(self.path_cache.get_entities_for_ancestors(path), result[path])
+        self.assertEquals({"type": "Shot", "id": 7, "name": "shot_7"}, result[paths[6]][1][1])
+
+    def test_cached(self):
+        result = self.path_cache.get_entities([self.paths[1]])
+        result[self.paths[1]]["name"] = "modified"
+        self.assertEquals("shot_1", self.path_cache.get_entities([self.paths[1], self.paths[2]])[self.paths[1]]["name"])
+        self.assertEquals("shot_1", self.path_cache.get_entity(self.paths[1])["name"])
+
+class TestSubtree(TestPathCache):
+    def setUp(self):
+        super(TestSubtree, self).setUp()
+        self.shot_path = os.path.join(self.project_root, "seq", "shot_1")
+        self.step_path = os.path.join(self.shot_path, "comp")
+        self.sibling_path = os.path.join(self.project_root, "seq", "shot_10")
+        self.alt_path = os.path.join(self.alt_root_1, "seq", "shot_1")
+        self.path_cache.add_mappings([
+            {"entity": {"type": "Shot", "id": 1, "name": "shot_1"}, "path": self.shot_path},
+            {"entity": {"type": "Step", "id": 2, "name": "comp"}, "path": self.step_path},
+            {"entity": {"type": "Shot", "id": 1, "name": "shot_1"}, "path": self.step_path, "primary": False},
+            {"entity": {"type": "Shot", "id": 10, "name": "shot_10"}, "path": self.sibling_path},
+            {"entity": {"type": "Shot", "id": 1, "name": "shot_1"}, "path": self.alt_path}])
+
+    def test_get_entities_under(self):
+        result = self.path_cache.get_entities_under(self.shot_path)
+        expected = [{"entity": {"type": "Shot", "id": 1, "name": "shot_1"}, "path": self.shot_path, "primary": True},
+                    {"entity": {"type": "Step", "id": 2, "name": "comp"}, "path": self.step_path, "primary": True},
+                    {"entity": {"type": "Shot", "id": 1, "name": "shot_1"}, "path": self.step_path, "primary": False}]
+        self.assertEquals(expected, result)
+        # a trailing separator makes no difference
+        self.assertEquals(expected, self.path_cache.get_entities_under(self.shot_path + os.sep))
+        self.assertEquals([], self.path_cache.get_entities_under(os.path.join(self.shot_path, "unknown")))
+
+    def test_delete_path_tree(self):
+        self.path_cache.delete_path_tree(self.shot_path)
+        self.assertEquals(None, self.path_cache.get_entity(self.shot_path))
+        self.assertEquals(None, self.path_cache.get_entity(self.step_path))
+        self.assertEquals([], self.path_cache.get_secondary_entities(self.step_path))
+        # paths which only start with the same name are not part of the tree
+        self.assertEquals("shot_10", self.path_cache.get_entity(self.sibling_path)["name"])
+        # neither are the paths of other roots
+        self.assertEquals([self.alt_path], self.path_cache.get_paths("Shot", 1))
+
+    def test_uses_index(self):
+        c = self.path_cache._get_connection().cursor()
+        query = "EXPLAIN QUERY PLAN SELECT id FROM path_cache_nodes WHERE (path = ? OR (path > ? AND path < ?)) AND root = ?"
+        plan = " ".join(str(x[-1]) for x in c.execute(query, ("/seq", "/seq/", "/seq0", "primary")))
+        c.close()
+        self.assertTrue("path_cache_nodes_path" in plan, plan)
+
+class TestMaintenance(TestPathCache):
+    def setUp(self):
+        super(TestMaintenance, self).setUp()
+        # the fixtures register the project in each root
+        self.initial_stats = self.path_cache.get_statistics()
+        self.shot_path = os.path.join(self.project_root, "seq", "shot_1")
+        self.other_path = os.path.join(self.project_root, "seq", "shot_2", "comp")
+        self.path_cache.add_mappings([
+            {"entity": {"type": "Shot", "id": 1, "name": "shot_1"}, "path": self.shot_path},
+            {"entity": {"type": "Shot", "id": 2, "name": "shot_2"}, "path": self.other_path},
+            {"entity": {"type": "Shot", "id": 1, "name": "shot_1"}, "path": os.path.join(self.alt_root_1, "shot_1")}])
+
+    def test_statistics(self):
+        self.path_cache.delete_path_tree(os.path.dirname(self.other_path))
+        stats = self.path_cache.get_statistics()
+        initial_stats = self.initial_stats
+        # a shot in the primary root and one in the alternate root
+        self.assertEquals(initial_stats["records"] + 2, stats["records"])
+        self.assertEquals(initial_stats["records_per_root"]["primary"] + 1, stats["records_per_root"]["primary"])
+        self.assertEquals(initial_stats["records_per_root"]["alternate_1"] + 1, stats["records_per_root"]["alternate_1"])
+        self.assertEquals(initial_stats["records_per_entity_type"], {"Project": stats["records_per_entity_type"]["Project"]})
+        self.assertEquals(2, stats["records_per_entity_type"]["Shot"])
+        # shot_2 and comp are no longer used
+        self.assertEquals(2, stats["unused_nodes"])
+        self.assertTrue(stats["file_size"] > 0)
+        self.assertEquals(None, stats["indexes"]["path_cache_nodes_name"])
+        self.assertTrue("path_cache_nodes_path" in stats["query_plans"]["path"])
+
+    def test_optimize(self):
+        self.path_cache.delete_path_tree(os.path.dirname(self.other_path))
+        self.assertEquals(2, self.path_cache.optimize())
+        stats = self.path_cache.get_statistics()
+        self.assertEquals(0, stats["unused_nodes"])
+        self.assertEquals(0, stats["free_size"])
+        self.assertNotEquals(None, stats["indexes"]["path_cache_nodes_name"])
+        self.assertEquals("shot_1", self.path_cache.get_entity(self.shot_path)["name"])
+
+    def test_replace_scanned_paths(self):
+        new_path = os.path.join(self.project_root, "seq", "shot_3")
+        records = [{"entity": {"type": "Shot", "id": 3, "name": "shot_3"}, "path": new_path}]
+        (added, removed) = self.path_cache.replace_mappings(records, scanned_paths=[self.project_root])
+        self.assertEquals([new_path], [x["path"] for x in added])
+        # the project folders of the other roots were not scanned
+        self.assertEquals(set([self.shot_path, self.other_path, self.project_root]),
+                          set(x["path"] for x in removed))
+        self.assertEquals([os.path.join(self.alt_root_1, "shot_1")], self.path_cache.get_paths("Shot", 1))
+        self.assertEquals([], self.path_cache.get_paths("Shot", 2))
+
+    def test_purge_missing_roots(self):
+        self.assertEquals({}, self.path_cache.purge_missing_roots())
+        del self.path_cache._roots["alternate_1"]
+        count = self.path_cache.get_statistics()["records_per_root"]["alternate_1"]
+        self.assertEquals({"alternate_1": count}, self.path_cache.purge_missing_roots())
+        self.assertEquals([self.shot_path], self.path_cache.get_paths("Shot", 1))
+        self.assertFalse("alternate_1" in self.path_cache.get_statistics()["records_per_root"])
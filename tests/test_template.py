@@ -10,13 +10,16 @@
 
 import sys
 import os
+import cPickle as pickle
 
 import tank
 from tank import TankError
 from tank_test.tank_test_base import *
 from tank.template import Template, TemplatePath, TemplateString
 from tank.template import make_template_paths, make_template_strings, read_templates
-from tank.templatekey import (TemplateKey, StringKey, IntegerKey, SequenceKey)
+from tank.template import LazyTemplates, get_materialized_count
+from tank.templatekey import (TemplateKey, StringKey, IntegerKey, SequenceKey, intern_key)
+from tank.util import memory
 
 class TestTemplate(TankTestBase):
     """Base class for tests of Template.
@@ -266,6 +269,137 @@ class TestReadTemplates(TankTestBase):
             self.assertIn(key_name, houdini_asset_publish.keys)
 
 
+class TestLazyTemplates(TankTestBase):
+    def setUp(self):
+        super(TestLazyTemplates, self).setUp()
+        self.keys = {"Shot": StringKey("Shot"), "name": StringKey("name")}
+        self.roots = {"primary": self.project_root}
+        self.paths_data = {"shot_work": "shots/{Shot}/work/{name}.ma",
+                           "shot_area": {"definition": "shots/{Shot}"}}
+        self.strings_data = {"shot_name": {"definition": "{Shot}_{name}",
+                                           "validate_with": "shot_area"}}
+        self.templates = LazyTemplates(self.keys, self.paths_data, self.strings_data, self.roots)
+
+    def test_names_without_creating(self):
+        self.assertEquals(["shot_area", "shot_name", "shot_work"], sorted(self.templates))
+        self.assertEquals(3, len(self.templates))
+        self.assertTrue("shot_work" in self.templates)
+        self.assertEquals("shots/{Shot}/work/{name}.ma", self.templates.get_definition("shot_work"))
+        self.assertEquals(0, self.templates.materialized_count)
+
+    def test_created_once(self):
+        count = get_materialized_count()
+        template = self.templates["shot_work"]
+        self.assertIsInstance(template, TemplatePath)
+        self.assertEquals("shot_work", template.name)
+        self.assertTrue(template is self.templates["shot_work"])
+        self.assertEquals(1, self.templates.materialized_count)
+        self.assertEquals(count + 1, get_materialized_count())
+
+    def test_validate_with(self):
+        template = self.templates["shot_name"]
+        self.assertIsInstance(template, TemplateString)
+        self.assertTrue(template.validate_with is self.templates["shot_area"])
+        self.assertEquals(2, self.templates.materialized_count)
+
+    def test_items(self):
+        items = dict(self.templates.items())
+        self.assertEquals(3, self.templates.materialized_count)
+        self.assertEquals(sorted(self.templates), sorted(items))
+        self.assertEquals(None, self.templates.get("missing"))
+
+    def test_set_and_delete(self):
+        template = TemplatePath("other/{name}", self.keys, self.project_root)
+        self.templates["shot_work"] = template
+        self.templates["other"] = template
+        self.assertTrue(self.templates["shot_work"] is template)
+        self.assertEquals(4, len(self.templates))
+        del self.templates["shot_area"]
+        self.assertEquals(["other", "shot_name", "shot_work"], sorted(self.templates))
+        self.assertEquals(0, self.templates.materialized_count)
+
+    def test_version(self):
+        self.assertEquals(0, self.templates.version)
+        self.templates["other"] = TemplatePath("other/{name}", self.keys, self.project_root)
+        self.assertEquals(1, self.templates.version)
+        del self.templates["shot_area"]
+        self.assertEquals(2, self.templates.version)
+        self.templates["shot_work"]
+        self.assertEquals(2, self.templates.version)
+
+    def test_copy(self):
+        template = self.templates["shot_area"]
+        templates = self.templates.copy()
+        self.assertEquals(sorted(self.templates), sorted(templates))
+        self.assertTrue(templates["shot_area"] is template)
+        self.assertEquals(0, templates.materialized_count)
+        del templates["shot_work"]
+        self.assertTrue("shot_work" in self.templates)
+        self.assertEquals(0, self.templates.version)
+
+    def test_definition_segments(self):
+        segments = self.templates.get_definition_segments("shot_work")
+        self.assertEquals(self.templates["shot_work"]._get_segments()[0][-2:], segments[0][-2:])
+        self.assertEquals(None, self.templates.get_definition_segments("shot_name"))
+        self.assertEquals(1, self.templates.materialized_count)
+
+    def test_fields_cache_size(self):
+        template = self.templates["shot_area"]
+        self.assertEquals(None, template.get_fields_cache_stats())
+        self.templates.set_fields_cache_size(10)
+        template.get_fields(os.path.join(self.project_root, "shots", "s1"))
+        self.templates["shot_work"].validate(os.path.join(self.project_root, "shots", "s1"))
+        self.assertEquals({"hits": 0, "misses": 2, "size": 2}, self.templates.get_fields_cache_stats())
+        self.templates.clear_fields_caches()
+        self.assertEquals(0, self.templates.get_fields_cache_stats()["size"])
+
+    def test_footprint(self):
+        footprint = self.templates.get_footprint()
+        self.assertEquals(2, footprint["keys"])
+        self.assertEquals(3, footprint["templates"])
+        self.assertEquals(0, footprint["created_templates"])
+        self.assertEquals(memory.get_object_size({}), footprint["templates_bytes"])
+        self.templates["shot_work"]
+        footprint = self.templates.get_footprint()
+        self.assertEquals(1, footprint["created_templates"])
+        self.assertTrue(footprint["templates_bytes"] > memory.get_object_size({}))
+
+    def test_pickle_template(self):
+        template = self.templates["shot_name"]
+        self.assertFalse(hasattr(template, "__dict__"))
+        for protocol in [0, pickle.HIGHEST_PROTOCOL]:
+            result = pickle.loads(pickle.dumps(template, protocol))
+            self.assertEquals(template.definition, result.definition)
+            self.assertEquals({"Shot": "s1", "name": "main"}, result.get_fields("s1_main"))
+
+    def test_keys_shared_when_unpickled(self):
+        templates = pickle.loads(pickle.dumps(self.templates, pickle.HIGHEST_PROTOCOL))
+        other_templates = pickle.loads(pickle.dumps(self.templates, pickle.HIGHEST_PROTOCOL))
+        key = templates["shot_work"].keys["Shot"]
+        self.assertTrue(key is other_templates["shot_name"].keys["Shot"])
+        self.assertTrue(key is intern_key(self.keys["Shot"]))
+
+    def test_errors_on_creation(self):
+        self.strings_data["bad_string"] = {"definition": "{Shot}", "validate_with": "missing"}
+        self.assertRaises(TankError, LazyTemplates,
+                          self.keys, self.paths_data, self.strings_data, self.roots)
+        self.paths_data["bad_path"] = "no_slash"
+        self.assertRaises(TankError, LazyTemplates, self.keys, self.paths_data, {}, self.roots)
+
+    def test_definition_errors_on_creation(self):
+        self.paths_data["bad_path"] = "shots/{undefined}"
+        self.assertRaises(TankError, LazyTemplates, self.keys, self.paths_data, {}, self.roots)
+        self.paths_data["bad_path"] = "shots/[name]"
+        self.assertRaises(TankError, LazyTemplates, self.keys, self.paths_data, {}, self.roots)
+        del self.paths_data["bad_path"]
+        self.strings_data["bad_string"] = "{Shot}]"
+        self.assertRaises(TankError, LazyTemplates,
+                          self.keys, self.paths_data, self.strings_data, self.roots)
+        # nothing is created to check the definitions
+        templates = LazyTemplates(self.keys, self.paths_data, {}, self.roots)
+        self.assertEquals(0, templates.materialized_count)
+
+
 class TestMakeTemplatePaths(TankTestBase):
     def setUp(self):
         super(TestMakeTemplatePaths, self).setUp()
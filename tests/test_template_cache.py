@@ -0,0 +1,100 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+
+from tank import template_cache
+from tank.template import read_templates
+from tank_test.tank_test_base import *
+
+
+class TestTemplateCache(TankTestBase):
+    def setUp(self):
+        super(TestTemplateCache, self).setUp()
+        self.setup_fixtures()
+        self.cache_path = self.pipeline_configuration.get_templates_cache_location()
+        self.cache_key = sorted(self.pipeline_configuration.get_data_roots().items())
+        self.templates_file = os.path.join(self.project_config, "core", "templates.yml")
+
+    def write_templates(self, data):
+        fh = open(self.templates_file, "w")
+        try:
+            fh.write(data)
+        finally:
+            fh.close()
+
+    def test_written_on_read(self):
+        self.assertFalse(os.path.exists(self.cache_path))
+        templates = read_templates(self.pipeline_configuration)
+        self.assertTrue(os.path.exists(self.cache_path))
+
+        cached_data = template_cache.load(self.cache_path, self.cache_key)
+        self.assertEquals(self.pipeline_configuration.get_templates_config(), cached_data)
+        self.assertEquals(sorted(templates), sorted(cached_data["paths"].keys() + cached_data["strings"].keys()))
+
+    def test_permissions(self):
+        old_umask = os.umask(022)
+        try:
+            read_templates(self.pipeline_configuration)
+        finally:
+            os.umask(old_umask)
+        self.assertEquals(0644, os.stat(self.cache_path).st_mode & 0777)
+
+    def test_cached_templates_work(self):
+        templates = read_templates(self.pipeline_configuration)
+        cached_templates = read_templates(self.pipeline_configuration)
+        fields = {"Sequence": "seq_1", "Shot": "shot_1", "Step": "Anm", "name": "main", "version": 3}
+        path = templates["maya_shot_work"].apply_fields(fields)
+        self.assertEquals(path, cached_templates["maya_shot_work"].apply_fields(fields))
+        self.assertEquals(fields, cached_templates["maya_shot_work"].get_fields(path))
+
+    def test_key_mismatch(self):
+        read_templates(self.pipeline_configuration)
+        self.assertEquals(None, template_cache.load(self.cache_path, [("primary", "/other/root")]))
+
+    def test_include_changed(self):
+        include_file = os.path.join(self.project_config, "core", "included.yml")
+        self.create_file(include_file, "paths:\n    included_path: 'included/{name}.ma'\n")
+        self.write_templates("keys:\n    name:\n        type: str\ninclude: ./included.yml\n")
+
+        templates = read_templates(self.pipeline_configuration)
+        self.assertEquals(["included_path"], templates.keys())
+
+        self.create_file(include_file, "paths:\n    other_path: 'other/{name}.ma'\n")
+        self.assertEquals(None, template_cache.load(self.cache_path, self.cache_key))
+        templates = read_templates(self.pipeline_configuration)
+        self.assertEquals(["other_path"], templates.keys())
+
+    def test_templates_file_changed(self):
+        self.write_templates("keys:\n    name:\n        type: str\npaths:\n    first: 'first/{name}.ma'\n")
+        self.assertEquals(["first"], read_templates(self.pipeline_configuration).keys())
+        # same size and same second, so only the contents differ
+        self.write_templates("keys:\n    name:\n        type: str\npaths:\n    other: 'other/{name}.ma'\n")
+        self.assertEquals(["other"], read_templates(self.pipeline_configuration).keys())
+
+    def test_corrupt_cache(self):
+        read_templates(self.pipeline_configuration)
+        fh = open(self.cache_path, "r+b")
+        try:
+            fh.seek(-10, os.SEEK_END)
+            fh.write("corruption")
+        finally:
+            fh.close()
+        self.assertEquals(None, template_cache.load(self.cache_path, self.cache_key))
+        # and the cache is rebuilt
+        read_templates(self.pipeline_configuration)
+        self.assertEquals(self.pipeline_configuration.get_templates_config(),
+                          template_cache.load(self.cache_path, self.cache_key))
+
+    def test_no_cache_folder(self):
+        cache_path = os.path.join(self.tank_temp, "missing", "templates.cache")
+        template_cache.save(cache_path, self.cache_key, [self.templates_file], {})
+        self.assertFalse(os.path.exists(cache_path))
+        self.assertEquals(None, template_cache.load(cache_path, self.cache_key))
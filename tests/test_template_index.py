@@ -0,0 +1,108 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+
+from tank_test.tank_test_base import *
+from tank.template import TemplatePath, TemplateString, LazyTemplates
+from tank.errors import TankError
+from tank.template_index import TemplateIndex
+from tank.templatekey import StringKey, IntegerKey
+
+
+class TestTemplateIndex(TankTestBase):
+    def setUp(self):
+        super(TestTemplateIndex, self).setUp()
+        self.keys = {"Sequence": StringKey("Sequence"),
+                     "Shot": StringKey("Shot"),
+                     "Step": StringKey("Step"),
+                     "name": StringKey("name"),
+                     "version": IntegerKey("version", format_spec="03")}
+        self.templates = {
+            "shot_work": TemplatePath("sequences/{Sequence}/{Shot}/{Step}/work/{name}.v{version}.ma",
+                                      self.keys, self.project_root),
+            "shot_work_optional": TemplatePath("sequences/{Sequence}/{Shot}/{Step}/work[/{name}]",
+                                               self.keys, self.project_root),
+            "shot_publish": TemplatePath("sequences/{Sequence}/{Shot}/{Step}/publish/{name}.v{version}.ma",
+                                         self.keys, self.project_root),
+            "asset_work": TemplatePath("assets/{name}/work/{name}.v{version}.ma",
+                                       self.keys, self.project_root),
+            "publish_name": TemplateString("{name}, v{version}", self.keys),
+        }
+        self.index = TemplateIndex(self.templates)
+
+    def get_candidate_names(self, path):
+        return sorted([name for name, template in self.templates.items()
+                       if template in self.index.get_candidates(path)])
+
+    def test_static_segments(self):
+        path = os.path.join(self.project_root, "sequences", "seq", "shot", "anm", "work", "foo.v001.ma")
+        self.assertEquals(["publish_name", "shot_work", "shot_work_optional"],
+                          self.get_candidate_names(path))
+
+    def test_case_insensitive(self):
+        path = os.path.join(self.project_root, "Sequences", "seq", "shot", "anm", "PUBLISH", "foo.v001.ma")
+        self.assertEquals(["publish_name", "shot_publish"], self.get_candidate_names(path))
+
+    def test_wildcard_segments(self):
+        # the file name doesn't fit the key shaped segment of any path template
+        path = os.path.join(self.project_root, "assets", "foo", "work", "foo.vABC.ma")
+        self.assertEquals(["publish_name"], self.get_candidate_names(path))
+
+    def test_optional_sections(self):
+        path = os.path.join(self.project_root, "sequences", "seq", "shot", "anm", "work")
+        self.assertEquals(["publish_name", "shot_work_optional"], self.get_candidate_names(path))
+
+    def test_candidates_for_paths(self):
+        paths = [os.path.join(self.project_root, "sequences", "seq", "shot", "anm", "publish", "foo.v001.ma"),
+                 os.path.join(self.project_root, "sequences", "seq", "shot", "anm", "publish", "bar.v002.ma"),
+                 os.path.join(self.project_root, "assets", "foo", "work", "foo.v001.ma")]
+        result = self.index.get_candidates_for_paths(paths)
+        for path in paths:
+            self.assertEquals(self.index.get_candidates(path), result[path])
+
+
+class TestLazyTemplateIndex(TankTestBase):
+    def setUp(self):
+        super(TestLazyTemplateIndex, self).setUp()
+        self.keys = {"Shot": StringKey("Shot"),
+                     "name": StringKey("name"),
+                     "version": IntegerKey("version", format_spec="03")}
+        paths_data = {"shot_work": "shots/{Shot}/work/{name}.v{version}.ma",
+                      "shot_work_optional": "shots/{Shot}/work[/{name}]",
+                      "shot_publish": "shots/{Shot}/publish/{name}.v{version}.ma"}
+        strings_data = {"publish_name": "{name}, v{version}"}
+        self.templates = LazyTemplates(self.keys, paths_data, strings_data, {"primary": self.project_root})
+        self.index = TemplateIndex(self.templates)
+
+    def get_candidate_names(self, path):
+        return sorted([template.name for template in self.index.get_candidates(path)])
+
+    def test_candidates_created(self):
+        self.assertEquals(0, self.templates.materialized_count)
+        path = os.path.join(self.project_root, "shots", "shot", "publish", "foo.v001.ma")
+        self.assertEquals(["publish_name", "shot_publish"], self.get_candidate_names(path))
+        self.assertEquals(2, self.templates.materialized_count)
+
+    def test_same_candidates(self):
+        paths = [os.path.join(self.project_root, "shots", "shot", "work", "foo.v001.ma"),
+                 os.path.join(self.project_root, "SHOTS", "shot", "work"),
+                 os.path.join(self.project_root, "shots", "shot", "work", "foo.vABC.ma"),
+                 os.path.join(self.project_root, "assets", "foo")]
+        templates = dict(self.templates.items())
+        index = TemplateIndex(templates)
+        for path in paths:
+            self.assertEquals(sorted([x.name for x in index.get_candidates(path)]),
+                              self.get_candidate_names(path))
+
+    def test_invalid_definition(self):
+        # the error is raised when the configuration is read, not by the index
+        self.assertRaises(TankError, LazyTemplates, self.keys, {"bad": "shots/{missing}"}, {},
+                          {"primary": self.project_root})
@@ -0,0 +1,94 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import glob
+
+import tank
+
+from mock import patch
+
+from tank_test.tank_test_base import *
+from tank.template import TemplatePath
+from tank.template_search import TemplateSearch
+from tank.templatekey import StringKey, IntegerKey, SequenceKey
+
+
+class TestTemplateSearch(TankTestBase):
+    def setUp(self):
+        super(TestTemplateSearch, self).setUp()
+        self.keys = {"Shot": StringKey("Shot"),
+                     "name": StringKey("name", filter_by="alphanumeric"),
+                     "version": IntegerKey("version", format_spec="03"),
+                     "frame": SequenceKey("frame", format_spec="04")}
+        self.template = TemplatePath("shots/{Shot}/v{version}/{name}[.{frame}].exr",
+                                     self.keys, self.project_root)
+
+        relative_paths = ["shots/s1/v001/main.exr",
+                          "shots/s1/v001/main.0001.exr",
+                          "shots/s1/v001/main.0002.exr",
+                          "shots/s1/v002/main.exr",
+                          "shots/s1/v002/other_name.exr",
+                          "shots/s1/v002/.hidden.exr",
+                          "shots/s1/vabc/main.exr",
+                          "shots/s2/v001/main.0001.exr",
+                          "shots/s2/notes.txt",
+                          "other/s1/v001/main.exr"]
+        for relative_path in relative_paths:
+            self.create_file(os.path.join(self.project_root, *relative_path.split("/")))
+
+    def assert_same_as_glob(self, pattern):
+        search = TemplateSearch(self.template)
+        expected = set([x for x in glob.iglob(pattern) if self.template.validate(x)])
+        actual = set([x for x in search.iglob(pattern) if self.template.validate(x)])
+        self.assertEquals(expected, actual)
+        return actual
+
+    def test_same_as_glob(self):
+        for relative_pattern in ["shots/*/v*/*.exr",
+                                 "shots/*/v*/*.*.exr",
+                                 "shots/s1/v001/main.exr",
+                                 "shots/s1/v00?/main.*.exr",
+                                 "shots/s3/v*/*.exr",
+                                 "shots/*/*",
+                                 "*/*/v*/main.exr"]:
+            self.assert_same_as_glob(os.path.join(self.project_root, relative_pattern))
+
+    def test_found_paths(self):
+        pattern = os.path.join(self.project_root, "shots", "*", "v*", "*.*.exr")
+        expected = set([os.path.join(self.project_root, "shots", "s1", "v001", "main.0001.exr"),
+                        os.path.join(self.project_root, "shots", "s1", "v001", "main.0002.exr"),
+                        os.path.join(self.project_root, "shots", "s2", "v001", "main.0001.exr")])
+        self.assertEquals(expected, self.assert_same_as_glob(pattern))
+
+    @patch("tank.template_search.os.listdir", side_effect=os.listdir)
+    def test_directories_listed_once(self, listdir):
+        search = TemplateSearch(self.template)
+        for relative_pattern in ["shots/*/v*/*.exr", "shots/*/v*/*.*.exr"]:
+            list(search.iglob(os.path.join(self.project_root, relative_pattern)))
+        listed = [args[0] for args, kwargs in listdir.call_args_list]
+        self.assertEquals(len(set(listed)), len(listed))
+
+    @patch("tank.template_search.os.listdir", side_effect=os.listdir)
+    def test_pruned_by_key_type(self, listdir):
+        search = TemplateSearch(self.template)
+        list(search.iglob(os.path.join(self.project_root, "shots", "*", "v*", "*.exr")))
+        listed = [args[0] for args, kwargs in listdir.call_args_list]
+        # the version directory is not a number
+        self.assertFalse(os.path.join(self.project_root, "shots", "s1", "vabc") in listed)
+        self.assertTrue(os.path.join(self.project_root, "shots", "s1", "v001") in listed)
+
+    def test_paths_from_template(self):
+        tk = tank.Tank(self.project_root)
+        expected = set([os.path.join(self.project_root, "shots", "s1", "v001", "main.0001.exr"),
+                        os.path.join(self.project_root, "shots", "s1", "v001", "main.0002.exr"),
+                        os.path.join(self.project_root, "shots", "s2", "v001", "main.0001.exr")])
+        actual = tk.paths_from_template(self.template, {"name": "main"}, skip_missing_optional_keys=True)
+        self.assertEquals(expected, set(actual))
@@ -14,8 +14,9 @@ Tests for templatefield module.
 
 from tank import TankError
 import copy
+import cPickle as pickle
 from tank_test.tank_test_base import *
-from tank.templatekey import TemplateKey, StringKey, IntegerKey, SequenceKey, make_keys
+from tank.templatekey import TemplateKey, StringKey, IntegerKey, SequenceKey, make_keys, intern_key
 
 class TestStringKey(TankTestBase):
     def setUp(self):
@@ -296,10 +297,32 @@ class TestIntegerKey(TankTestBase):
         result = self.int_field.str_from_value(value, ignore_type=True)
         self.assertEquals(expected, result)
 
+    def test_strs_from_values(self):
+        formatted_field = IntegerKey("field_name", format_spec="03")
+        values = [3, 4, 1001]
+        expected = [formatted_field.str_from_value(x) for x in values]
+        self.assertEquals(expected, formatted_field.strs_from_values(values))
+
+    def test_strs_from_values_bad(self):
+        field = IntegerKey("field_name", exclusions=[2])
+        self.assertEquals(["1", "3"], field.strs_from_values([1, 3]))
+        self.assertRaises(TankError, field.strs_from_values, [1, 2])
+        self.assertRaises(TankError, self.int_field.strs_from_values, [1, "a"])
+
     def test_value_from_str(self):
         str_value = "32"
         self.assertEquals(32, self.int_field.value_from_str(str_value))
 
+    def test_value_from_str_restricted(self):
+        int_field = IntegerKey("field_name", length=3)
+        self.assertEquals(32, int_field.value_from_str("032"))
+        self.assertRaises(TankError, int_field.value_from_str, "32")
+        self.assertRaises(TankError, self.int_field.value_from_str, "a")
+
+    def test_value_from_int(self):
+        self.assertEquals(32, self.int_field.value_from_str(32))
+        self.assertEquals(32, IntegerKey("field_name", choices=[32]).value_from_str(32))
+
     def test_repr(self):
         expected = "<Sgtk IntegerKey field_name>"
         self.assertEquals(expected, str(self.int_field))
@@ -353,6 +376,30 @@ class TestSequenceKey(TankTestBase):
         for str_value, expected_value in valid_str_values.items():
             self.assertEquals(expected_value, self.seq_field.value_from_str(str_value))
 
+    def test_value_from_str_restricted(self):
+        seq_field = SequenceKey("field_name", exclusions=[13])
+        self.assertEquals(12, seq_field.value_from_str("12"))
+        self.assertRaises(TankError, seq_field.value_from_str, "13")
+        seq_field = SequenceKey("field_name", choices=[1, 2])
+        self.assertEquals(2, seq_field.value_from_str("2"))
+        self.assertRaises(TankError, seq_field.value_from_str, "3")
+
+    def test_value_from_int(self):
+        self.assertEquals(3, self.seq_field.value_from_str(3))
+        self.assertRaises(TankError, SequenceKey("field_name", exclusions=[3]).value_from_str, 3)
+
+    def test_error_message(self):
+        self.assertFalse(self.seq_field.validate("a"))
+        # validating other values doesn't change the error raised
+        self.assertTrue(self.seq_field.validate("12"))
+        self.assertTrue(self.seq_field.validate("#"))
+        try:
+            self.seq_field.value_from_str("a")
+        except TankError, e:
+            self.assertTrue("Illegal value 'a'" in str(e))
+        else:
+            self.fail("TankError not raised")
+
     def test_str_from_value_good(self):
         
         # note - default case means frame spec is 01
@@ -612,6 +659,53 @@ class TestMakeKeys(TankTestBase):
         self.assertIsInstance(key, StringKey)
         self.assertEquals("alias_name", key.name)
 
+    def test_keys_shared(self):
+        data = {"Shot": {"type": "str", "choices": ["s1", "s2"]},
+                "frame": {"type": "sequence", "format_spec": "04"}}
+        keys = make_keys(data)
+        other_keys = make_keys(data)
+        self.assertTrue(keys["Shot"] is other_keys["Shot"])
+        self.assertTrue(keys["frame"] is other_keys["frame"])
+        data["Shot"]["choices"] = ["s1"]
+        self.assertFalse(keys["Shot"] is make_keys(data)["Shot"])
+
+
+class TestSlots(TankTestBase):
+    def test_no_instance_dict(self):
+        for key in [StringKey("name", filter_by="alpha"), IntegerKey("version"), SequenceKey("frame")]:
+            self.assertFalse(hasattr(key, "__dict__"))
+
+    def test_pickle(self):
+        key = SequenceKey("frame", format_spec="04", shotgun_entity_type="Shot",
+                          shotgun_field_name="sg_frame")
+        for protocol in [0, pickle.HIGHEST_PROTOCOL]:
+            result = pickle.loads(pickle.dumps(key, protocol))
+            self.assertEquals(key._get_signature(), result._get_signature())
+            self.assertEquals("%04d", result.str_from_value("FORMAT:%d"))
+
+    def test_intern_key(self):
+        key = StringKey("name", filter_by="alpha", exclusions=["a"])
+        self.assertTrue(intern_key(key) is key)
+        same_key = StringKey("name", filter_by="alpha", exclusions=["a"])
+        self.assertTrue(intern_key(same_key) is key)
+        self.assertTrue(intern_key(copy.copy(key)) is key)
+        other_key = StringKey("name", filter_by="alphanumeric", exclusions=["a"])
+        self.assertTrue(intern_key(other_key) is other_key)
+
+    def test_interned_key_read_only(self):
+        key = intern_key(StringKey("name", choices=["a", "b"]))
+        self.assertRaises(AttributeError, setattr, key, "default", "a")
+        self.assertRaises(TypeError, key.choices.append, "c")
+        self.assertEquals(["a", "b"], key.choices)
+        # copies can be modified
+        key_copy = copy.copy(key)
+        key_copy.choices.append("c")
+        key_copy.default = "c"
+        self.assertEquals("c", key_copy.str_from_value())
+        self.assertEquals(["a", "b"], key.choices)
+        self.assertEquals(None, key.default)
+
+
 class TestEyeKey(TankTestBase):
     """
     Tests that key representing eye can be setup.
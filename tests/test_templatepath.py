@@ -15,11 +15,22 @@ import os
 import tank
 from tank import TankError
 
-from tank.template import TemplatePath
+from tank.template import TemplatePath, TemplatePathParser, _product
 from tank_test.tank_test_base import *
 from tank.templatekey import (TemplateKey, StringKey, IntegerKey, 
                                 SequenceKey)
 
+def get_fields_by_variations(template, input_path, skip_keys=None):
+    # longest variation with fields wins, as when variations were parsed one by one
+    fields = None
+    for variation in template._get_variations():
+        parser = TemplatePathParser(variation.ordered_keys, variation.static_tokens)
+        fields = parser.parse_path(input_path, skip_keys)
+        if fields:
+            break
+    return fields
+
+
 class TestTemplatePath(TankTestBase):
     """
     Base class for tests of TemplatePath. Do not add tests to this class directly.
@@ -53,7 +64,7 @@ class TestInit(TestTemplatePath):
         second_token = sep + "work" + sep
         expected = [[first_token, second_token, ".", ".ma"]]
         template = TemplatePath(definition, self.keys, root_path=self.project_root)
-        self.assertEquals(expected, template._static_tokens)
+        self.assertEquals(expected, [x.static_tokens for x in template._get_variations()])
 
     def test_static_tokens(self):
         definition = "{Sequence}/{Shot}/3d/maya/scenes/{branch}-v{version}.{ext}"
@@ -62,7 +73,7 @@ class TestInit(TestTemplatePath):
         else:
             expected = [["/", "/3d/maya/scenes/", "-v", "."]]
         template = TemplatePath(definition, self.keys, root_path="")
-        self.assertEquals(expected, template._static_tokens)
+        self.assertEquals(expected, [x.static_tokens for x in template._get_variations()])
 
 class TestValidate(TestTemplatePath):
     """Test Case for validating a path"""
@@ -533,6 +544,76 @@ class Test_ApplyFields(TestTemplatePath):
         result = self.template_path._apply_fields(fields, ignore_types=["version"])
         self.assertEquals(result, expected)
 
+
+class TestApplyFieldsMany(TestTemplatePath):
+    def setUp(self):
+        super(TestApplyFieldsMany, self).setUp()
+        self.template = TemplatePath("shots/{Shot}/v{version}/{name}[.{frame}].exr",
+                                     self.keys, self.project_root)
+        self.fields = {"Shot": "s1", "name": "main", "version": 3}
+
+    def assert_same_as_apply_fields(self, template, base_fields, varying):
+        expected = []
+        for values in _product(*[x[1] for x in varying]):
+            fields = dict(base_fields)
+            fields.update(zip([x[0] for x in varying], values))
+            expected.append(template.apply_fields(fields))
+        self.assertEquals(expected, template.apply_fields_many(base_fields, varying))
+
+    def test_frame_range(self):
+        expected = [os.path.join(self.project_root, "shots", "s1", "v003", "main.%04d.exr" % x)
+                    for x in range(1001, 1011)]
+        result = self.template.apply_fields_many(self.fields, {"frame": xrange(1001, 1011)})
+        self.assertEquals(expected, result)
+
+    def test_same_as_apply_fields(self):
+        self.assert_same_as_apply_fields(self.template, self.fields,
+                                         [("frame", [1, 2, "%04d", "FORMAT:#", None])])
+        self.assert_same_as_apply_fields(self.template, self.fields,
+                                         [("version", [1, 2]), ("frame", [1, 10])])
+        self.assert_same_as_apply_fields(self.template, self.fields,
+                                         [("frame", [1, 10]), ("version", [1, 2])])
+        # keys used several times
+        self.assert_same_as_apply_fields(self.template_path,
+                                         {"Sequence": "seq_1", "Step": "Anm", "branch": "mmm",
+                                          "version": 3},
+                                         [("Shot", ["s1", "s2"]), ("snapshot", [1, 2, 3])])
+
+    def test_matrix_order(self):
+        result = self.template.apply_fields_many(self.fields, {"version": [1, 2], "frame": [1, 2]})
+        expected = [os.path.join(self.project_root, "shots", "s1", "v%03d" % version,
+                                 "main.%04d.exr" % frame)
+                    for frame in [1, 2] for version in [1, 2]]
+        self.assertEquals(expected, result)
+
+    def test_missing_optional_value(self):
+        # without a frame the other variation is used
+        key = IntegerKey("frame")
+        template = TemplatePath("{name}[.{frame}].exr", {"name": self.keys["name"], "frame": key},
+                                self.project_root)
+        self.assert_same_as_apply_fields(template, {"name": "main"}, [("frame", [1, None, 2])])
+
+    def test_invalid_value(self):
+        self.assertRaises(TankError, self.template.apply_fields_many, self.fields,
+                          {"frame": [1, "abc"]})
+        self.assertRaises(TankError, self.template.apply_fields_many, self.fields,
+                          {"Shot": ["s1", "s3"]})
+
+    def test_missing_fields(self):
+        self.assertRaises(TankError, self.template.apply_fields_many, {"Shot": "s1"},
+                          {"frame": [1, 2]})
+
+    def test_no_values(self):
+        self.assertEquals([], self.template.apply_fields_many(self.fields, {"frame": []}))
+
+    def test_percent_in_value(self):
+        fields = {"Shot": "s1", "name": "100%", "version": 3}
+        self.assert_same_as_apply_fields(self.template, fields, [("frame", [1, 2])])
+
+    def test_key_not_in_template(self):
+        self.assert_same_as_apply_fields(self.template, self.fields, [("Step", ["Anm", "Lgt"])])
+
+
 class TestGetFields(TestTemplatePath):
     def test_anim_path(self):
         relative_path = os.path.join("shots",
@@ -964,6 +1045,279 @@ class TestGetKeysSepInValue(TestTemplatePath):
  #       self.assert_path_matches(definition, input_path, expected)
 
 
+class TestTemplatePathMatcher(TestTemplatePath):
+    """Tests for the compiled matching engine used by get_fields."""
+    def assert_matches_parser(self, template, input_path, skip_keys=None):
+        expected = get_fields_by_variations(template, input_path, skip_keys)
+        if expected is None:
+            self.assertRaises(TankError, template.get_fields, input_path, skip_keys)
+        else:
+            self.assertEquals(expected, template.get_fields(input_path, skip_keys))
+
+    def test_compiled_at_construction(self):
+        self.assertTrue(self.template_path._matcher._get_regex(frozenset()) is not None)
+
+    def test_same_as_parser(self):
+        definition = "shots/{Sequence}/{Shot}/{Step}/work/{Shot}[.{branch}][.v{version}][.{snapshot}.ma]"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        relative_paths = [os.path.join("shots", "seq_1", "s1", "Anm", "work", "s1.mmm.v003.002.ma"),
+                          os.path.join("Shots", "Seq_1", "s1", "anim", "WORK", "S1.mmm.v003.002.MA"),
+                          os.path.join("shots", "seq_1", "s1", "Anm", "work", "s2.mmm.v003.002.ma"),
+                          os.path.join("shots", "seq_1", "s1", "Anm", "work", "s1.v003"),
+                          os.path.join("shots", "seq_1", "s5", "Anm", "work", "s5"),
+                          os.path.join("shots", "seq_1", "s1", "Anm", "work", "s1.m-m.v003"),
+                          os.path.join("shots", "seq_1", "s1", "Anm", "work"),
+                          os.path.join("other", "seq_1", "s1", "Anm", "work", "s1")]
+        for relative_path in relative_paths:
+            input_path = os.path.join(self.project_root, relative_path)
+            self.assert_matches_parser(template, input_path)
+            self.assert_matches_parser(template, input_path, skip_keys=["version"])
+
+    def test_frame_specs(self):
+        template = TemplatePath("path/to/seq.{frame}.ext", self.keys, self.project_root)
+        for frames_value in ["0003", "%04d", "####", "@@@@", "$F4", "%03d", "$F", "##"]:
+            input_path = os.path.join(self.project_root, "path", "to", "seq.%s.ext" % frames_value)
+            self.assert_matches_parser(template, input_path)
+
+    def test_no_prefix_not_compiled(self):
+        matcher = self.sequence._matcher
+        self.assertTrue(matcher._get_regex(frozenset()) is None)
+        self.assert_matches_parser(self.sequence, "some/path/to/seq.0003.ext")
+
+    def test_first_token_occurrence(self):
+        # the parser ends the name at the first ".v", so the version is not valid
+        definition = "{name}.v{version}.ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        input_path = os.path.join(self.project_root, "cat.v.dog.v003.ma")
+        self.assert_matches_parser(template, input_path)
+        self.assertRaises(TankError, template.get_fields, input_path)
+
+    def test_repeated_key_case(self):
+        definition = "build/{Sequence}/maya/{Sequence}_{name}.ext"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        input_path = os.path.join(self.project_root, "build", "cat", "maya", "cat_doogle.ext")
+        self.assertTrue(template.validate(input_path))
+        input_path = os.path.join(self.project_root, "build", "cat", "maya", "Cat_doogle.ext")
+        self.assertFalse(template.validate(input_path))
+
+
+class TestMatcherParity(TankTestBase):
+    """Compares the compiled matching engine with the parser on the fixture templates."""
+    def setUp(self):
+        super(TestMatcherParity, self).setUp()
+        self.setup_fixtures()
+        self.tk = tank.Tank(self.project_root)
+        self.templates = [x for x in self.tk.templates.values() if isinstance(x, TemplatePath)]
+
+    def get_paths(self):
+        values = [{"Sequence": "seq_1", "Shot": "shot_1", "Step": "anim", "name": "main",
+                   "version": 3, "timestamp": "2013", "width": 1920, "height": 1080,
+                   "channel": "beauty", "frame": 12, "eye": "Left", "sg_asset_type": "chr",
+                   "Asset": "hero"},
+                  # values containing the static tokens of the definitions
+                  {"Sequence": "work", "Shot": "s_v1", "Step": "publish", "name": "cat.v.dog",
+                   "version": 12, "timestamp": "v003.ma", "width": 1, "height": 2,
+                   "channel": "v003", "frame": 1, "eye": "Right", "sg_asset_type": "x.v",
+                   "Asset": "a_b"}]
+        paths = set()
+        for template in self.templates:
+            for fields in values:
+                try:
+                    paths.add(template.apply_fields(fields))
+                except TankError:
+                    pass
+        return sorted(paths)
+
+    def test_same_fields(self):
+        paths = self.get_paths()
+        self.assertTrue(len(paths) > len(self.templates))
+        for template in self.templates:
+            for input_path in paths:
+                for skip_keys in [None, ["version"]]:
+                    expected = get_fields_by_variations(template, input_path, skip_keys)
+                    if expected is None:
+                        self.assertRaises(TankError, template.get_fields, input_path, skip_keys)
+                    else:
+                        self.assertEquals(expected, template.get_fields(input_path, skip_keys))
+
+
+class TestOptionalSections(TestTemplatePath):
+    """Tests for the single matcher and formatter handling optional sections."""
+    def assert_same_as_variations(self, template, input_path, skip_keys=None):
+        expected = get_fields_by_variations(template, input_path, skip_keys)
+        if expected is None:
+            self.assertRaises(TankError, template.get_fields, input_path, skip_keys)
+        else:
+            self.assertEquals(expected, template.get_fields(input_path, skip_keys))
+
+    def test_single_matcher(self):
+        definition = "shots/{Shot}[.{branch}][.v{version}][.{snapshot}].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        self.assertEquals(3, template._matcher.section_count)
+        input_path = os.path.join(self.project_root, "shots", "s1.mmm.v003.ma")
+        self.assertEquals({"Shot": "s1", "branch": "mmm", "version": 3}, template.get_fields(input_path))
+        # the values found by the single match are used, variations are not built
+        self.assertEquals({}, template._variations)
+        # the version could be a branch, both variations are parsed
+        input_path = os.path.join(self.project_root, "shots", "s1.v003.ma")
+        self.assertEquals({"Shot": "s1", "version": 3}, template.get_fields(input_path))
+        self.assertEquals(2, len(template._variations))
+
+    def test_same_as_variations(self):
+        definition = "shots/{Shot}[.{branch}][.v{version}][.{snapshot}].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        relative_paths = [os.path.join("shots", "s1.ma"),
+                          os.path.join("shots", "s1.mmm.ma"),
+                          os.path.join("shots", "s1.v003.ma"),
+                          os.path.join("shots", "s1.003.ma"),
+                          os.path.join("shots", "s1.mmm.v003.ma"),
+                          os.path.join("shots", "s1.v003.002.ma"),
+                          os.path.join("shots", "s1.mmm.v003.002.ma"),
+                          os.path.join("shots", "s1.mmm.v003.002.v004.ma"),
+                          os.path.join("shots", "s1.v.v.ma"),
+                          os.path.join("shots", "s1.v.mmm.v003.ma"),
+                          os.path.join("shots", "s1.mmm.ext"),
+                          os.path.join("other", "s1.ma")]
+        for relative_path in relative_paths:
+            input_path = os.path.join(self.project_root, relative_path)
+            self.assert_same_as_variations(template, input_path)
+            self.assert_same_as_variations(template, input_path, skip_keys=["version"])
+
+    def test_longest_variation_wins(self):
+        # "s1.v003" fits both the branch and the version sections
+        definition = "shots/{Shot}[.{branch}][.v{version}].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        input_path = os.path.join(self.project_root, "shots", "s1.v.v003.ma")
+        self.assert_same_as_variations(template, input_path)
+        self.assertEquals({"Shot": "s1", "branch": "v", "version": 3}, template.get_fields(input_path))
+
+    def test_precedence_order(self):
+        # the name section is the longer one, so its variation is tried before
+        # the branch one although the branch section comes first
+        definition = "shots/{Shot}[.{branch}][.{name}_long].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        input_path = os.path.join(self.project_root, "shots", "s1.a_long.ma")
+        self.assert_same_as_variations(template, input_path)
+        self.assertEquals({"Shot": "s1", "name": "a"}, template.get_fields(input_path))
+
+    def test_repeated_key_in_section(self):
+        definition = "shots/[{Shot}/]{Shot}[.{branch}].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        for relative_path in [os.path.join("shots", "s1", "s1.ma"),
+                              os.path.join("shots", "s1", "s2.ma"),
+                              os.path.join("shots", "s1.mmm.ma"),
+                              os.path.join("shots", "s1", "s1.mmm.ma")]:
+            input_path = os.path.join(self.project_root, relative_path)
+            self.assert_same_as_variations(template, input_path)
+
+    def test_many_sections(self):
+        definition = "shots/{Shot}[.{branch}][.v{version}][.{snapshot}][-{name}][_{Sequence}][+{Step}].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        # the regex has a group per key and doesn't grow with the variations
+        self.assertTrue(template._matcher.is_compiled(None))
+        self.assertEquals(7, template._matcher._get_regex(frozenset()).groups)
+        all_fields = {"branch": "mmm", "version": 3, "snapshot": 2, "name": "a.v004",
+                      "Sequence": "seq_1", "Step": "anim"}
+        names = sorted(all_fields)
+        for flags in _product(*[(True, False)] * len(names)):
+            fields = dict([(x, all_fields[x]) for x, flag in zip(names, flags) if flag])
+            fields["Shot"] = "s1"
+            input_path = template.apply_fields(fields)
+            self.assertEquals(fields, template.get_fields(input_path))
+            self.assert_same_as_variations(template, input_path, skip_keys=["version"])
+
+    def test_irregular_definition(self):
+        # leaving the section out leaves an empty segment, the variations are parsed one by one
+        definition = "shots/[{Shot}]/{branch}.ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        self.assertEquals(None, template._matcher)
+        self.assertEquals(None, template._get_segments())
+        for relative_path in [os.path.join("shots", "s1", "mmm.ma"),
+                              os.path.join("shots", "mmm.ma")]:
+            input_path = os.path.join(self.project_root, relative_path)
+            self.assert_same_as_variations(template, input_path)
+
+    def test_keys_removed_by_normalizing(self):
+        # the variations are parsed with the keys which ".." removes from their definitions
+        definition = "shots/{Step}/../{Shot}[.v{version}].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        self.assertEquals(None, template._matcher)
+        for relative_path in [os.path.join("shots", "s1.v003.ma"),
+                              os.path.join("shots", "s1.ma")]:
+            input_path = os.path.join(self.project_root, relative_path)
+            self.assert_same_as_variations(template, input_path)
+
+    def test_apply_fields_same_as_variations(self):
+        definition = "shots/{Shot}[.{branch}][.v{version}][.{snapshot}].ma"
+        template = TemplatePath(definition, self.keys, self.project_root)
+        all_fields = {"Shot": "s1", "branch": "mmm", "version": 3, "snapshot": 2}
+        names = sorted(all_fields)
+        # every subset of the fields
+        for flags in _product(*[(True, False)] * len(names)):
+            fields = dict([(x, all_fields[x]) for x, flag in zip(names, flags) if flag])
+            expected = None
+            for variation in template._get_variations():
+                keys = variation.keys
+                if not template._missing_keys(fields, keys, skip_defaults=True):
+                    expected = os.path.join(self.project_root,
+                                            variation.cleaned_definition % dict(
+                                                [(x, keys[x].str_from_value(fields.get(x)))
+                                                 for x in keys]))
+                    break
+            if expected is None:
+                self.assertRaises(TankError, template.apply_fields, fields)
+            else:
+                self.assertEquals(expected, template.apply_fields(fields))
+
+
+class TestFieldsCache(TestTemplatePath):
+    def setUp(self):
+        super(TestFieldsCache, self).setUp()
+        self.template_path.set_fields_cache_size(10)
+        relative_path = os.path.join("shots", "seq_1", "s1", "Anm", "work", "s1.mmm.v003.002.ma")
+        self.path = os.path.join(self.project_root, relative_path)
+        self.fields = {"Sequence": "seq_1",
+                       "Shot": "s1",
+                       "Step": "Anm",
+                       "branch": "mmm",
+                       "version": 3,
+                       "snapshot": 2}
+
+    def test_cached(self):
+        self.assertEquals(self.fields, self.template_path.get_fields(self.path))
+        self.assertEquals(self.fields, self.template_path.get_fields(self.path))
+        self.assertEquals({"hits": 1, "misses": 1, "size": 1},
+                          self.template_path.get_fields_cache_stats())
+
+    def test_copies(self):
+        self.template_path.get_fields(self.path)["Shot"] = "s2"
+        self.assertEquals(self.fields, self.template_path.get_fields(self.path))
+
+    def test_skip_keys(self):
+        self.template_path.get_fields(self.path)
+        fields = self.template_path.get_fields(self.path, skip_keys=["Shot"])
+        del self.fields["Shot"]
+        self.assertEquals(self.fields, fields)
+        self.assertEquals(2, self.template_path.get_fields_cache_stats()["misses"])
+
+    def test_errors_cached(self):
+        path = os.path.join(self.project_root, "other.ma")
+        self.assertFalse(self.template_path.validate(path))
+        self.assertRaises(TankError, self.template_path.get_fields, path)
+        self.assertEquals({"hits": 1, "misses": 1, "size": 1},
+                          self.template_path.get_fields_cache_stats())
+
+    def test_clear(self):
+        self.template_path.get_fields(self.path)
+        self.template_path.clear_fields_cache()
+        self.assertEquals(0, self.template_path.get_fields_cache_stats()["size"])
+
+    def test_disabled(self):
+        self.template_path.set_fields_cache_size(0)
+        self.assertEquals(None, self.template_path.get_fields_cache_stats())
+        self.assertEquals(self.fields, self.template_path.get_fields(self.path))
+
+
 class TestParent(TestTemplatePath):
     def test_parent_exists(self):
         expected_definition = os.path.join("shots",
@@ -35,13 +35,13 @@ class TestInit(TestTemplateString):
         definition = "something-{Shot}.{Sequence}"
         template = TemplateString(definition, self.keys)
         expected = [["%s%ssomething-" % (template._prefix, os.path.sep), "."]]
-        self.assertEquals(expected, template._static_tokens)
+        self.assertEquals(expected, [x.static_tokens for x in template._get_variations()])
 
     def test_static_key_first(self):
         definition = "{Shot}something-{Sequence}."
         template = TemplateString(definition, self.keys)
         expected = [["%s%s" % (template._prefix, os.path.sep), "something-", "."]]
-        self.assertEquals(expected, template._static_tokens)
+        self.assertEquals(expected, [x.static_tokens for x in template._get_variations()])
 
     def test_definition_preseves_leading_slash(self):
         """
@@ -192,6 +192,18 @@ class TestGetFields(TestTemplateString):
 
         result = template_string.get_fields(input_string)
         self.assertEquals(expected, result)
+
+    def test_optional_section_leading_separator(self):
+        """
+        Test the prefix is left out of a variation starting with a separator.
+        """
+        template_string = TemplateString("[/v{version}]/{Shot}", self.keys)
+        self.assertEquals(None, template_string._matcher)
+
+        expected = {"Shot": "shot_1",
+                    "version": 3}
+        result = template_string.get_fields("/v3/shot_1")
+        self.assertEquals(expected, result)
     
     #TODO this won't pass with current algorithm
 #    def test_definition_short_end_key(self):
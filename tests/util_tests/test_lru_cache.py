@@ -0,0 +1,54 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import cPickle as pickle
+
+from tank_test.tank_test_base import *
+from tank.util.lru_cache import LRUCache
+
+
+class TestLRUCache(TankTestBase):
+    def test_get_and_set(self):
+        cache = LRUCache(2)
+        self.assertEquals(None, cache.get("a"))
+        self.assertEquals("default", cache.get("a", "default"))
+        cache.set("a", 1)
+        self.assertEquals(1, cache.get("a"))
+        self.assertEquals(1, cache.hits)
+        self.assertEquals(2, cache.misses)
+
+    def test_least_recently_used_discarded(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        # a is now more recent than b
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEquals(2, len(cache))
+        self.assertTrue("a" in cache)
+        self.assertFalse("b" in cache)
+        self.assertTrue("c" in cache)
+
+    def test_clear(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache.get("a")
+        cache.clear()
+        self.assertEquals(0, len(cache))
+        self.assertEquals(1, cache.hits)
+
+    def test_pickle(self):
+        cache = LRUCache(2)
+        cache.set("a", 1)
+        cache = pickle.loads(pickle.dumps(cache))
+        self.assertEquals(2, cache.max_size)
+        self.assertEquals(0, len(cache))
+        cache.set("a", 1)
+        self.assertEquals(1, cache.get("a"))
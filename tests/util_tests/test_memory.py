@@ -0,0 +1,45 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+# 
+# CONFIDENTIAL AND PROPRIETARY
+# 
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit 
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your 
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+from tank_test.tank_test_base import *
+from tank.util import memory
+
+
+class Slotted(object):
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class TestGetSize(TankTestBase):
+    def test_containers(self):
+        value = "some value"
+        obj = [{"key": value}]
+        expected = memory.get_object_size(obj) + memory.get_object_size(obj[0]) + memory.get_object_size("key") + memory.get_object_size(value)
+        self.assertEquals(expected, memory.get_size(obj))
+
+    def test_slots(self):
+        value = "some value"
+        expected = memory.get_object_size(Slotted(value)) + memory.get_object_size(value)
+        self.assertEquals(expected, memory.get_size(Slotted(value)))
+
+    def test_shared_counted_once(self):
+        value = ["some", "values"]
+        seen = set()
+        obj = [value, value]
+        size = memory.get_size(obj, seen)
+        self.assertEquals(size - memory.get_object_size(obj), memory.get_size(value))
+        self.assertEquals(0, memory.get_size(value, seen))
+
+    def test_estimate(self):
+        # used when sys.getsizeof is not available
+        self.assertEquals(Slotted.__basicsize__, memory._estimate_object_size(Slotted("value")))
+        self.assertEquals(str.__basicsize__ + 5 * str.__itemsize__, memory._estimate_object_size("abcde"))